@@ -0,0 +1,358 @@
+"""
+Traffic replay / load generation for the gateway.
+
+Replays a JSONL trace (or a synthetic one) against the ASGI app in-process,
+or against a running gateway with --url, and reports throughput, latency
+percentiles, error rate and gateway overhead net of provider time.
+
+Trace lines may be any of:
+    {"model": "...", "messages": [...], ...}                 chat request body
+    {"offset_ms": 120, "body": {...}, "headers": {...}}      timed request
+    {"request_id": "...", "title": "...", "body": "text"}    prompt corpus (requests.jsonl)
+
+Examples:
+    python benchmarks/loadtest.py --synthetic 500 --rate 50 --mode open
+    python benchmarks/loadtest.py --trace requests.jsonl --mode closed --concurrency 16
+    python benchmarks/loadtest.py --synthetic 500 --rate 50 --baseline baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+DEFAULT_MODEL = "gpt-4o"
+DEFAULT_KEY = "loadtest-key"
+
+# Metric -> direction. "lower" means a higher value is a regression.
+REPORT_METRICS = {
+    "throughput_rps": "higher",
+    "latency_p50_ms": "lower",
+    "latency_p95_ms": "lower",
+    "latency_p99_ms": "lower",
+    "overhead_p50_ms": "lower",
+    "overhead_p95_ms": "lower",
+    "error_rate": "lower",
+}
+
+
+@dataclass
+class TraceItem:
+    body: Dict[str, Any]
+    offset_s: Optional[float] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Sample:
+    # From the intended start, so harness queueing shows up in latency
+    latency_ms: float
+    status_code: int
+    provider_ms: Optional[float] = None
+    # From the moment the request was actually sent
+    service_ms: Optional[float] = None
+
+
+def _item_from_line(data: Dict[str, Any], model: str) -> TraceItem:
+    offset = data.get("offset_ms")
+    offset_s = offset / 1000.0 if offset is not None else None
+
+    if "messages" in data:
+        return TraceItem(body=data, offset_s=offset_s)
+
+    body = data.get("body")
+    if isinstance(body, dict):
+        return TraceItem(body=body, offset_s=offset_s, headers=data.get("headers") or {})
+
+    # Free-text corpus line: use it as a realistic prompt
+    content = "\n\n".join(str(data[k]) for k in ("title", "body") if data.get(k))
+    return TraceItem(
+        body={"model": model, "messages": [{"role": "user", "content": content}]},
+        offset_s=offset_s,
+    )
+
+
+def load_trace(path: str, model: str = DEFAULT_MODEL) -> List[TraceItem]:
+    items = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                items.append(_item_from_line(json.loads(line), model))
+    return items
+
+
+def synthetic_trace(
+    count: int,
+    rate: float,
+    model: str = DEFAULT_MODEL,
+    prompt_words: int = 200,
+    seed: int = 0,
+) -> List[TraceItem]:
+    """Poisson arrivals at `rate` req/s with prompts of roughly `prompt_words` words."""
+    rng = random.Random(seed)
+    vocab = ["alpha", "circuit", "gateway", "token", "stream", "latency", "quota", "model"]
+
+    items = []
+    t = 0.0
+    for i in range(count):
+        t += rng.expovariate(rate)
+        words = " ".join(rng.choice(vocab) for _ in range(prompt_words))
+        items.append(
+            TraceItem(
+                body={
+                    "model": model,
+                    "messages": [
+                        {"role": "system", "content": "You are a helpful assistant."},
+                        {"role": "user", "content": f"[{i}] {words}"},
+                    ],
+                },
+                offset_s=t,
+            )
+        )
+    return items
+
+
+async def _send(client: httpx.AsyncClient, item: TraceItem, started: float) -> Sample:
+    sent = time.perf_counter()
+    try:
+        response = await client.post("/v1/chat/completions", json=item.body, headers=item.headers)
+        status = response.status_code
+        provider_ms = None
+        if status == 200 and not item.body.get("stream"):
+            # Passthrough responses carry it in a header instead of the body
+            provider_ms = response.json().get("latency_ms")
+            if provider_ms is None and "x-circuit-upstream-latency-ms" in response.headers:
+                provider_ms = float(response.headers["x-circuit-upstream-latency-ms"])
+    except httpx.HTTPError:
+        status = 0
+        provider_ms = None
+
+    done = time.perf_counter()
+    return Sample((done - started) * 1000, status, provider_ms, (done - sent) * 1000)
+
+
+async def run_open_loop(
+    client: httpx.AsyncClient,
+    items: List[TraceItem],
+    rate: Optional[float] = None,
+) -> List[Sample]:
+    """Constant (or trace-timed) arrivals, independent of response times."""
+    origin = time.perf_counter()
+    tasks = []
+
+    for i, item in enumerate(items):
+        offset = i / rate if rate else (item.offset_s or 0.0)
+        delay = origin + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(_send(client, item, origin + offset)))
+
+    return list(await asyncio.gather(*tasks))
+
+
+async def run_closed_loop(
+    client: httpx.AsyncClient,
+    items: List[TraceItem],
+    concurrency: int,
+) -> List[Sample]:
+    """Fixed number of workers, each sending its next request as soon as one completes."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    samples: List[Sample] = []
+
+    async def worker():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            samples.append(await _send(client, item, time.perf_counter()))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Nearest-rank
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples: List[Sample], wall_s: float) -> Dict[str, Any]:
+    latencies = [s.latency_ms for s in samples]
+    # Net of queueing in the harness too: only what the gateway added
+    overheads = [s.service_ms - s.provider_ms for s in samples if s.provider_ms is not None]
+    errors = sum(1 for s in samples if s.status_code != 200)
+
+    status_counts: Dict[str, int] = {}
+    for s in samples:
+        status_counts[str(s.status_code)] = status_counts.get(str(s.status_code), 0) + 1
+
+    return {
+        "requests": len(samples),
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(samples) / wall_s, 2) if wall_s else 0.0,
+        "latency_p50_ms": round(_percentile(latencies, 50), 2),
+        "latency_p95_ms": round(_percentile(latencies, 95), 2),
+        "latency_p99_ms": round(_percentile(latencies, 99), 2),
+        "overhead_p50_ms": round(_percentile(overheads, 50), 2),
+        "overhead_p95_ms": round(_percentile(overheads, 95), 2),
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "status_counts": status_counts,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+
+    for metric, better in REPORT_METRICS.items():
+        if metric not in baseline:
+            continue
+
+        current, base = float(report[metric]), float(baseline[metric])
+
+        if metric == "error_rate":
+            # Absolute slack so a 0.0 baseline does not fail on a single error
+            worse = current > base + max(0.01, base * tolerance)
+        elif better == "higher":
+            worse = current < base * (1 - tolerance)
+        else:
+            worse = current > base * (1 + tolerance)
+
+        if worse:
+            regressions.append(f"{metric}: {current} vs baseline {base}")
+
+    return regressions
+
+
+def _client(url: Optional[str], api_key: str, timeout: float) -> httpx.AsyncClient:
+    headers = {"Authorization": f"Bearer {api_key}"}
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+
+    if url:
+        return httpx.AsyncClient(base_url=url, headers=headers, timeout=timeout, limits=limits)
+
+    os.environ.setdefault("PROVIDER", "MOCK")
+    os.environ.setdefault("CIRCUIT_API_KEYS", api_key)
+    # A fast mock and limits that never trip, so the run measures the
+    # gateway rather than the mock's 2s default or the rate policy
+    os.environ.setdefault("CIRCUIT_MOCK_PROFILE", '{"latency_ms": 50}')
+    os.environ.setdefault("CIRCUIT_REQUESTS_PER_MIN", "1000000")
+    os.environ.setdefault("CIRCUIT_RATE_LIMIT_BURST", "100000")
+    os.environ.setdefault("CIRCUIT_DAILY_USD_LIMIT", "1000000")
+
+    from circuit.main import app
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app),
+        base_url="http://gateway",
+        headers=headers,
+        timeout=timeout,
+    )
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    if args.trace:
+        items = load_trace(args.trace, args.model)
+    else:
+        items = synthetic_trace(args.synthetic, args.rate or 10.0, args.model, seed=args.seed)
+
+    if args.limit:
+        items = items[: args.limit]
+
+    async with _client(args.url, args.api_key, args.timeout) as client:
+        scratch = None
+        if not args.url:
+            # ASGITransport does not run startup/shutdown hooks
+            from circuit.main import shutdown, startup
+            from circuit.storage import sqlite as storage
+
+            # The run's request log goes to a scratch directory, not ./data
+            scratch = tempfile.mkdtemp(prefix="circuit-loadtest-")
+            storage.DB_PATH = Path(scratch) / "circuit.db"
+
+            await startup()
+
+        try:
+            started = time.perf_counter()
+            if args.mode == "open":
+                samples = await run_open_loop(client, items, args.rate if args.trace else None)
+            else:
+                samples = await run_closed_loop(client, items, args.concurrency)
+            wall_s = time.perf_counter() - started
+        finally:
+            if scratch is not None:
+                await shutdown()
+                shutil.rmtree(scratch, ignore_errors=True)
+
+    report = summarize(samples, wall_s)
+    report["mode"] = args.mode
+    report["target"] = args.url or "in-process"
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay traffic against the gateway")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--trace", help="JSONL trace to replay")
+    source.add_argument("--synthetic", type=int, help="number of synthetic requests")
+
+    parser.add_argument("--mode", choices=["open", "closed"], default="open")
+    parser.add_argument("--rate", type=float, help="arrival rate (req/s) for open loop")
+    parser.add_argument("--concurrency", type=int, default=8, help="workers for closed loop")
+    parser.add_argument("--limit", type=int, help="replay at most N requests")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="gateway base URL (default: in-process ASGI app)")
+    parser.add_argument("--api-key", default=os.getenv("CIRCUIT_LOADTEST_KEY", DEFAULT_KEY))
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="write the report JSON here")
+    parser.add_argument("--baseline", help="baseline report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    logging.getLogger("circuit.request").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("REGRESSIONS:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Micro-benchmarks for gateway hot-path components.
+
+For each component this reports:
+    ns_per_op          best-of-repeats wall time per call
+    net_bytes_per_op   memory still allocated after the run, per call (tracemalloc)
+    peak_bytes         peak traced memory during the run
+
+Examples:
+    python benchmarks/microbench.py --output micro.json
+    python benchmarks/microbench.py --baseline micro.json --only metrics
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+os.environ.setdefault("CIRCUIT_API_KEYS", "bench-key")
+
+# name -> setup() returning op(i)
+BENCHMARKS: Dict[str, Callable[[], Callable[[int], Any]]] = {}
+
+
+def bench(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def _messages(count: int = 8, chars: int = 1000) -> List[Dict[str, str]]:
+    text = ("The quick brown fox jumps over the lazy dog. " * (chars // 45 + 1))[:chars]
+    roles = ["user", "assistant"]
+    return [{"role": "system", "content": text}] + [
+        {"role": roles[i % 2], "content": text} for i in range(count - 1)
+    ]
+
+
+@bench("metrics.inc")
+def _metrics_inc():
+    from circuit.observability.metrics import Metrics
+
+    m = Metrics()
+    clients = [f"client-{i:04d}" for i in range(1000)]
+    return lambda i: m.inc("total_requests", client=clients[i % 1000])
+
+
+@bench("metrics.inc_bounded")
+def _metrics_inc_bounded():
+    from circuit.observability.metrics import Metrics
+
+    # 50k clients against a top-1000 table: most land in the sketch
+    m = Metrics(max_clients=1000)
+    clients = [f"client-{i:05d}" for i in range(50_000)]
+    return lambda i: m.inc("total_requests", client=clients[(i * 7919) % 50_000])
+
+
+@bench("metrics.observe_latency")
+def _metrics_latency():
+    from circuit.observability.metrics import Metrics
+
+    m = Metrics()
+    clients = [f"client-{i:04d}" for i in range(1000)]
+    return lambda i: m.observe_latency((i % 200) * 0.75, client=clients[i % 1000])
+
+
+@bench("rate_limiter.allow")
+def _rate_limiter():
+    from circuit.reliability.rate_limiter import RateLimiter
+
+    limiter = RateLimiter(capacity=20, refill_rate_per_sec=5)
+    clients = [f"client-{i:05d}" for i in range(10_000)]
+    return lambda i: limiter.allow(clients[i % 10_000])
+
+
+@bench("circuit_breaker.allow_request")
+def _breaker():
+    from circuit.reliability.circuit_breaker import CircuitBreaker
+
+    breaker = CircuitBreaker()
+    return lambda i: breaker.allow_request()
+
+
+@bench("tokenizer.count_tokens_from_messages")
+def _tokenizer_messages():
+    from circuit.tokenizer import count_tokens_from_messages
+
+    messages = _messages()
+    count_tokens_from_messages("gpt-4o", messages)
+    return lambda i: count_tokens_from_messages("gpt-4o", messages)
+
+
+@bench("tokenizer.count_tokens_from_text")
+def _tokenizer_text():
+    from circuit.tokenizer import count_tokens_from_text
+
+    text = _messages(1, 4000)[0]["content"]
+    count_tokens_from_text("gpt-4o", text)
+    return lambda i: count_tokens_from_text("gpt-4o", text)
+
+
+@bench("cost.estimate_cost_usd")
+def _cost():
+    from circuit.cost import estimate_cost_usd
+
+    return lambda i: estimate_cost_usd("gpt-4o", 1200 + i % 50, 300)
+
+
+@bench("storage.record_request")
+def _record_request():
+    from circuit.storage import sqlite as storage
+
+    storage.DB_PATH = Path(tempfile.mkdtemp(prefix="circuit-bench-")) / "circuit.db"
+    storage.init_db()
+
+    def op(i):
+        storage.record_request(
+            request_id=f"bench-{time.perf_counter_ns()}-{i}",
+            timestamp="2026-01-31T12:34:56.000000+00:00",
+            provider="MockOpenAIProvider",
+            model="gpt-4o",
+            status_code=200,
+            latency_ms=42,
+            tokens_input=1200,
+            tokens_output=300,
+            cost_usd=0.0105,
+            client_key_hash="3f2a9c1b7d4e",
+        )
+
+    return op
+
+
+@bench("stream_session.record_chunk")
+def _stream_chunk():
+    from circuit.reliability.circuit_breaker import CircuitBreaker
+    from circuit.stream_settlement import StreamSession
+
+    session = StreamSession("bench", "3f2a9c1b7d4e", "mock", "gpt-4o", CircuitBreaker())
+    session.record_prompt(_messages())
+    pieces = ["Hello", " world", ",", " this", " is", " a", " token", "."]
+
+    def op(i):
+        # Fresh session per 2k chunks, roughly one long completion
+        if i % 2000 == 0:
+            session.output_chunks.clear()
+            session.output_chars = 0
+        session.record_chunk(pieces[i % 8])
+
+    return op
+
+
+def _calibrate(op: Callable[[int], Any], min_seconds: float) -> int:
+    n = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(n):
+            op(i)
+        if time.perf_counter() - start >= min_seconds or n >= 10_000_000:
+            return n
+        n *= 4
+
+
+def run_one(setup: Callable[[], Callable[[int], Any]], repeats: int, min_seconds: float) -> Dict:
+    op = setup()
+    n = _calibrate(op, min_seconds / 4)
+
+    best = float("inf")
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter_ns()
+        for i in range(n):
+            op(i)
+        best = min(best, (time.perf_counter_ns() - start) / n)
+
+    # Separate pass: tracing slows everything down, so it is not timed
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for i in range(n):
+        op(i)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "ns_per_op": round(best, 1),
+        "ops": n,
+        "net_bytes_per_op": round((after - before) / n, 2),
+        "peak_bytes": peak - before,
+    }
+
+
+def diff(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    regressions = []
+
+    print(f"\n{'benchmark':40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, current in results.items():
+        if "ns_per_op" not in current or "ns_per_op" not in baseline.get(name, {}):
+            continue
+
+        base = baseline[name]["ns_per_op"]
+        change = (current["ns_per_op"] - base) / base if base else 0.0
+        print(f"{name:40} {base:>10.1f}ns {current['ns_per_op']:>10.1f}ns {change:>+8.1%}")
+
+        if change > threshold:
+            regressions.append(f"{name}: {change:+.1%} ns/op")
+
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for hot-path components")
+    parser.add_argument("--only", help="run benchmarks whose name contains this string")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="target time per repeat")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to diff against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed ns/op regression")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Dict] = {}
+
+    for name, setup in BENCHMARKS.items():
+        if args.only and args.only not in name:
+            continue
+
+        try:
+            results[name] = run_one(setup, args.repeats, args.min_seconds)
+        except Exception as e:
+            # e.g. tokenizer vocab not available offline
+            results[name] = {"skipped": f"{type(e).__name__}: {e}"[:200]}
+
+        print(f"{name:40} {json.dumps(results[name])}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "platform": platform.platform(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = diff(results, baseline, args.threshold)
+        if regressions:
+            print("\nREGRESSIONS:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+CPU cost of the JSON request/response path per request.
+
+Compares the old path (FastAPI body model -> model_dump -> httpx json= ->
+response.json() -> jsonable_encoder + json.dumps) with the fast path
+(TypeAdapter.validate_json -> serialization.dumps -> loads -> FastJSONResponse)
+and passthrough mode (upstream bytes forwarded, only usage/model scanned)
+at 1 KB, 100 KB and 1 MB prompts. No network; only the (de)serialization work
+the gateway does around an upstream call is measured.
+
+    python benchmarks/serialization.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault("CIRCUIT_API_KEYS", "bench-key")
+
+from fastapi.encoders import jsonable_encoder
+
+from circuit.models.openai_compat import ChatCompletionRequest, chat_completion_payload
+from circuit.passthrough import scan_model, scan_usage
+from circuit.serialization import FastJSONResponse, dumps, loads
+
+SIZES = {"1KB": 1_000, "100KB": 100_000, "1MB": 1_000_000}
+
+
+def _request_body(size: int) -> bytes:
+    chunk = "Summarize the following log excerpt. " * 8
+    per_message = max(len(chunk), size // 8)
+    content = (chunk * (per_message // len(chunk) + 1))[:per_message]
+    messages = [{"role": "system", "content": "You are terse."}] + [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": content} for i in range(8)
+    ]
+    return json.dumps({"model": "gpt-4o", "messages": messages, "temperature": 0.2}).encode()
+
+
+def _upstream_body(size: int) -> bytes:
+    text = ("The answer is forty-two. " * (size // 25 + 1))[:size]
+    return json.dumps(
+        {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": size // 4, "completion_tokens": size // 4, "total_tokens": size // 2},
+        }
+    ).encode()
+
+
+CIRCUIT = {"request_id": "bench", "client_key_hash": "3f2a9c1b7d4e", "cost_usd": 0.0, "breaker_state": "closed"}
+
+
+def old_path(request_body: bytes, upstream_body: bytes) -> bytes:
+    body = ChatCompletionRequest.model_validate(json.loads(request_body))
+    payload = body.model_dump()
+    json.dumps(payload).encode()  # httpx json=
+
+    result = json.loads(upstream_body)  # response.json()
+    result["circuit"] = CIRCUIT
+    return json.dumps(jsonable_encoder(result), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def fast_path(request_body: bytes, upstream_body: bytes) -> bytes:
+    payload = chat_completion_payload.validate_json(request_body)
+    dumps(payload)
+
+    result = loads(upstream_body)
+    result["circuit"] = CIRCUIT
+    return FastJSONResponse(result).body
+
+
+def passthrough_path(request_body: bytes, upstream_body: bytes) -> bytes:
+    payload = chat_completion_payload.validate_json(request_body)
+    dumps(payload)
+
+    scan_usage(upstream_body)
+    scan_model(upstream_body)
+    return upstream_body
+
+
+def cpu_ms_per_request(fn: Callable[[bytes, bytes], bytes], req: bytes, up: bytes, min_s: float) -> float:
+    n = 0
+    start = time.process_time()
+    while True:
+        fn(req, up)
+        n += 1
+        elapsed = time.process_time() - start
+        if elapsed >= min_s and n >= 3:
+            return elapsed * 1000 / n
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="JSON path CPU cost per request")
+    parser.add_argument("--min-seconds", type=float, default=1.0)
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Dict[str, float]] = {}
+
+    print(f"{'size':>6} {'old ms':>10} {'fast ms':>10} {'speedup':>8} {'pass ms':>10} {'speedup':>8}")
+    for label, size in SIZES.items():
+        req, up = _request_body(size), _upstream_body(size)
+        old = cpu_ms_per_request(old_path, req, up, args.min_seconds)
+        fast = cpu_ms_per_request(fast_path, req, up, args.min_seconds)
+        passthrough = cpu_ms_per_request(passthrough_path, req, up, args.min_seconds)
+        results[label] = {
+            "old_cpu_ms": round(old, 4),
+            "fast_cpu_ms": round(fast, 4),
+            "passthrough_cpu_ms": round(passthrough, 4),
+        }
+        print(
+            f"{label:>6} {old:>10.4f} {fast:>10.4f} {old / fast:>7.1f}x"
+            f" {passthrough:>10.4f} {old / passthrough:>7.1f}x"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Load time and throughput of each tokenizer family in CIRCUIT_TOKENIZER_DIR.
+
+For every registered tokenizer whose vocabulary is present locally this
+reports the cold load time (file parse + encoder build, nothing cached)
+and tokens per second over a mixed English/code/JSON sample. Missing
+vocabularies are listed as skipped; nothing is downloaded.
+
+    CIRCUIT_TOKENIZER_DIR=data/tokenizers python benchmarks/tokenizers.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+os.environ.setdefault("CIRCUIT_API_KEYS", "bench-key")
+os.environ["CIRCUIT_TOKENIZER_OFFLINE"] = "true"
+
+from circuit.tokenizer_registry import TOKENIZERS, load_tokenizer
+
+SAMPLE = (
+    "The gateway retries the primary provider, then falls back to a local model. "
+    "def count(tokens: list[int]) -> int:\n    return sum(1 for _ in tokens)\n"
+    '{"model": "gpt-4o", "messages": [{"role": "user", "content": "hello"}]}\n'
+    "Übermäßig große Antworten werden komprimiert; 日本語のテキストも数えます。\n"
+) * 64
+
+
+def bench_one(name: str, min_seconds: float) -> Dict[str, float]:
+    load_tokenizer.cache_clear()
+    started = time.perf_counter()
+    tokenizer = load_tokenizer(name)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    tokens = 0
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        tokens += tokenizer.count(SAMPLE)
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds and calls >= 3:
+            break
+
+    return {
+        "load_ms": round(load_ms, 1),
+        "tokens_per_sec": round(tokens / elapsed),
+        "chars_per_token": round(len(SAMPLE) * calls / tokens, 2),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Tokenizer load time and throughput per family")
+    parser.add_argument("--min-seconds", type=float, default=1.0)
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Dict] = {}
+
+    print(f"{'tokenizer':12} {'load ms':>9} {'tokens/s':>12} {'chars/tok':>10}")
+    for name in TOKENIZERS:
+        try:
+            results[name] = bench_one(name, args.min_seconds)
+        except Exception as e:
+            results[name] = {"skipped": f"{type(e).__name__}: {e}"[:200]}
+            print(f"{name:12} skipped: {results[name]['skipped']}")
+            continue
+
+        r = results[name]
+        print(f"{name:12} {r['load_ms']:>9} {r['tokens_per_sec']:>12} {r['chars_per_token']:>10}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import time
+
+# Taken when the package is first imported, before the app's modules load:
+# the start of the startup "imports" phase
+IMPORT_STARTED = time.perf_counter()
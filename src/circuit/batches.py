@@ -0,0 +1,357 @@
+"""
+Offline batch jobs: /v1/batches.
+
+A job is a JSONL file of chat requests. Each line is one of:
+
+    {"custom_id": "...", "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+    {"model": "...", "messages": [...], ...}                  chat request body
+    {"request_id": "...", "title": "...", "body": "text"}     prompt corpus (requests.jsonl)
+
+Lines are validated up front and stored in SQLite (circuit.storage.batches).
+Each worker process runs a background runner; a runner leases one job at a
+time (circuit.storage.batches.claim_batch) and works through it
+`concurrency` items at a time, holding back while interactive traffic is
+busy. Cancels are read from the stored job status between items. Every result
+is committed with the job totals, then appended to the job's output JSONL.
+After a restart the runner rebuilds any output lines missing from the file
+and carries on with the items still pending; an item that was in flight
+during the crash runs again (at-least-once). SQLite and file work runs in
+worker threads so the event loop keeps serving interactive traffic.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+
+from circuit.models.openai_compat import chat_completion_payload
+from circuit.observability.metrics import metrics
+from circuit.serialization import dumps, loads
+from circuit.storage.batches import (
+    claim_batch,
+    done_seq,
+    finish_item,
+    output_path,
+    pending_items,
+    release_batch,
+    renew_lease,
+    results_from,
+)
+
+logger = logging.getLogger("circuit.batches")
+
+# (payload, request_id, client_key_hash) ->
+# (status_code, response body, prompt_tokens, completion_tokens, cost_usd)
+CompleteFn = Callable[[Dict[str, Any], str, str], Awaitable[Tuple[int, Dict[str, Any], int, int, float]]]
+
+_IDLE_POLL_SECONDS = 5.0
+_BUSY_POLL_SECONDS = 0.05
+_TAIL_BLOCK_BYTES = 64 * 1024
+# A job whose runner stops renewing for this long can be claimed by another
+_LEASE_SECONDS = 30.0
+
+
+class BatchInputError(ValueError):
+    pass
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _request_from_line(data: Dict[str, Any], default_model: str) -> Tuple[Optional[str], Dict[str, Any]]:
+    body = data.get("body")
+    if isinstance(body, dict):
+        return data.get("custom_id"), dict(body)
+
+    if "messages" in data:
+        return data.get("custom_id"), dict(data)
+
+    # Free-text corpus line: use it as the prompt
+    content = "\n\n".join(str(data[k]) for k in ("title", "body") if data.get(k))
+    return data.get("request_id"), {"model": default_model, "messages": [{"role": "user", "content": content}]}
+
+
+def parse_batch(raw: bytes, default_model: str, max_items: int) -> List[Tuple[str, str]]:
+    """
+    Validates a JSONL batch into (custom_id, request body JSON) pairs.
+    Raises BatchInputError naming the first bad line.
+    """
+    items: List[Tuple[str, str]] = []
+    seen: Set[str] = set()
+
+    for number, line in enumerate(raw.splitlines(), start=1):
+        if not line.strip():
+            continue
+        if len(items) >= max_items:
+            raise BatchInputError(f"A batch holds at most {max_items} requests")
+
+        try:
+            custom_id, payload = _request_from_line(loads(line), default_model)
+            payload.setdefault("model", default_model)
+            # Batch results are whole responses
+            payload.pop("stream", None)
+            payload.pop("stream_options", None)
+            chat_completion_payload.validate_python(payload)
+        except (ValueError, ValidationError) as e:
+            raise BatchInputError(f"line {number}: {e}")
+
+        custom_id = str(custom_id or f"line-{number}")
+        if custom_id in seen:
+            raise BatchInputError(f"line {number}: duplicate custom_id '{custom_id}'")
+        seen.add(custom_id)
+
+        items.append((custom_id, dumps(payload).decode()))
+
+    if not items:
+        raise BatchInputError("The batch has no requests")
+    return items
+
+
+def batch_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    done = job["completed"] + job["failed"]
+
+    throughput = 0.0
+    if job["started_at"]:
+        end = datetime.fromisoformat(job["finished_at"]) if job["finished_at"] else datetime.now(timezone.utc)
+        elapsed = (end - datetime.fromisoformat(job["started_at"])).total_seconds()
+        throughput = done / elapsed if elapsed > 0 else 0.0
+
+    return {
+        "id": job["id"],
+        "object": "batch",
+        "endpoint": "/v1/chat/completions",
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "request_counts": {
+            "total": job["total"],
+            "completed": job["completed"],
+            "failed": job["failed"],
+        },
+        "progress": round(done / job["total"], 4) if job["total"] else 1.0,
+        "throughput_per_sec": round(throughput, 3),
+        "usage": {
+            "prompt_tokens": job["tokens_input"],
+            "completion_tokens": job["tokens_output"],
+        },
+        "cost_usd": job["cost_usd"],
+        "output_url": f"/v1/batches/{job['id']}/output",
+    }
+
+
+def _last_line(f) -> Tuple[int, Optional[bytes]]:
+    """(end offset of the last complete line, that line), reading back from the end."""
+    pos = f.seek(0, 2)
+    tail = b""
+    while pos > 0:
+        step = min(_TAIL_BLOCK_BYTES, pos)
+        pos -= step
+        f.seek(pos)
+        tail = f.read(step) + tail
+
+        last = tail.rfind(b"\n")
+        if last < 0:
+            continue
+        start = tail.rfind(b"\n", 0, last) + 1
+        if start or not pos:
+            return pos + last + 1, tail[start:last]
+    return 0, None
+
+
+def _repair_output(batch_id: str, path: Path) -> None:
+    """Makes the output file hold exactly the committed results, in order."""
+    seq = 0
+    if path.exists():
+        with open(path, "r+b") as f:
+            keep, line = _last_line(f)
+            # A torn last line from a crash mid-write
+            if keep < f.seek(0, 2):
+                f.truncate(keep)
+            if line is not None:
+                line_no = int(loads(line)["id"].rsplit("-", 1)[1])
+                seq = done_seq(batch_id, line_no) + 1
+
+    with open(path, "ab") as f:
+        for result in results_from(batch_id, seq):
+            f.write(result.encode() + b"\n")
+
+
+def _commit_result(out, batch_id: str, line_no: int, ok: bool, line: bytes, *totals: Any) -> None:
+    # Commit first, then append: a crash in between is repaired on resume
+    if finish_item(batch_id, line_no, ok, line.decode(), *totals) is None:
+        return
+    out.write(line + b"\n")
+    out.flush()
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        complete: CompleteFn,
+        interactive_load: Callable[[], int],
+        concurrency: int = 4,
+        yield_in_flight: int = 8,
+    ) -> None:
+        self.complete = complete
+        self.interactive_load = interactive_load
+        self.concurrency = concurrency
+        self.yield_in_flight = yield_in_flight
+
+        # Lease holder name, unique per runner
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._wake = asyncio.Event()
+        # Jobs to stop dispatching: cancelled, or their lease was lost
+        self._cancel_requested: Set[str] = set()
+        self._lease_lost: Set[str] = set()
+        # Keeps output lines in done_seq order across workers
+        self._commit_lock = asyncio.Lock()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def cancel(self, batch_id: str) -> None:
+        self._cancel_requested.add(batch_id)
+
+    def _stopped(self, batch_id: str) -> bool:
+        return batch_id in self._cancel_requested or batch_id in self._lease_lost
+
+    async def _check(self, batch_id: str) -> None:
+        """Renews the lease and picks up a cancel made through another worker."""
+        status = await asyncio.to_thread(renew_lease, batch_id, self.owner, time.time(), _LEASE_SECONDS)
+        if status is None:
+            if batch_id not in self._lease_lost:
+                logger.warning("batch %s: lease lost, leaving it to its new owner", batch_id)
+            self._lease_lost.add(batch_id)
+        elif status == "cancelling":
+            self._cancel_requested.add(batch_id)
+
+    async def _heartbeat(self, batch_id: str) -> None:
+        # Keeps the lease while every worker waits on a slow upstream
+        while not self._stopped(batch_id):
+            await asyncio.sleep(_LEASE_SECONDS / 3)
+            await self._check(batch_id)
+
+    async def run(self) -> None:
+        while True:
+            job = await asyncio.to_thread(claim_batch, self.owner, time.time(), _LEASE_SECONDS, _now())
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), _IDLE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run_job(job)
+            except Exception as e:
+                logger.error("batch %s failed: %r", job["id"], e)
+                await asyncio.to_thread(release_batch, job["id"], self.owner, "failed", _now())
+            finally:
+                self._cancel_requested.discard(job["id"])
+                self._lease_lost.discard(job["id"])
+
+    async def _run_job(self, job: Dict[str, Any]) -> None:
+        batch_id = job["id"]
+        if job["status"] == "cancelling":
+            self._cancel_requested.add(batch_id)
+
+        path = output_path(batch_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(_repair_output, batch_id, path)
+
+        queue: asyncio.Queue = asyncio.Queue(self.concurrency * 2)
+        heartbeat = asyncio.create_task(self._heartbeat(batch_id))
+
+        try:
+            with open(path, "ab") as out:
+                workers = [
+                    asyncio.create_task(self._worker(job, queue, out))
+                    for _ in range(self.concurrency)
+                ]
+                try:
+                    after = -1
+                    while not self._stopped(batch_id):
+                        items = await asyncio.to_thread(pending_items, batch_id, after)
+                        if not items:
+                            break
+                        for item in items:
+                            await queue.put(item)
+                        after = items[-1]["line_no"]
+
+                    for _ in workers:
+                        await queue.put(None)
+                    await asyncio.gather(*workers)
+                finally:
+                    for worker in workers:
+                        worker.cancel()
+        except asyncio.CancelledError:
+            # Shutting down: hand the job straight to the next runner
+            await asyncio.to_thread(release_batch, batch_id, self.owner)
+            raise
+        finally:
+            heartbeat.cancel()
+
+        if batch_id in self._lease_lost:
+            return
+
+        status = "cancelled" if batch_id in self._cancel_requested else "completed"
+        if await asyncio.to_thread(release_batch, batch_id, self.owner, status, _now()):
+            logger.info("batch %s %s", batch_id, status)
+
+    async def _worker(self, job: Dict[str, Any], queue: asyncio.Queue, out) -> None:
+        while (item := await queue.get()) is not None:
+            # The stored status is checked between items: a cancel may have
+            # been handled by another worker process
+            if not self._stopped(job["id"]):
+                await self._check(job["id"])
+            if self._stopped(job["id"]):
+                continue
+
+            # Interactive requests go first
+            while self.interactive_load() >= self.yield_in_flight:
+                await asyncio.sleep(_BUSY_POLL_SECONDS)
+
+            await self._process(job, item, out)
+    async def _process(self, job: Dict[str, Any], item: Dict[str, Any], out) -> None:
+        batch_id = job["id"]
+        client_key_hash = job["client_key_hash"]
+        request_id = f"{batch_id}-{item['line_no']}"
+
+        error = None
+        try:
+            status_code, body, prompt_tokens, completion_tokens, cost_usd = await self.complete(
+                loads(item["body"]), request_id, client_key_hash
+            )
+        except Exception as e:
+            logger.warning("batch item %s failed: %r", request_id, e)
+            status_code, body, prompt_tokens, completion_tokens, cost_usd = 500, None, 0, 0, 0.0
+            error = {"code": "internal_error", "message": repr(e)}
+
+        line = dumps({
+            "id": request_id,
+            "custom_id": item["custom_id"],
+            "response": {"status_code": status_code, "request_id": request_id, "body": body} if body else None,
+            "error": error,
+        })
+
+        ok = status_code == 200
+        async with self._commit_lock:
+            await asyncio.to_thread(
+                _commit_result, out, batch_id, item["line_no"], ok, line,
+                prompt_tokens, completion_tokens, cost_usd,
+            )
+
+        metrics.inc("batch_items_completed" if ok else "batch_items_failed", client=client_key_hash)
@@ -0,0 +1,375 @@
+"""
+Cluster mode: gateway nodes sharing rate-limit and quota state by gossip.
+
+Every `gossip_ms` each node sends its own counters to every peer over UDP:
+
+- spend: USD spent per (day, client) on this node, read from its SQLite
+  file. It only grows, so a receiver keeps the largest value seen per
+  (peer, day, client), a G-counter: lost, repeated or reordered datagrams
+  do no harm. check_daily_quota adds the peers' entries to the local spend.
+- usage: rpm and tpm cost this node admitted per client since it started.
+  A receiver charges the increase since that peer's previous datagram to
+  its own buckets, so a tenant's rpm/tpm holds across the cluster instead
+  of per node. A peer's counters are only charged from its first full
+  round onwards (per incarnation); that round sets the baseline.
+
+Each round carries only the counters that changed; everything is resent
+every `full_sync_seconds` to repair lost datagrams. Enforcement lags the
+rest of the cluster by about one gossip interval plus network delay, so a
+tenant can overshoot by what the other nodes admit in that window. There
+is no coordinator and no shared store; a node cut off from its peers keeps
+enforcing on its own counters.
+
+Every datagram carries an HMAC-SHA256 of the shared secret, and datagrams
+without a valid one are dropped. One forged spend entry would lock a
+tenant out for the day, so a node only runs without a secret when bound
+to loopback (local testing).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import logging
+import socket
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from circuit.observability.metrics import metrics
+from circuit.reliability.rate_limiter import RateLimiter
+from circuit.serialization import dumps, loads
+from circuit.storage.sqlite import get_spend_for_date
+
+logger = logging.getLogger("circuit.cluster")
+
+# Spend and usage entries are ~50 bytes each; this keeps every datagram
+# far below the 64 KiB UDP limit
+ENTRIES_PER_DATAGRAM = 400
+
+_MAC_BYTES = hashlib.sha256().digest_size
+
+# Set by the app on startup when CIRCUIT_CLUSTER is on
+node: Optional["ClusterNode"] = None
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def parse_address(value: str) -> Tuple[str, int]:
+    host, _, port = value.strip().rpartition(":")
+    return host.strip("[]") or "0.0.0.0", int(port)
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class Peer:
+    def __init__(self, node_id: str) -> None:
+        self.node_id = node_id
+        self.address: Optional[Tuple[str, int]] = None
+        self.incarnation: Optional[float] = None
+        self.last_seen = 0.0
+
+        # (day, client) -> USD spent on the peer
+        self.spend: Dict[Tuple[str, str], float] = {}
+        # client -> (rpm cost, tpm cost) the peer admitted this incarnation
+        self.usage: Dict[str, Tuple[float, float]] = {}
+        # Round of the peer's first full sync seen this incarnation; usage
+        # from it and earlier rounds is the baseline, not charged
+        self.baseline_round: Optional[int] = None
+
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, cluster: "ClusterNode") -> None:
+        self.cluster = cluster
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.cluster.receive(data, addr)
+
+    def error_received(self, exc: Exception) -> None:
+        # ICMP port unreachable from a peer that is down
+        logger.debug("cluster socket error: %r", exc)
+
+
+class ClusterNode:
+    def __init__(
+        self,
+        node_id: str,
+        bind: str,
+        peers: List[str],
+        rate_limiter: RateLimiter,
+        token_limiter: RateLimiter,
+        gossip_ms: int = 200,
+        full_sync_seconds: float = 10.0,
+        secret: str = "",
+    ) -> None:
+        self.bind = parse_address(bind)
+        if not secret and not is_loopback(self.bind[0]):
+            raise ValueError(
+                f"cluster mode on {bind} needs CIRCUIT_CLUSTER_SECRET; "
+                "only a loopback bind may run without one"
+            )
+        self.node_id = node_id or f"{socket.gethostname()}:{self.bind[1]}"
+        self.seeds = [parse_address(peer) for peer in peers]
+        self.rate_limiter = rate_limiter
+        self.token_limiter = token_limiter
+        self.gossip_seconds = gossip_ms / 1000
+        self.full_sync_seconds = full_sync_seconds
+        self.secret = secret.encode()
+
+        # A peer silent for this long is reported down; its spend still counts
+        self.dead_after = max(2.0, 10 * self.gossip_seconds)
+
+        self.incarnation = time.time()
+        self.peers: Dict[str, Peer] = {}
+
+        self._spend_changed: Set[Tuple[str, str]] = set()
+        self._full_sync_due = True
+        self._round = 0
+        self._seed_addresses: List[Tuple[str, int]] = []
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: _Protocol(self), local_addr=self.bind)
+        self.rate_limiter.track_admitted()
+        self.token_limiter.track_admitted()
+        self._task = asyncio.create_task(self._gossip_loop())
+        logger.info("cluster node %s on %s:%d, %d seed peers", self.node_id, *self.bind, len(self.seeds))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        if self._transport is not None:
+            self._transport.close()
+
+    def spend_changed(self, client_key_hash: str, date: str) -> None:
+        self._spend_changed.add((date, client_key_hash))
+
+    def remote_spend(self, client_key_hash: str, date: str) -> float:
+        k = (date, client_key_hash)
+        return sum(peer.spend.get(k, 0.0) for peer in self.peers.values())
+
+    def remote_spend_for_date(self, date: str) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for peer in self.peers.values():
+            for (day, client), usd in peer.spend.items():
+                if day == date:
+                    totals[client] = totals.get(client, 0.0) + usd
+        return totals
+
+    # Sending
+
+    async def _gossip_loop(self) -> None:
+        last_full = 0.0
+        while True:
+            try:
+                full = self._full_sync_due or time.monotonic() - last_full >= self.full_sync_seconds
+                if full:
+                    self._full_sync_due = False
+                    last_full = time.monotonic()
+                    await self._resolve_seeds()
+                    self._prune()
+                await self.gossip(full)
+            except Exception as e:
+                logger.error("cluster gossip failed: %r", e)
+
+            self._update_gauges()
+            await asyncio.sleep(self.gossip_seconds)
+
+    async def _resolve_seeds(self) -> None:
+        loop = asyncio.get_running_loop()
+        addresses = []
+        for host, port in self.seeds:
+            try:
+                infos = await loop.getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            except OSError as e:
+                logger.warning("cluster peer %s:%d does not resolve: %r", host, port, e)
+                continue
+            addresses.append(infos[0][4][:2])
+
+        if addresses or not self._seed_addresses:
+            self._seed_addresses = addresses
+
+    def _prune(self) -> None:
+        # Only today's spend is enforced
+        today = _today()
+        for peer in self.peers.values():
+            peer.spend = {k: v for k, v in peer.spend.items() if k[0] >= today}
+
+    def _own_spend(self, changed: Set[Tuple[str, str]], full: bool) -> List[list]:
+        by_date: Dict[str, Set[str]] = {}
+        for date, client in changed:
+            by_date.setdefault(date, set()).add(client)
+
+        entries = []
+        if full:
+            date = _today()
+            for client, usd in get_spend_for_date(date).items():
+                entries.append([date, client, usd])
+            by_date.pop(date, None)
+
+        for date, clients in by_date.items():
+            for client, usd in get_spend_for_date(date, clients).items():
+                entries.append([date, client, usd])
+        return entries
+
+    def _own_usage(self, full: bool) -> List[list]:
+        requests = self.rate_limiter.admitted or {}
+        tokens = self.token_limiter.admitted or {}
+
+        clients = self.rate_limiter.drain_changed() | self.token_limiter.drain_changed()
+        if full:
+            clients = set(requests) | set(tokens)
+
+        return [[client, requests.get(client, 0.0), tokens.get(client, 0.0)] for client in clients]
+
+    def _datagrams(self, spend: List[list], usage: List[list], full: bool = False) -> List[bytes]:
+        n = ENTRIES_PER_DATAGRAM
+        chunks = [(spend[i : i + n], []) for i in range(0, len(spend), n)]
+        chunks += [([], usage[i : i + n]) for i in range(0, len(usage), n)]
+
+        datagrams = []
+        # Always at least one, which doubles as the heartbeat
+        for spend_chunk, usage_chunk in chunks or [([], [])]:
+            message = {
+                "node": self.node_id,
+                "inc": self.incarnation,
+                "round": self._round,
+                "full": full,
+                "spend": spend_chunk,
+                "usage": usage_chunk,
+            }
+            data = dumps(message)
+            if self.secret:
+                data = hmac.new(self.secret, data, hashlib.sha256).digest() + data
+            datagrams.append(data)
+        return datagrams
+
+    async def gossip(self, full: bool = False) -> None:
+        changed, self._spend_changed = self._spend_changed, set()
+        spend = await asyncio.to_thread(self._own_spend, changed, full) if changed or full else []
+        usage = self._own_usage(full)
+
+        # Seeds plus peers that found us on their own
+        destinations = set(self._seed_addresses)
+        now = time.monotonic()
+        for peer in self.peers.values():
+            if peer.address is not None and now - peer.last_seen <= self.dead_after:
+                destinations.add(peer.address)
+
+        self._round += 1
+        for data in self._datagrams(spend, usage, full):
+            for address in destinations:
+                self._transport.sendto(data, address)
+                metrics.inc("cluster_datagrams_sent")
+
+    # Receiving
+
+    def receive(self, data: bytes, addr) -> None:
+        if self.secret:
+            mac, data = data[:_MAC_BYTES], data[_MAC_BYTES:]
+            if not hmac.compare_digest(mac, hmac.new(self.secret, data, hashlib.sha256).digest()):
+                metrics.inc("cluster_datagrams_rejected")
+                return
+
+        try:
+            message = loads(data)
+            self.merge(message, tuple(addr[:2]))
+        except Exception as e:
+            metrics.inc("cluster_datagrams_rejected")
+            logger.debug("bad cluster datagram from %s: %r", addr, e)
+
+    def merge(self, message: Dict[str, Any], address: Optional[Tuple[str, int]] = None) -> None:
+        node_id = message["node"]
+        if node_id == self.node_id:
+            return
+
+        peer = self.peers.get(node_id)
+        if peer is None:
+            peer = self.peers[node_id] = Peer(node_id)
+            logger.info("cluster peer %s joined from %s", node_id, address)
+            # A new or restarted peer gets everything on the next round
+            self._full_sync_due = True
+        if address is not None:
+            peer.address = address
+        peer.last_seen = time.monotonic()
+        metrics.inc("cluster_datagrams_received")
+
+        for date, client, usd in message["spend"]:
+            k = (date, client)
+            if usd > peer.spend.get(k, 0.0):
+                peer.spend[k] = usd
+
+        incarnation = message["inc"]
+        if peer.incarnation is not None and incarnation < peer.incarnation:
+            # Late datagram from before the peer restarted
+            return
+
+        if incarnation != peer.incarnation:
+            if peer.incarnation is not None:
+                logger.info("cluster peer %s restarted", node_id)
+                self._full_sync_due = True
+            peer.incarnation = incarnation
+            peer.usage = {}
+            peer.baseline_round = None
+
+        # Until a full round arrives a client missing from peer.usage may
+        # just not have changed lately, so its total is not a delta; all of
+        # the full round (every datagram of it) sets the baseline
+        round_no = message["round"]
+        if peer.baseline_round is None and message["full"]:
+            peer.baseline_round = round_no
+        baseline = peer.baseline_round is None or round_no <= peer.baseline_round
+
+        for client, requests, tokens in message["usage"]:
+            seen_requests, seen_tokens = peer.usage.get(client, (0.0, 0.0))
+            peer.usage[client] = (max(requests, seen_requests), max(tokens, seen_tokens))
+
+            if baseline:
+                continue
+            if requests > seen_requests:
+                self.rate_limiter.debit(client, requests - seen_requests)
+            if tokens > seen_tokens:
+                self.token_limiter.debit(client, tokens - seen_tokens)
+
+    # Reporting
+
+    def _staleness(self) -> Tuple[int, float]:
+        now = time.monotonic()
+        ages = [now - peer.last_seen for peer in self.peers.values()]
+        alive = [age for age in ages if age <= self.dead_after]
+        return len(alive), max(alive, default=0.0) * 1000
+
+    def _update_gauges(self) -> None:
+        alive, staleness_ms = self._staleness()
+        metrics.set_gauge("cluster_peers_alive", alive)
+        metrics.set_gauge("cluster_max_staleness_ms", staleness_ms)
+
+    def report(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        alive, staleness_ms = self._staleness()
+        return {
+            "node": self.node_id,
+            "peers_alive": alive,
+            "max_staleness_ms": round(staleness_ms),
+            "peers": {
+                peer.node_id: {
+                    "address": f"{peer.address[0]}:{peer.address[1]}" if peer.address else None,
+                    "alive": now - peer.last_seen <= self.dead_after,
+                    "last_seen_ms_ago": round((now - peer.last_seen) * 1000),
+                }
+                for peer in self.peers.values()
+            },
+        }
@@ -8,17 +8,155 @@ class Settings(BaseSettings):
     PROVIDER: str = "MOCK"
     CIRCUIT_API_KEYS: str
 
+    # Comma-separated keys allowed to call /admin endpoints
+    CIRCUIT_ADMIN_KEYS: str = ""
+
     # Debug flag
     CIRCUIT_LOG_PAYLOADS: bool = False
 
     # SQLite database path
     CIRCUIT_DB_PATH: str = "./circuit.db"
 
-    # Default quota limits
-    CIRCUIT_REQUESTS_PER_MIN: int = 60
+    # Default tenant policy; per-tenant overrides come from the policy store
+    CIRCUIT_REQUESTS_PER_MIN: int = 300
+    CIRCUIT_RATE_LIMIT_BURST: int = 20
     CIRCUIT_DAILY_USD_LIMIT: float = 10.0
     CIRCUIT_MAX_OUTPUT_TOKENS: int = 4096
 
+    # Tenant policy JSON file; empty reads the tenant_policies table instead.
+    # Checked for changes every CIRCUIT_POLICY_RELOAD_SECONDS
+    CIRCUIT_POLICY_FILE: str = ""
+    CIRCUIT_POLICY_RELOAD_SECONDS: int = 5
+
+    # Cluster mode: gossip spend and rpm/tpm usage over UDP with the nodes in
+    # CIRCUIT_CLUSTER_PEERS (host:port, comma-separated; listing this node
+    # too is fine) every CIRCUIT_CLUSTER_GOSSIP_MS, with a full resend every
+    # CIRCUIT_CLUSTER_FULL_SYNC_SECONDS. Node id defaults to hostname:port.
+    # Datagrams are signed with the secret, which is required unless the
+    # bind address is loopback
+    CIRCUIT_CLUSTER: bool = False
+    CIRCUIT_CLUSTER_NODE_ID: str = ""
+    CIRCUIT_CLUSTER_BIND: str = "0.0.0.0:7946"
+    CIRCUIT_CLUSTER_PEERS: str = ""
+    CIRCUIT_CLUSTER_GOSSIP_MS: int = 200
+    CIRCUIT_CLUSTER_FULL_SYNC_SECONDS: float = 10.0
+    CIRCUIT_CLUSTER_SECRET: str = ""
+
+    # Models whose tokenizer encodings are loaded before the app reports ready
+    CIRCUIT_WARMUP_MODELS: str = "gpt-4o,gpt-4o-mini"
+
+    # Tokenizer vocabularies by family (see circuit.tokenizer_registry).
+    # With CIRCUIT_TOKENIZER_OFFLINE, encodings missing from the directory
+    # are never downloaded
+    CIRCUIT_TOKENIZER_DIR: str = "data/tokenizers"
+    CIRCUIT_TOKENIZER_OFFLINE: bool = False
+
+    # Forward non-streaming upstream bodies unchanged; gateway metadata
+    # moves to x-circuit-* response headers
+    CIRCUIT_PASSTHROUGH: bool = False
+
+    # Continue a stream that drops mid-way on the next provider, sending it
+    # the partial assistant output, instead of ending with an error event
+    CIRCUIT_STREAM_RESUME: bool = False
+
+    # Streaming memory bounds: upstream read-ahead per stream, bytes buffered
+    # across all streams before new streams are shed with a 503 (0 disables),
+    # and how long a client may stop reading before it is disconnected
+    CIRCUIT_STREAM_BUFFER_BYTES: int = 64 * 1024
+    CIRCUIT_STREAM_MEMORY_BUDGET_BYTES: int = 64 * 1024 * 1024
+    CIRCUIT_STREAM_STALL_SECONDS: float = 30.0
+
+    # Response compression, negotiated from Accept-Encoding in this order
+    # (zstd and br only when their packages are installed). Bodies below
+    # CIRCUIT_COMPRESSION_MIN_BYTES are sent as they are
+    CIRCUIT_COMPRESSION: bool = True
+    CIRCUIT_COMPRESSION_ENCODINGS: str = "zstd,br,gzip"
+    CIRCUIT_COMPRESSION_MIN_BYTES: int = 1024
+
+    # Non-streaming n > 1 on providers without native support: n concurrent
+    # calls, at most CIRCUIT_FANOUT_CONCURRENCY in flight per provider.
+    # With CIRCUIT_FANOUT_PARTIAL, failed calls drop their choice instead
+    # of failing the request
+    CIRCUIT_MAX_N: int = 8
+    CIRCUIT_FANOUT_CONCURRENCY: int = 4
+    CIRCUIT_FANOUT_PARTIAL: bool = False
+
+    # Idempotency-Key: successful responses are replayed to repeats of the
+    # same key for CIRCUIT_IDEMPOTENCY_TTL_SECONDS; a repeat waits up to
+    # CIRCUIT_IDEMPOTENCY_WAIT_SECONDS for the first request to finish
+    CIRCUIT_IDEMPOTENCY: bool = True
+    CIRCUIT_IDEMPOTENCY_TTL_SECONDS: int = 86400
+    CIRCUIT_IDEMPOTENCY_WAIT_SECONDS: float = 60.0
+    CIRCUIT_IDEMPOTENCY_MAX_ENTRIES: int = 10000
+    CIRCUIT_IDEMPOTENCY_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # Offline batch jobs (/v1/batches): items run in the background at most
+    # CIRCUIT_BATCH_CONCURRENCY at a time (0 stops the runner), pausing while
+    # CIRCUIT_BATCH_YIELD_IN_FLIGHT interactive requests or streams are open
+    CIRCUIT_BATCH_CONCURRENCY: int = 4
+    CIRCUIT_BATCH_YIELD_IN_FLIGHT: int = 8
+    CIRCUIT_BATCH_MAX_ITEMS: int = 50000
+
+    # Near-duplicate response cache for non-streaming requests. Rules are
+    # JSON mapping "default" or a client key hash to normalization rule names,
+    # e.g. {"default": ["timestamps", "uuids", "whitespace"]}
+    CIRCUIT_NEAR_DUP_CACHE: bool = False
+    CIRCUIT_NEAR_DUP_THRESHOLD: float = 0.9
+    CIRCUIT_NEAR_DUP_MAX_ENTRIES: int = 10000
+    CIRCUIT_NEAR_DUP_MAX_BYTES: int = 64 * 1024 * 1024
+    CIRCUIT_NEAR_DUP_TTL_SECONDS: int = 3600
+    CIRCUIT_NEAR_DUP_RULES: str = ""
+
+    # Per-request stage tracing: Server-Timing header on every response,
+    # sampled recent traces and the slowest ones kept for /debug/traces
+    CIRCUIT_SERVER_TIMING: bool = True
+    CIRCUIT_TRACE_SAMPLE_RATE: float = 0.05
+    CIRCUIT_TRACE_BUFFER_SIZE: int = 200
+    CIRCUIT_TRACE_SLOWEST: int = 20
+
+    # Per-client metrics are kept for the busiest clients only (by a
+    # count-min sketch of metric events); the rest share client="other".
+    # 0 keeps every client
+    CIRCUIT_METRICS_MAX_CLIENTS: int = 1000
+
+    # Event-loop lag monitor; a block longer than the threshold logs the
+    # loop thread's stack
+    CIRCUIT_LOOP_MONITOR: bool = True
+    CIRCUIT_LOOP_MONITOR_INTERVAL_MS: int = 100
+    CIRCUIT_LOOP_BLOCK_THRESHOLD_MS: int = 250
+
+    # Write log records from a background thread instead of the event loop
+    CIRCUIT_ASYNC_LOGGING: bool = True
+
+    # Background health probes of the primary and fallback; unhealthy
+    # providers are tried last. 0 disables the latency criterion
+    CIRCUIT_HEALTH_PROBE: bool = True
+    CIRCUIT_HEALTH_PROBE_INTERVAL_SECONDS: float = 10.0
+    CIRCUIT_HEALTH_PROBE_TIMEOUT_SECONDS: float = 1.5
+    CIRCUIT_HEALTH_EWMA_ALPHA: float = 0.3
+    CIRCUIT_HEALTH_MIN_SUCCESS_RATE: float = 0.5
+    CIRCUIT_HEALTH_MAX_LATENCY_MS: float = 0.0
+
+    # Request log partitions (0 disables the step)
+    CIRCUIT_LOG_RETENTION_DAYS: int = 30
+    CIRCUIT_LOG_COMPACT_AFTER_DAYS: int = 2
+    CIRCUIT_LOG_MAINTENANCE_INTERVAL_SECONDS: int = 3600
+
+    # Local Ollama fallback
+    CIRCUIT_OLLAMA_URL: str = "http://127.0.0.1:11434"
+    CIRCUIT_OLLAMA_MODEL: str = "llama3.2:1b"
+
+    # Comma-separated Ollama replica URLs. When set, the fallback routes by
+    # prompt prefix (system prompt + first N tokens) so each replica's KV
+    # cache is reused; a replica above load_factor x average load spills over
+    CIRCUIT_OLLAMA_REPLICAS: str = ""
+    CIRCUIT_PREFIX_AFFINITY_TOKENS: int = 256
+    CIRCUIT_PREFIX_AFFINITY_LOAD_FACTOR: float = 1.25
+
+    # Mock provider behaviour as MockProfile JSON overrides,
+    # e.g. {"latency": "lognormal", "latency_ms": 300, "tokens_per_sec": 80}
+    CIRCUIT_MOCK_PROFILE: str = ""
+
     class Config:
         env_file = ".env"
         extra = "ignore"
@@ -27,5 +165,25 @@ class Settings(BaseSettings):
     def api_keys(self) -> List[str]:
         return [key.strip() for key in self.CIRCUIT_API_KEYS.split(",") if key.strip()]
 
+    @property
+    def ollama_replicas(self) -> List[str]:
+        return [url.strip() for url in self.CIRCUIT_OLLAMA_REPLICAS.split(",") if url.strip()]
+
+    @property
+    def cluster_peers(self) -> List[str]:
+        return [peer.strip() for peer in self.CIRCUIT_CLUSTER_PEERS.split(",") if peer.strip()]
+
+    @property
+    def warmup_models(self) -> List[str]:
+        return [model.strip() for model in self.CIRCUIT_WARMUP_MODELS.split(",") if model.strip()]
+
+    @property
+    def compression_encodings(self) -> List[str]:
+        return [name.strip().lower() for name in self.CIRCUIT_COMPRESSION_ENCODINGS.split(",") if name.strip()]
+
+    @property
+    def admin_keys(self) -> List[str]:
+        return [key.strip() for key in self.CIRCUIT_ADMIN_KEYS.split(",") if key.strip()]
+
 
 settings = Settings()
\ No newline at end of file
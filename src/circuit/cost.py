@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import re
 from dataclasses import dataclass
 from typing import Optional
 
@@ -16,8 +17,12 @@ MODEL_PRICES: dict[str, ModelPrice] = {
 }
 
 
+# Upstreams answer with dated snapshots (gpt-4o-mini-2024-07-18)
+_SNAPSHOT = re.compile(r"-\d{4}-\d{2}-\d{2}$")
+
+
 def estimate_cost_usd(model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> float:
-    price = MODEL_PRICES.get(model)
+    price = MODEL_PRICES.get(model) or MODEL_PRICES.get(_SNAPSHOT.sub("", model))
     if not price:
         return 0.0
 
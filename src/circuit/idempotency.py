@@ -0,0 +1,179 @@
+"""
+Idempotency-Key: a retried request gets the first response again.
+
+The first request with a given (client, key) runs normally; its successful
+response is kept for `ttl_seconds` and replayed to every repeat without an
+upstream call or a quota charge. A repeat that arrives while the first is
+still running waits for it: on the same worker via its future, across
+workers by polling the shared SQLite claim. A repeat with a different body
+is rejected. Failures (non-2xx) and streams are not stored, so their
+retries run again. Recent responses are also held in memory, bounded by
+entries and bytes, least recently used first out.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from starlette.responses import Response
+
+from circuit.serialization import dumps, loads
+from circuit.storage.idempotency import claim_key, release_key, store_response
+
+_POLL_SECONDS = 0.1
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+class IdempotencyInProgress(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    status_code: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+    fingerprint: str
+    expires_at: float
+
+    @classmethod
+    def from_response(cls, response, fingerprint: str, expires_at: float) -> Optional["StoredResponse"]:
+        # Streaming responses have no body to keep
+        body = getattr(response, "body", None)
+        if body is None or not 200 <= response.status_code < 300:
+            return None
+
+        headers = [(k, v) for k, v in response.headers.items() if k != "content-length"]
+        return cls(response.status_code, headers, bytes(body), fingerprint, expires_at)
+
+    def response(self) -> Response:
+        response = Response(content=self.body, status_code=self.status_code, headers=dict(self.headers))
+        response.headers["idempotent-replayed"] = "true"
+        return response
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        ttl_seconds: float = 86400,
+        max_entries: int = 10000,
+        max_bytes: int = 64 * 1024 * 1024,
+        wait_seconds: float = 60.0,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # How long a repeat waits for the first request, and the lease
+        # after which another worker may take over a dead claim
+        self.wait_seconds = wait_seconds
+
+        self._done: "OrderedDict[Tuple[str, str], StoredResponse]" = OrderedDict()
+        self._bytes = 0
+        self._running: Dict[Tuple[str, str], Tuple[asyncio.Future, str]] = {}
+
+    def _remember(self, k: Tuple[str, str], stored: StoredResponse) -> None:
+        old = self._done.pop(k, None)
+        if old is not None:
+            self._bytes -= len(old.body)
+
+        self._done[k] = stored
+        self._bytes += len(stored.body)
+
+        while self._done and (len(self._done) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._done.popitem(last=False)
+            self._bytes -= len(evicted.body)
+
+    def _cached(self, k: Tuple[str, str]) -> Optional[StoredResponse]:
+        stored = self._done.get(k)
+        if stored is None:
+            return None
+        if stored.expires_at < time.time():
+            del self._done[k]
+            self._bytes -= len(stored.body)
+            return None
+
+        self._done.move_to_end(k)
+        return stored
+
+    async def begin(self, client_key_hash: str, key: str, fingerprint: str) -> Optional[StoredResponse]:
+        """
+        None when the caller owns the key and must call finish(); otherwise
+        the response to replay. Raises IdempotencyConflict for a different
+        body and IdempotencyInProgress when the first request outlasts the wait.
+        """
+        k = (client_key_hash, key)
+        deadline = time.monotonic() + self.wait_seconds
+
+        while True:
+            stored = self._cached(k)
+            if stored is not None:
+                if stored.fingerprint != fingerprint:
+                    raise IdempotencyConflict()
+                return stored
+
+            running = self._running.get(k)
+            if running is not None:
+                future, running_fingerprint = running
+                if running_fingerprint != fingerprint:
+                    raise IdempotencyConflict()
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    raise IdempotencyInProgress()
+                continue
+
+            row = claim_key(client_key_hash, key, fingerprint, time.time(), self.wait_seconds)
+            if row is None:
+                self._running[k] = (asyncio.get_running_loop().create_future(), fingerprint)
+                return None
+
+            if row["fingerprint"] != fingerprint:
+                raise IdempotencyConflict()
+
+            if row["status_code"] is not None:
+                stored = StoredResponse(
+                    row["status_code"],
+                    [tuple(h) for h in loads(row["headers"])],
+                    row["body"],
+                    row["fingerprint"],
+                    row["expires_at"],
+                )
+                self._remember(k, stored)
+                return stored
+
+            # Claimed by a request on another worker
+            if time.monotonic() >= deadline:
+                raise IdempotencyInProgress()
+            await asyncio.sleep(_POLL_SECONDS)
+
+    def finish(self, client_key_hash: str, key: str, response) -> None:
+        """Stores the owner's response if it is worth replaying, then wakes the waiters."""
+        k = (client_key_hash, key)
+        future, fingerprint = self._running.pop(k)
+
+        try:
+            stored = None
+            if response is not None:
+                stored = StoredResponse.from_response(response, fingerprint, time.time() + self.ttl_seconds)
+
+            if stored is None:
+                release_key(client_key_hash, key)
+            else:
+                store_response(
+                    client_key_hash,
+                    key,
+                    stored.status_code,
+                    dumps(stored.headers).decode(),
+                    stored.body,
+                    stored.expires_at,
+                )
+                self._remember(k, stored)
+        finally:
+            future.set_result(None)
@@ -1,32 +1,70 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import uuid
 from datetime import datetime, timezone
 
 from fastapi import FastAPI, Request, Response
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
 
 from circuit.middleware.auth import AuthMiddleware
 from circuit.middleware.logging import LoggingMiddleware
 from circuit.middleware.request_id import RequestIDMiddleware
 from circuit.middleware.latency import LatencyMiddleware
+from circuit.middleware.tracing import TracingMiddleware
+from circuit.middleware.stall_guard import StallGuardMiddleware
+from circuit.middleware.compression import CompressionMiddleware
 
-from circuit.providers.factory import get_chat_provider
-from circuit.providers.ollama_provider import OllamaProvider
+from circuit import cluster
+from circuit.cluster import ClusterNode
+from circuit.idempotency import IdempotencyConflict, IdempotencyInProgress, IdempotencyStore
+from circuit.batches import BatchInputError, BatchRunner, batch_view, parse_batch
+from circuit.providers.factory import get_chat_provider, get_fallback_provider
 
-from circuit.models.openai_compat import ChatCompletionRequest
+from circuit.models.openai_compat import ChatCompletionRequest, chat_completion_payload
+from circuit.serialization import FastJSONResponse, dumps, loads
+from circuit.passthrough import circuit_headers, scan_model, scan_usage
+from circuit.providers.base import RawCompletion
+from circuit.providers.fanout import fan_out
 from circuit.cost import estimate_cost_usd
-from circuit.storage.sqlite import init_db, record_request
+from circuit.config import settings
+from circuit.storage.idempotency import purge_expired
+from circuit.storage.batches import create_batch, get_batch, list_batches, output_path, request_cancel
+from circuit.storage.sqlite import get_spend_for_date, get_usage, init_db, prepare_partition, record_request
+from circuit.policy import TenantPolicy, policy_store
+from circuit.quota import check_daily_quota, record_spend, today_utc
+from circuit.storage.partitions import run_maintenance
+from circuit.storage.export import EXPORT_FORMATS, encode_rows, iter_request_rows
+from circuit.stream_settlement import StreamSession
+from circuit.streaming import EventStreamResponse, buffered, open_stream, relay_stream
 
+from circuit.reliability.backpressure import StreamBudget
 from circuit.reliability.circuit_breaker import CircuitBreaker
+from circuit.reliability.health import HealthProber
 from circuit.reliability.rate_limiter import RateLimiter
 from circuit.reliability.retry import with_retries
 
 from circuit.observability.metrics import metrics
+from circuit.observability.tracing import span, trace_buffer
+from circuit.observability.loop_monitor import LoopMonitor, collapsed, sample_stacks
+from circuit.observability.log_queue import install_queue_logging, stop_queue_logging
 
 from circuit.tokenizer import (
     count_tokens_from_messages,
     count_tokens_from_text,
+    warm_encodings,
 )
+from circuit import IMPORT_STARTED
+from circuit.startup import startup_state
+
+startup_state.record("imports", IMPORT_STARTED)
+
+logger = logging.getLogger("circuit.gateway")
 
 
 app = FastAPI()
@@ -35,22 +73,174 @@ app.add_middleware(RequestIDMiddleware)
 app.add_middleware(LoggingMiddleware)
 app.add_middleware(AuthMiddleware)
 app.add_middleware(LatencyMiddleware)
+app.add_middleware(TracingMiddleware)
+if settings.CIRCUIT_COMPRESSION:
+    app.add_middleware(
+        CompressionMiddleware,
+        min_bytes=settings.CIRCUIT_COMPRESSION_MIN_BYTES,
+        encodings=settings.compression_encodings,
+    )
+app.add_middleware(StallGuardMiddleware, stall_seconds=settings.CIRCUIT_STREAM_STALL_SECONDS)
 
-provider = get_chat_provider()
-fallback_provider = OllamaProvider()
+# Built in the startup hook
+provider = None
+fallback_provider = None
+health_prober = None
+near_dup_cache = None
+batch_runner = None
 
 breaker = CircuitBreaker()
-rate_limiter = RateLimiter(capacity=20, refill_rate_per_sec=5)
+stream_budget = StreamBudget(settings.CIRCUIT_STREAM_MEMORY_BUDGET_BYTES)
+loop_monitor = LoopMonitor(
+    interval_ms=settings.CIRCUIT_LOOP_MONITOR_INTERVAL_MS,
+    block_threshold_ms=settings.CIRCUIT_LOOP_BLOCK_THRESHOLD_MS,
+)
+profile_lock = asyncio.Lock()
+
+idempotency_store = None
+if settings.CIRCUIT_IDEMPOTENCY:
+    idempotency_store = IdempotencyStore(
+        ttl_seconds=settings.CIRCUIT_IDEMPOTENCY_TTL_SECONDS,
+        max_entries=settings.CIRCUIT_IDEMPOTENCY_MAX_ENTRIES,
+        max_bytes=settings.CIRCUIT_IDEMPOTENCY_MAX_BYTES,
+        wait_seconds=settings.CIRCUIT_IDEMPOTENCY_WAIT_SECONDS,
+    )
+
+# Interactive chat requests and open streams; batch jobs yield to them
+interactive_in_flight = 0
+
+# Buckets are sized per request from the tenant policy
+rate_limiter = RateLimiter()
+token_limiter = RateLimiter()
+
+
+async def _policy_reload_loop():
+    while True:
+        await asyncio.sleep(settings.CIRCUIT_POLICY_RELOAD_SECONDS)
+        await asyncio.to_thread(policy_store.reload)
+
+
+async def _log_maintenance_loop():
+    while True:
+        try:
+            await asyncio.to_thread(
+                run_maintenance,
+                settings.CIRCUIT_LOG_RETENTION_DAYS,
+                settings.CIRCUIT_LOG_COMPACT_AFTER_DAYS,
+            )
+            await asyncio.to_thread(purge_expired, time.time())
+        except Exception as e:
+            logger.error("log maintenance failed: %r", e)
+
+        await asyncio.sleep(settings.CIRCUIT_LOG_MAINTENANCE_INTERVAL_SECONDS)
 
 
 @app.on_event("startup")
-async def _startup():
-    init_db()
+async def startup():
+    global provider, fallback_provider, health_prober, near_dup_cache, batch_runner
+
+    if settings.CIRCUIT_ASYNC_LOGGING:
+        install_queue_logging()
+
+    with startup_state.phase("database"):
+        init_db()
+        prepare_partition(datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+
+    with startup_state.phase("policies"):
+        await asyncio.to_thread(policy_store.reload, True)
+
+    with startup_state.phase("providers"):
+        provider = get_chat_provider()
+        fallback_provider = get_fallback_provider()
+
+        if settings.CIRCUIT_HEALTH_PROBE:
+            health_prober = HealthProber(
+                {"primary": provider, "fallback": fallback_provider},
+                interval_seconds=settings.CIRCUIT_HEALTH_PROBE_INTERVAL_SECONDS,
+                timeout_seconds=settings.CIRCUIT_HEALTH_PROBE_TIMEOUT_SECONDS,
+                alpha=settings.CIRCUIT_HEALTH_EWMA_ALPHA,
+                min_success_rate=settings.CIRCUIT_HEALTH_MIN_SUCCESS_RATE,
+                max_latency_ms=settings.CIRCUIT_HEALTH_MAX_LATENCY_MS,
+            )
+
+    with startup_state.phase("tokenizer"):
+        try:
+            await asyncio.to_thread(warm_encodings, settings.warmup_models)
+        except Exception as e:
+            # Not fatal: encodings then load on first use
+            logger.warning("tokenizer warmup failed: %r", e)
+
+    if settings.CIRCUIT_NEAR_DUP_CACHE:
+        with startup_state.phase("near_dup_cache"):
+            # Pulls in numpy, so only imported when enabled
+            from circuit.near_dup_cache import NearDupCache, parse_rules
+
+            near_dup_cache = NearDupCache(
+                threshold=settings.CIRCUIT_NEAR_DUP_THRESHOLD,
+                max_entries=settings.CIRCUIT_NEAR_DUP_MAX_ENTRIES,
+                max_bytes=settings.CIRCUIT_NEAR_DUP_MAX_BYTES,
+                ttl_seconds=settings.CIRCUIT_NEAR_DUP_TTL_SECONDS,
+                rules=parse_rules(settings.CIRCUIT_NEAR_DUP_RULES),
+            )
+
+    app.state.log_maintenance = asyncio.create_task(_log_maintenance_loop())
+    app.state.policy_reload = asyncio.create_task(_policy_reload_loop())
+    if health_prober is not None:
+        app.state.health_probe = asyncio.create_task(health_prober.run())
+    if settings.CIRCUIT_BATCH_CONCURRENCY > 0:
+        batch_runner = BatchRunner(
+            _batch_complete,
+            lambda: interactive_in_flight,
+            concurrency=settings.CIRCUIT_BATCH_CONCURRENCY,
+            yield_in_flight=settings.CIRCUIT_BATCH_YIELD_IN_FLIGHT,
+        )
+        app.state.batch_runner = asyncio.create_task(batch_runner.run())
+    if settings.CIRCUIT_CLUSTER:
+        with startup_state.phase("cluster"):
+            cluster.node = ClusterNode(
+                settings.CIRCUIT_CLUSTER_NODE_ID,
+                settings.CIRCUIT_CLUSTER_BIND,
+                settings.cluster_peers,
+                rate_limiter,
+                token_limiter,
+                gossip_ms=settings.CIRCUIT_CLUSTER_GOSSIP_MS,
+                full_sync_seconds=settings.CIRCUIT_CLUSTER_FULL_SYNC_SECONDS,
+                secret=settings.CIRCUIT_CLUSTER_SECRET,
+            )
+            await cluster.node.start()
+    if settings.CIRCUIT_LOOP_MONITOR:
+        loop_monitor.start()
+    startup_state.mark_ready()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if cluster.node is not None:
+        await cluster.node.stop()
+    loop_monitor.stop()
+    stop_queue_logging()
+
+
+@app.get("/livez")
+async def livez():
+    return {"status": "ok"}
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    # Readiness: only "ok" once the startup hook has finished warming up
+    if not startup_state.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "starting", "startup": startup_state.report()},
+        )
+
+    body = {"status": "ok", "startup": startup_state.report()}
+    if health_prober is not None:
+        body["providers"] = health_prober.report()
+    if cluster.node is not None:
+        body["cluster"] = cluster.node.report()
+    return body
 
 
 @app.get("/metrics")
@@ -66,13 +256,566 @@ async def prometheus_metrics():
     )
 
 
-@app.post("/v1/chat/completions")
-async def chat_completions(request: Request, body: ChatCompletionRequest):
+@app.get("/v1/usage")
+async def usage(
+    request: Request,
+    granularity: str = "hour",
+    start: str | None = None,
+    end: str | None = None,
+    client: str | None = None,
+    model: str | None = None,
+):
+    if granularity not in ("minute", "hour"):
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": {
+                    "code": "invalid_request",
+                    "message": "granularity must be 'minute' or 'hour'",
+                }
+            },
+        )
+
+    # Only admins may read other tenants' usage
+    if not getattr(request.state, "is_admin", False):
+        client = getattr(request.state, "client_key_hash", "unknown")
+
+    rows = get_usage(
+        granularity=granularity,
+        start=start,
+        end=end,
+        client_key_hash=client,
+        model=model,
+    )
+
+    return {
+        "object": "usage",
+        "granularity": granularity,
+        "data": rows,
+    }
+
+
+def _forbidden() -> JSONResponse:
+    return JSONResponse(
+        status_code=403,
+        content={
+            "error": {
+                "code": "forbidden",
+                "message": "Admin API key required",
+            }
+        },
+    )
+
+
+def _policy_view(policy: TenantPolicy) -> dict:
+    return {
+        "daily_usd_limit": policy.daily_usd_limit,
+        "rpm": policy.rpm,
+        "burst": policy.burst,
+        "tpm": policy.tpm,
+        "allowed_models": sorted(policy.allowed_models) if policy.allowed_models is not None else None,
+        "priority": policy.priority,
+        "max_output_tokens": policy.max_output_tokens,
+    }
+
+
+@app.get("/admin/policies")
+async def get_policies(request: Request):
+    if not getattr(request.state, "is_admin", False):
+        return _forbidden()
+
+    snapshot = policy_store.snapshot
+    return {
+        "source": snapshot.source,
+        "default": _policy_view(snapshot.default),
+        "tenants": {key: _policy_view(policy) for key, policy in snapshot.tenants.items()},
+    }
+
+
+@app.post("/admin/policies/reload")
+async def reload_policies(request: Request):
+    if not getattr(request.state, "is_admin", False):
+        return _forbidden()
+
+    changed = await asyncio.to_thread(policy_store.reload, True)
+    return {"reloaded": changed, "source": policy_store.snapshot.source}
+
+
+@app.get("/admin/cluster/spend")
+async def cluster_spend(request: Request, date: str | None = None):
+    # Today's spend per client across the cluster: this node's plus the peers'
+    if not getattr(request.state, "is_admin", False):
+        return _forbidden()
+    if cluster.node is None:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "error": {
+                    "code": "cluster_disabled",
+                    "message": "Cluster mode is off",
+                }
+            },
+        )
+
+    date = date or today_utc()
+    local = await asyncio.to_thread(get_spend_for_date, date)
+    remote = cluster.node.remote_spend_for_date(date)
+
+    return {
+        "date": date,
+        "node": cluster.node.node_id,
+        "data": [
+            {
+                "client_key_hash": client,
+                "usd_spent": local.get(client, 0.0) + remote.get(client, 0.0),
+                "usd_spent_here": local.get(client, 0.0),
+            }
+            for client in sorted(local.keys() | remote.keys())
+        ],
+    }
+
+
+@app.get("/debug/traces")
+async def debug_traces(request: Request):
+    if not getattr(request.state, "is_admin", False):
+        return _forbidden()
+
+    return FastJSONResponse(trace_buffer.snapshot())
+
+
+@app.get("/admin/profile")
+async def profile(
+    request: Request,
+    seconds: float = 5.0,
+    interval_ms: float = 5.0,
+    thread: str = "loop",
+):
+    """Samples stacks for `seconds` and returns them collapsed, for flamegraphs."""
+    if not getattr(request.state, "is_admin", False):
+        return _forbidden()
+
+    if thread not in ("loop", "all") or not 0 < seconds <= 60 or not 1 <= interval_ms <= 1000:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": {
+                    "code": "invalid_request",
+                    "message": "thread must be 'loop' or 'all', seconds in (0, 60], interval_ms in [1, 1000]",
+                }
+            },
+        )
+
+    if profile_lock.locked():
+        return JSONResponse(
+            status_code=409,
+            content={
+                "error": {
+                    "code": "profile_in_progress",
+                    "message": "Another profile is already running",
+                }
+            },
+        )
+
+    async with profile_lock:
+        # The sampler runs in a worker thread; the loop keeps serving (and
+        # shows up in the samples) meanwhile
+        counts = await asyncio.to_thread(
+            sample_stacks,
+            seconds,
+            interval_ms,
+            threading.get_ident() if thread == "loop" else None,
+        )
+
+    return Response(content=collapsed(counts), media_type="text/plain")
+
+
+@app.get("/admin/export")
+async def export_requests(
+    request: Request,
+    format: str = "ndjson",
+    start: str | None = None,
+    end: str | None = None,
+    client: str | None = None,
+    model: str | None = None,
+    status: int | None = None,
+):
+    if not getattr(request.state, "is_admin", False):
+        return _forbidden()
+
+    if format not in EXPORT_FORMATS:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": {
+                    "code": "invalid_request",
+                    "message": f"format must be one of: {', '.join(sorted(EXPORT_FORMATS))}",
+                }
+            },
+        )
+
+    rows = iter_request_rows(
+        start=start,
+        end=end,
+        client_key_hash=client,
+        model=model,
+        status_code=status,
+    )
+
+    # Sync generator: Starlette pulls each chunk in the threadpool
+    return StreamingResponse(
+        encode_rows(rows, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"content-disposition": f"attachment; filename=requests.{format}"},
+    )
+
+
+def _batch_not_found(batch_id: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=404,
+        content={
+            "error": {
+                "code": "batch_not_found",
+                "message": f"No batch '{batch_id}'",
+            }
+        },
+    )
+
+
+def _own_batch(request: Request, batch_id: str) -> dict | None:
+    job = get_batch(batch_id)
+    if job is None or job["client_key_hash"] != getattr(request.state, "client_key_hash", "unknown"):
+        return None
+    return job
+
+
+@app.post("/v1/batches")
+async def create_batch_job(request: Request, model: str = "gpt-4o"):
+    client_key_hash = getattr(request.state, "client_key_hash", "unknown")
+
+    try:
+        items = await asyncio.to_thread(
+            parse_batch, await request.body(), model, settings.CIRCUIT_BATCH_MAX_ITEMS
+        )
+    except BatchInputError as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": {
+                    "code": "invalid_batch",
+                    "message": str(e),
+                }
+            },
+        )
+
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    await asyncio.to_thread(
+        create_batch, batch_id, client_key_hash, datetime.now(timezone.utc).isoformat(), items
+    )
+    metrics.inc("batches_created", client=client_key_hash)
+
+    if batch_runner is not None:
+        batch_runner.wake()
+    return batch_view(get_batch(batch_id))
+
+
+@app.get("/v1/batches")
+async def list_batch_jobs(request: Request, limit: int = 20):
+    client_key_hash = getattr(request.state, "client_key_hash", "unknown")
+    return {
+        "object": "list",
+        "data": [batch_view(job) for job in list_batches(client_key_hash, limit)],
+    }
+
+
+@app.get("/v1/batches/{batch_id}")
+async def get_batch_job(request: Request, batch_id: str):
+    job = _own_batch(request, batch_id)
+    if job is None:
+        return _batch_not_found(batch_id)
+    return batch_view(job)
+
+
+@app.post("/v1/batches/{batch_id}/cancel")
+async def cancel_batch_job(request: Request, batch_id: str):
+    if _own_batch(request, batch_id) is None:
+        return _batch_not_found(batch_id)
+
+    request_cancel(batch_id, datetime.now(timezone.utc).isoformat())
+    if batch_runner is not None:
+        batch_runner.cancel(batch_id)
+    return batch_view(get_batch(batch_id))
+
+
+@app.get("/v1/batches/{batch_id}/output")
+async def batch_job_output(request: Request, batch_id: str):
+    if _own_batch(request, batch_id) is None:
+        return _batch_not_found(batch_id)
+
+    path = output_path(batch_id)
+
+    def read_output():
+        # Only what was written so far: a running job keeps appending
+        if not path.exists():
+            return
+        remaining = path.stat().st_size
+        with open(path, "rb") as f:
+            while remaining > 0:
+                chunk = f.read(min(remaining, 64 * 1024))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    # Sync generator: Starlette pulls each chunk in the threadpool
+    return StreamingResponse(
+        read_output(),
+        media_type="application/x-ndjson",
+        headers={"content-disposition": f"attachment; filename={batch_id}.jsonl"},
+    )
+
+
+async def _complete(target, payload: dict, passthrough: bool):
+    """One upstream completion; n > 1 fans out when `target` can't do it natively."""
+    n = payload.get("n") or 1
+    if n > 1 and not target.supports_n:
+        metrics.inc("fanout_requests")
+        return await fan_out(
+            target,
+            payload,
+            n,
+            concurrency=settings.CIRCUIT_FANOUT_CONCURRENCY,
+            allow_partial=settings.CIRCUIT_FANOUT_PARTIAL,
+        )
+
+    if passthrough:
+        return await target.chat_completions_raw(payload)
+    return await target.chat_completions(payload)
+
+
+def _ordered_providers() -> list:
+    """Primary then fallback, unless the health prober has seen the primary degrade."""
+    providers = [provider, fallback_provider]
+    if health_prober is None:
+        return providers
+
+    ordered = health_prober.order(providers)
+    if ordered[0] is not provider:
+        metrics.inc("health_reroutes")
+    return ordered
+
+
+async def _count_in_flight(events):
+    """Keeps an open stream counted as interactive load until it ends."""
+    global interactive_in_flight
+
+    interactive_in_flight += 1
+    try:
+        async for event in events:
+            yield event
+    finally:
+        interactive_in_flight -= 1
+        await events.aclose()
+
+
+async def _stream_chat_completions(
+    payload: dict,
+    request_id: str,
+    client_key_hash: str,
+    policy: TenantPolicy,
+):
+    model = payload.get("model", "unknown")
+    include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+
+    # Slow clients already hold the streaming memory budget: shed new
+    # streams before opening anything upstream, lowest priority first
+    if not stream_budget.admit(policy.priority):
+        metrics.inc("total_503", client=client_key_hash)
+        metrics.inc("streams_shed", client=client_key_hash)
+
+        return JSONResponse(
+            status_code=503,
+            headers={"retry-after": "1"},
+            content={
+                "error": {
+                    "code": "overloaded",
+                    "message": "Too many buffered streams. Retry shortly.",
+                }
+            },
+        )
+
+    # Ask every upstream for its trailing usage chunk; relay_stream strips it
+    # again unless the client asked for it too
+    upstream_payload = {
+        **payload,
+        "stream_options": {**(payload.get("stream_options") or {}), "include_usage": True},
+    }
+
+    providers = _ordered_providers()
+    stream_provider, stream, first, error = await open_stream(providers, upstream_payload)
+
+    session = StreamSession(
+        request_id=request_id,
+        client_key_hash=client_key_hash,
+        provider_name=type(stream_provider or providers[0]).__name__,
+        model=_served_model(stream_provider, model),
+        breaker=breaker,
+        daily_usd_limit=policy.daily_usd_limit,
+        keep_output=settings.CIRCUIT_STREAM_RESUME,
+    )
+    session.record_prompt(payload.get("messages", []))
+
+    if stream is None:
+        session.finalize_unavailable(status_code=503)
+        metrics.inc("total_503", client=client_key_hash)
+
+        return JSONResponse(
+            status_code=503,
+            content={
+                "error": {
+                    "code": "fallback_failed",
+                    "message": f"Primary and fallback providers both failed: {error.message}",
+                }
+            },
+        )
+
+    if stream_provider is not providers[0]:
+        metrics.inc("fallback_hits", client=client_key_hash)
+
+    resume_providers = []
+    if settings.CIRCUIT_STREAM_RESUME:
+        resume_providers = providers[providers.index(stream_provider) + 1:]
+
+    events = relay_stream(
+        stream,
+        first,
+        session,
+        include_usage,
+        resume_providers=resume_providers,
+        payload=upstream_payload,
+    )
+
+    return EventStreamResponse(
+        buffered(_count_in_flight(events), settings.CIRCUIT_STREAM_BUFFER_BYTES, stream_budget),
+        headers={"cache-control": "no-cache"},
+    )
+
+
+@app.post(
+    "/v1/chat/completions",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": ChatCompletionRequest.model_json_schema()}},
+        }
+    },
+)
+async def chat_completions(request: Request):
+    global interactive_in_flight
+
+    interactive_in_flight += 1
+    try:
+        key = request.headers.get("idempotency-key")
+        if key and idempotency_store is not None:
+            return await _idempotent_chat_completions(request, key)
+        return await _chat_completions(request)
+    finally:
+        interactive_in_flight -= 1
+
+
+async def _idempotent_chat_completions(request: Request, key: str):
+    """Replays the stored response for a repeated Idempotency-Key instead of calling upstream again."""
+    client_key_hash = getattr(request.state, "client_key_hash", "unknown")
+    fingerprint = hashlib.sha256(await request.body()).hexdigest()
+
+    try:
+        stored = await idempotency_store.begin(client_key_hash, key, fingerprint)
+    except IdempotencyConflict:
+        return JSONResponse(
+            status_code=422,
+            content={
+                "error": {
+                    "code": "idempotency_key_reused",
+                    "message": "This Idempotency-Key was already used with a different request body",
+                }
+            },
+        )
+    except IdempotencyInProgress:
+        return JSONResponse(
+            status_code=409,
+            headers={"retry-after": "1"},
+            content={
+                "error": {
+                    "code": "idempotency_in_progress",
+                    "message": "A request with this Idempotency-Key is still running",
+                }
+            },
+        )
+
+    if stored is not None:
+        metrics.inc("idempotent_replays", client=client_key_hash)
+        return stored.response()
+
+    response = None
+    try:
+        response = await _chat_completions(request)
+        return response
+    finally:
+        idempotency_store.finish(client_key_hash, key, response)
+
+
+async def _chat_completions(request: Request):
     client_key_hash = getattr(request.state, "client_key_hash", "unknown")
     request_id = getattr(request.state, "request_id", "unknown")
 
+    body = await request.body()
+    try:
+        payload = chat_completion_payload.validate_json(body)
+    except ValidationError as e:
+        return JSONResponse(
+            status_code=422,
+            content={
+                "error": {
+                    "code": "invalid_request",
+                    "message": str(e),
+                }
+            },
+        )
+
+    policy = policy_store.get(client_key_hash)
+    model = payload.get("model", "unknown")
+    n = payload.get("n") or 1
+
+    if not 1 <= n <= settings.CIRCUIT_MAX_N:
+        return JSONResponse(
+            status_code=422,
+            content={
+                "error": {
+                    "code": "invalid_request",
+                    "message": f"n must be between 1 and {settings.CIRCUIT_MAX_N}",
+                }
+            },
+        )
+
+    if not policy.allows_model(model):
+        return JSONResponse(
+            status_code=403,
+            content={
+                "error": {
+                    "code": "model_not_allowed",
+                    "message": f"Model '{model}' is not allowed for this API key",
+                }
+            },
+        )
+
     # rate limiting
-    if not rate_limiter.allow(client_key_hash):
+    with span("rate_limit"):
+        rate_ok = not policy.rpm or rate_limiter.allow(
+            client_key_hash,
+            capacity=max(1, policy.burst),
+            refill_rate_per_sec=policy.rpm / 60,
+        )
+
+    if not rate_ok:
         metrics.inc("total_429", client=client_key_hash)
         metrics.inc("rate_limit_hits", client=client_key_hash)
 
@@ -86,98 +829,381 @@ async def chat_completions(request: Request, body: ChatCompletionRequest):
             },
         )
 
+    requested_max = payload.get("max_tokens")
+    if not requested_max or requested_max > policy.max_output_tokens:
+        payload["max_tokens"] = policy.max_output_tokens
+
+    # Rough token estimate (~4 bytes per prompt token plus the output cap),
+    # so the check needs no tokenizer pass
+    with span("rate_limit"):
+        tokens_ok = not policy.tpm or token_limiter.allow(
+            client_key_hash,
+            cost=len(body) / 4 + payload["max_tokens"] * n,
+            capacity=policy.tpm,
+            refill_rate_per_sec=policy.tpm / 60,
+        )
+
+    if not tokens_ok:
+        metrics.inc("total_429", client=client_key_hash)
+        metrics.inc("token_rate_limit_hits", client=client_key_hash)
+
+        return JSONResponse(
+            status_code=429,
+            content={
+                "error": {
+                    "code": "token_rate_limited",
+                    "message": "Token rate limit exceeded. Slow down.",
+                }
+            },
+        )
+
+    with span("quota"):
+        quota_ok, spent, limit = check_daily_quota(client_key_hash, 0.0, policy.daily_usd_limit)
+    if not quota_ok or spent >= limit:
+        metrics.inc("total_429", client=client_key_hash)
+        metrics.inc("quota_exceeded", client=client_key_hash)
+
+        return JSONResponse(
+            status_code=429,
+            content={
+                "error": {
+                    "code": "quota_exceeded",
+                    "message": f"Daily spend limit of ${limit:.2f} reached",
+                }
+            },
+        )
+
     metrics.inc("total_requests", client=client_key_hash)
 
-    payload = body.model_dump()
-    model = payload.get("model", "unknown")
-    provider_used = type(provider).__name__
+    if payload.get("stream"):
+        return await _stream_chat_completions(payload, request_id, client_key_hash, policy)
+
+    passthrough = settings.CIRCUIT_PASSTHROUGH
+
+    probe = None
+    if near_dup_cache is not None:
+        probe = near_dup_cache.probe(client_key_hash, payload)
+        cached = near_dup_cache.get(probe)
+
+        if cached is not None:
+            return _cached_response(*cached, model, passthrough, request_id, client_key_hash)
+        metrics.inc("near_dup_misses", client=client_key_hash)
+
+    result, served = await _call_upstream(payload, passthrough, model, request_id, client_key_hash)
+    if result is None:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "error": {
+                    "code": "fallback_failed",
+                    "message": "Primary and fallback providers both failed",
+                }
+            },
+        )
+
+    provider_used = type(served).__name__
+
+    if isinstance(result, RawCompletion):
+        usage = scan_usage(result.body)
+        if usage is not None:
+            if probe is not None:
+                near_dup_cache.put(probe, result.body)
+            served_model = _served_model(served, model, scan_model(result.body))
+            return _passthrough_response(result, usage, served_model, provider_used, request_id, client_key_hash)
+
+        # No usable usage block: fall back to the decoded path
+        latency_ms = result.latency_ms
+        result = loads(result.body)
+        result["latency_ms"] = latency_ms
+
+    _, _, cost_usd = _settle_completion(result, payload, served, request_id, client_key_hash)
+
+    if probe is not None:
+        near_dup_cache.put(probe, dumps(result))
+
+    result["circuit"] = {
+        "request_id": request_id,
+        "client_key_hash": client_key_hash,
+        "cost_usd": cost_usd,
+        "breaker_state": breaker.state.value,
+    }
+
+    with span("serialize"):
+        response = FastJSONResponse(result)
+    return response
+
+
+async def _call_upstream(payload: dict, passthrough: bool, model: str, request_id: str, client_key_hash: str):
+    """
+    Primary, then fallback (in health order). Returns (result, provider that
+    served it), or (None, None) after recording the 503 when both fail.
+    """
+    primary, fallback = _ordered_providers()
 
     # PRIMARY + RETRY
     try:
-        result = await provider.chat_completions(payload)
+        with span("upstream"):
+            result = await _complete(primary, payload, passthrough)
 
         if isinstance(result, dict) and "error" in result:
+            _settle_abandoned(result, payload, primary, request_id, client_key_hash)
             raise RuntimeError(result["error"].get("message"))
 
     except Exception as e:
-        print("PRIMARY FAILED:", repr(e))
+        logger.warning("primary failed: %r", e)
 
         # FALLBACK
         try:
-            result = await fallback_provider.chat_completions(payload)
+            with span("fallback"):
+                result = await _complete(fallback, payload, passthrough)
 
             if isinstance(result, dict) and "error" in result:
+                _settle_abandoned(result, payload, fallback, request_id, client_key_hash)
                 raise RuntimeError(result["error"].get("message"))
 
-            provider_used = type(fallback_provider).__name__
             metrics.inc("fallback_hits", client=client_key_hash)
 
         except Exception as e:
-            print("FALLBACK FAILED:", repr(e))
+            logger.warning("fallback failed: %r", e)
 
             breaker.record_failure()
 
             record_request(
                 request_id=request_id,
                 timestamp=datetime.now(timezone.utc).isoformat(),
-                provider=provider_used,
+                provider=type(primary).__name__,
                 model=model,
                 status_code=503,
                 latency_ms=0,
                 tokens_input=0,
                 tokens_output=0,
                 cost_usd=0.0,
+                client_key_hash=client_key_hash,
             )
 
             metrics.inc("total_503", client=client_key_hash)
+            return None, None
 
-            return JSONResponse(
-                status_code=503,
-                content={
-                    "error": {
-                        "code": "fallback_failed",
-                        "message": "Primary and fallback providers both failed",
-                    }
-                },
-            )
+        # SUCCESS
+        breaker.record_success()
+        return result, fallback
 
     # SUCCESS
     breaker.record_success()
+    return result, primary
+
+
+def _settle_completion(
+    result: dict,
+    payload: dict,
+    served,
+    request_id: str,
+    client_key_hash: str,
+    status_code: int = 200,
+):
+    """
+    Counts tokens, charges and records a decoded completion with the model
+    that served it. Returns (prompt_tokens, completion_tokens, cost_usd).
+    """
+    model = _served_model(served, payload.get("model", "unknown"), result.get("model"))
+    n = payload.get("n") or 1
+    choices = result.get("choices") or []
+
+    # A fanned-out n > 1 pays for the prompt once per upstream call
+    calls = len(choices) if n > 1 and not served.supports_n else 1
+    prompt_tokens = count_tokens_from_messages(model, payload.get("messages", [])) * calls
+
+    completion_tokens = sum(
+        count_tokens_from_text(model, (choice.get("message") or {}).get("content") or "")
+        for choice in choices
+    )
+    cost_usd = estimate_cost_usd(model, prompt_tokens, completion_tokens)
+
+    if status_code == 200:
+        metrics.inc("total_success", client=client_key_hash)
+    metrics.inc("total_tokens_input", prompt_tokens, client=client_key_hash)
+    metrics.inc("total_tokens_output", completion_tokens, client=client_key_hash)
+    metrics.inc("total_cost_usd", cost_usd, client=client_key_hash)
+
+    if cost_usd > 0:
+        record_spend(client_key_hash, today_utc(), cost_usd)
+
+    record_request(
+        request_id=request_id,
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        provider=type(served).__name__,
+        model=model,
+        status_code=status_code,
+        latency_ms=result.get("latency_ms", 0),
+        tokens_input=prompt_tokens,
+        tokens_output=completion_tokens,
+        cost_usd=cost_usd,
+        client_key_hash=client_key_hash,
+    )
+
+    return prompt_tokens, completion_tokens, cost_usd
+
+
+def _served_model(served, requested: str, reported: str | None = None) -> str:
+    """
+    The model whose tokenizer and price apply: the fallback's own model, else
+    what the upstream reported, else what the client asked for.
+    """
+    return (served and served.model) or reported or requested
+
+
+def _settle_abandoned(error: dict, payload: dict, target, request_id: str, client_key_hash: str) -> None:
+    """A failed fan-out still pays for the calls that had finished, as a 502 row."""
+    completed = error.get("completed")
+    if completed:
+        _settle_completion(completed, payload, target, request_id, client_key_hash, status_code=502)
 
-    messages = payload.get("messages", [])
-    prompt_tokens = count_tokens_from_messages(model, messages)
 
-    assistant_content = (
-        result.get("choices", [{}])[0]
-        .get("message", {})
-        .get("content", "")
+def _cached_response(
+    body: bytes,
+    similarity: float,
+    model: str,
+    passthrough: bool,
+    request_id: str,
+    client_key_hash: str,
+) -> Response:
+    """Serves a near-duplicate hit; no upstream call, so nothing is charged."""
+    metrics.inc("total_success", client=client_key_hash)
+    metrics.inc("near_dup_hits", client=client_key_hash)
+
+    record_request(
+        request_id=request_id,
+        timestamp=datetime.now(timezone.utc).isoformat(),
+        provider="NearDupCache",
+        model=model,
+        status_code=200,
+        latency_ms=0,
+        tokens_input=0,
+        tokens_output=0,
+        cost_usd=0.0,
+        client_key_hash=client_key_hash,
     )
 
-    completion_tokens = count_tokens_from_text(model, assistant_content)
+    if passthrough:
+        headers = circuit_headers(
+            request_id=request_id,
+            client_key_hash=client_key_hash,
+            provider="NearDupCache",
+            model=scan_model(body) or model,
+            cost_usd=0.0,
+            breaker_state=breaker.state.value,
+            latency_ms=0,
+        )
+        headers["x-circuit-cache-similarity"] = f"{similarity:.4f}"
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    result = loads(body)
+    result["circuit"] = {
+        "request_id": request_id,
+        "client_key_hash": client_key_hash,
+        "cost_usd": 0.0,
+        "breaker_state": breaker.state.value,
+        "cache": {"type": "near_duplicate", "similarity": round(similarity, 4)},
+    }
+
+    with span("serialize"):
+        response = FastJSONResponse(result)
+    return response
+
+
+def _passthrough_response(
+    raw: RawCompletion,
+    usage: dict,
+    model: str,
+    provider_used: str,
+    request_id: str,
+    client_key_hash: str,
+) -> Response:
+    """Forwards the upstream body unchanged, settling from its own usage block."""
+    prompt_tokens = usage["prompt_tokens"]
+    completion_tokens = usage["completion_tokens"]
     cost_usd = estimate_cost_usd(model, prompt_tokens, completion_tokens)
 
     metrics.inc("total_success", client=client_key_hash)
+    metrics.inc("passthrough_responses", client=client_key_hash)
     metrics.inc("total_tokens_input", prompt_tokens, client=client_key_hash)
     metrics.inc("total_tokens_output", completion_tokens, client=client_key_hash)
     metrics.inc("total_cost_usd", cost_usd, client=client_key_hash)
 
+    if cost_usd > 0:
+        record_spend(client_key_hash, today_utc(), cost_usd)
+
     record_request(
         request_id=request_id,
         timestamp=datetime.now(timezone.utc).isoformat(),
         provider=provider_used,
         model=model,
         status_code=200,
-        latency_ms=result.get("latency_ms", 0),
+        latency_ms=raw.latency_ms,
         tokens_input=prompt_tokens,
         tokens_output=completion_tokens,
         cost_usd=cost_usd,
+        client_key_hash=client_key_hash,
+    )
+
+    return Response(
+        content=raw.body,
+        media_type="application/json",
+        headers=circuit_headers(
+            request_id=request_id,
+            client_key_hash=client_key_hash,
+            provider=provider_used,
+            model=scan_model(raw.body) or model,
+            cost_usd=cost_usd,
+            breaker_state=breaker.state.value,
+            latency_ms=raw.latency_ms,
+        ),
     )
 
+
+async def _batch_complete(payload: dict, request_id: str, client_key_hash: str):
+    """
+    One batch item, through the tenant's model policy, output cap and daily
+    quota like an interactive request. Rate limits don't apply: the runner
+    paces itself. Returns (status_code, body, prompt_tokens,
+    completion_tokens, cost_usd).
+    """
+    policy = policy_store.get(client_key_hash)
+    model = payload.get("model", "unknown")
+    n = payload.get("n") or 1
+
+    if not 1 <= n <= settings.CIRCUIT_MAX_N:
+        error = {"code": "invalid_request", "message": f"n must be between 1 and {settings.CIRCUIT_MAX_N}"}
+        return 422, {"error": error}, 0, 0, 0.0
+
+    if not policy.allows_model(model):
+        error = {"code": "model_not_allowed", "message": f"Model '{model}' is not allowed for this API key"}
+        return 403, {"error": error}, 0, 0, 0.0
+
+    requested_max = payload.get("max_tokens")
+    if not requested_max or requested_max > policy.max_output_tokens:
+        payload["max_tokens"] = policy.max_output_tokens
+
+    quota_ok, spent, limit = check_daily_quota(client_key_hash, 0.0, policy.daily_usd_limit)
+    if not quota_ok or spent >= limit:
+        metrics.inc("quota_exceeded", client=client_key_hash)
+        error = {"code": "quota_exceeded", "message": f"Daily spend limit of ${limit:.2f} reached"}
+        return 429, {"error": error}, 0, 0, 0.0
+
+    metrics.inc("batch_requests", client=client_key_hash)
+
+    result, served = await _call_upstream(payload, False, model, request_id, client_key_hash)
+    if result is None:
+        error = {"code": "fallback_failed", "message": "Primary and fallback providers both failed"}
+        return 503, {"error": error}, 0, 0, 0.0
+
+    prompt_tokens, completion_tokens, cost_usd = _settle_completion(
+        result, payload, served, request_id, client_key_hash
+    )
     result["circuit"] = {
         "request_id": request_id,
         "client_key_hash": client_key_hash,
         "cost_usd": cost_usd,
         "breaker_state": breaker.state.value,
     }
-
-    return result
\ No newline at end of file
+    return 200, result, prompt_tokens, completion_tokens, cost_usd
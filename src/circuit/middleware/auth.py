@@ -6,12 +6,23 @@ from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 
 from circuit.config import settings
+from circuit.observability.tracing import span
+
+
+# Liveness/readiness probes carry no API key
+PUBLIC_PATHS = {"/livez", "/health"}
 
 
 class AuthMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
-        raw = request.headers.get("authorization") or ""
-        token = raw.replace("Bearer", "").strip()
+        if request.url.path in PUBLIC_PATHS:
+            return await call_next(request)
+
+        with span("auth"):
+            raw = request.headers.get("authorization") or ""
+            token = raw.replace("Bearer", "").strip()
+            is_admin = token in settings.admin_keys
+            valid = is_admin or token in settings.api_keys
 
         if not token:
             return JSONResponse(
@@ -19,11 +30,12 @@ class AuthMiddleware(BaseHTTPMiddleware):
                 content={"error": {"code": "authentication_error", "message": "Missing API key"}},
             )
 
-        if token not in settings.api_keys:
+        if not valid:
             return JSONResponse(
                 status_code=401,
                 content={"error": {"code": "authentication_error", "message": "Invalid API key"}},
             )
 
         request.state.client_key_hash = hashlib.sha256(token.encode()).hexdigest()[:12]
+        request.state.is_admin = is_admin
         return await call_next(request)
\ No newline at end of file
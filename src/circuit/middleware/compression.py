@@ -0,0 +1,205 @@
+"""
+Negotiated response compression that leaves event streams usable.
+
+Plain ASGI, so bodies are compressed message by message instead of being
+collected first. Event streams are flushed after every body message (each
+carries whole SSE events), so the client can decode every event the
+moment it arrives and TTFT is unchanged. Other streamed bodies (exports,
+batch output) are only flushed at the end. Responses that announce a
+`content-length` below `min_bytes`, or that fit in one message below it,
+are sent as they are.
+
+gzip is always available; zstd and br need the `zstandard` and `brotli`
+packages (`pip install circuit-gateway[compression]`).
+"""
+
+from __future__ import annotations
+
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from circuit.observability.metrics import metrics
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/",
+)
+
+
+class _Gzip:
+    def __init__(self) -> None:
+        self._c = zlib.compressobj(5, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._c.flush(zlib.Z_FINISH)
+
+
+class _Zstd:
+    def __init__(self) -> None:
+        self._c = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._c.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+class _Brotli:
+    def __init__(self) -> None:
+        self._c = brotli.Compressor(quality=4)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+def available_encodings() -> Dict[str, type]:
+    encodings = {"gzip": _Gzip}
+    if zstandard is not None:
+        encodings["zstd"] = _Zstd
+    if brotli is not None:
+        encodings["br"] = _Brotli
+    return encodings
+
+
+def accepted_encodings(header: str) -> List[str]:
+    """Codings from an Accept-Encoding header with a non-zero q."""
+    accepted = []
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.append(name.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware:
+    def __init__(self, app, min_bytes: int = 1024, encodings: Sequence[str] = ("gzip",)) -> None:
+        self.app = app
+        self.min_bytes = min_bytes
+
+        # Server preference order, limited to what is installed
+        available = available_encodings()
+        self.encodings = {name: available[name] for name in encodings if name in available}
+
+    def _negotiate(self, scope) -> Optional[str]:
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if "*" in accepted:
+            return next(iter(self.encodings), None)
+        return next((name for name in self.encodings if name in accepted), None)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self._negotiate(scope)
+        if encoding is None or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        event_stream = False
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start, compressor, event_stream, passthrough
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                content_length = headers.get("content-length")
+
+                passthrough = (
+                    "content-encoding" in headers
+                    or message["status"] in (204, 304)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (content_length is not None and int(content_length) < self.min_bytes)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    # Held until the first body message shows how big it is
+                    start = message
+                    event_stream = content_type.startswith("text/event-stream")
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                if not more_body and len(body) < self.min_bytes:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                compressor = self.encodings[encoding]()
+                headers = MutableHeaders(raw=start["headers"])
+                headers["content-encoding"] = encoding
+                headers.add_vary_header("accept-encoding")
+                del headers["content-length"]
+
+            started = time.thread_time()
+            data = compressor.compress(body)
+            if not more_body:
+                data += compressor.finish()
+            elif event_stream:
+                data += compressor.flush()
+            cpu_ms = (time.thread_time() - started) * 1000
+
+            metrics.record_compression(len(body), len(data), cpu_ms)
+
+            if start is not None:
+                if not more_body:
+                    # Single message: the compressed length is known
+                    MutableHeaders(raw=start["headers"])["content-length"] = str(len(data))
+                metrics.inc("compressed_responses")
+                await send(start)
+                start = None
+
+            if data or not more_body:
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, compressing_send)
@@ -3,17 +3,25 @@ import uuid
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
 
+# Longest part of a client's x-request-id kept in the internal id
+MAX_CLIENT_ID_CHARS = 64
+
 
 class RequestIDMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
-        request_id = request.headers.get("x-request-id")
+        client_request_id = request.headers.get("x-request-id")
 
-        if not request_id:
-            request_id = str(uuid.uuid4())
+        # The request log is keyed by request_id, so it is always unique;
+        # a client's own id is kept as its prefix for correlation
+        request_id = str(uuid.uuid4())
+        if client_request_id:
+            request_id = f"{client_request_id[:MAX_CLIENT_ID_CHARS]}.{uuid.uuid4().hex[:12]}"
 
         request.state.request_id = request_id
+        request.state.client_request_id = client_request_id
 
         response = await call_next(request)
-        response.headers["x-request-id"] = request_id
+        response.headers["x-request-id"] = client_request_id or request_id
+        response.headers["x-circuit-request-id"] = request_id
 
-        return response
\ No newline at end of file
+        return response
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+
+from circuit.observability.metrics import metrics
+
+logger = logging.getLogger("circuit.request")
+
+
+class ClientStalled(Exception):
+    pass
+
+
+class StallGuardMiddleware:
+    """
+    Disconnects clients that stop reading an event stream.
+
+    Plain ASGI and added last (outermost), because only there is `send` the
+    server's own, which blocks while the client's socket buffer is full.
+    Inside the BaseHTTPMiddleware stack a stalled send just parks the
+    response task. When one SSE body write stays blocked for `stall_seconds`,
+    the app gets ClientStalled from `send` and unwinds (settling the stream
+    as 499). Returning with the response incomplete makes the server close
+    the connection.
+    """
+
+    def __init__(self, app, stall_seconds: float) -> None:
+        self.app = app
+        self.stall_seconds = stall_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.stall_seconds:
+            await self.app(scope, receive, send)
+            return
+
+        event_stream = False
+        stalled = False
+
+        async def guarded_send(message):
+            nonlocal event_stream, stalled
+
+            if message["type"] == "http.response.start":
+                event_stream = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", [])
+                )
+            elif event_stream and message.get("more_body"):
+                try:
+                    await asyncio.wait_for(send(message), self.stall_seconds)
+                    return
+                except asyncio.TimeoutError:
+                    stalled = True
+                    raise ClientStalled()
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, guarded_send)
+        except Exception:
+            # The app's middleware may re-raise it wrapped in a group
+            if not stalled:
+                raise
+
+            state = scope.get("state") or {}
+            metrics.inc("stream_stall_disconnects", client=state.get("client_key_hash"))
+            logger.warning(
+                "%s client stopped reading for %.0fs, closing the stream",
+                state.get("request_id", "-"),
+                self.stall_seconds,
+            )
@@ -0,0 +1,25 @@
+from fastapi import Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from circuit.config import settings
+from circuit.observability.tracing import finish_trace, start_trace
+
+
+class TracingMiddleware(BaseHTTPMiddleware):
+    """Outermost timed middleware: every other stage is timed inside its trace."""
+
+    async def dispatch(self, request: Request, call_next):
+        trace = start_trace(request.method, request.url.path)
+
+        response = await call_next(request)
+
+        trace.request_id = getattr(request.state, "request_id", "-")
+        trace.status_code = response.status_code
+        # Streaming bodies are still running here; the trace covers up to
+        # the response headers
+        finish_trace(trace)
+
+        if settings.CIRCUIT_SERVER_TIMING:
+            response.headers["server-timing"] = trace.server_timing()
+
+        return response
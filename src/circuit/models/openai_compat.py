@@ -1,5 +1,7 @@
 from typing import Any, Dict, List, Literal, Optional
-from pydantic import BaseModel, Field
+
+from pydantic import BaseModel, Field, TypeAdapter
+from typing_extensions import Required, TypedDict
 
 
 # Request models
@@ -19,9 +21,36 @@ class ChatCompletionRequest(BaseModel):
     stream: Optional[bool] = False
     max_tokens: Optional[int] = None
     stop: Optional[List[str]] = None
+    stream_options: Optional[Dict[str, Any]] = None
 
     user: Optional[str] = None
 
+
+# Hot-path request shape. Validated straight from the raw body bytes into
+# plain dicts, so there is no model instance + model_dump() second copy.
+# Fields the client did not send stay absent instead of being defaulted.
+class ChatMessagePayload(TypedDict):
+    role: Literal["system", "user", "assistant"]
+    content: str
+
+
+class ChatCompletionPayload(TypedDict, total=False):
+    model: Required[str]
+    messages: Required[List[ChatMessagePayload]]
+
+    temperature: Optional[float]
+    top_p: Optional[float]
+    n: Optional[int]
+    stream: Optional[bool]
+    max_tokens: Optional[int]
+    stop: Optional[List[str]]
+    stream_options: Optional[Dict[str, Any]]
+
+    user: Optional[str]
+
+
+chat_completion_payload = TypeAdapter(ChatCompletionPayload)
+
 # Response models
 class ChatCompletionChoice(BaseModel):
     index: int
@@ -0,0 +1,268 @@
+"""
+Near-duplicate response cache for non-streaming chat completions.
+
+Prompts are normalized with per-tenant rules (whitespace, timestamps, ids,
+numbers...), shingled into word 3-grams and sketched with MinHash. An LSH
+index over signature bands finds candidates; the estimated Jaccard
+similarity is then checked against a threshold. Everything is in-process:
+no embedding service. NumPy is used for the signature and similarity math
+when installed (`pip install circuit-gateway[speed]`), with a pure-Python
+fallback.
+
+Entries are scoped by tenant, model, generation parameters and the
+normalized last user message, so one client never sees another client's
+completions, and a long shared system or RAG prefix cannot make two
+different questions look alike: only the rest of the conversation is
+matched approximately.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from circuit.observability.metrics import metrics
+from circuit.serialization import dumps
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+
+_PRIME = (1 << 61) - 1
+_MASK32 = 0xFFFFFFFF
+_SHINGLE_WORDS = 3
+# Signature columns processed per numpy step; bounds the temporary matrix
+_CHUNK = 4096
+
+_TIMESTAMP = re.compile(
+    r"\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?"
+    r"|\b\d{1,2}:\d{2}(?::\d{2})?\b"
+)
+_UUID = re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b")
+_HEX_ID = re.compile(r"\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{16,}\b")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_WHITESPACE = re.compile(r"\s+")
+
+# Applied in this order, whatever order a tenant lists them in
+NORMALIZATION_RULES: Dict[str, Callable[[str], str]] = {
+    "timestamps": lambda s: _TIMESTAMP.sub("<ts>", s),
+    "uuids": lambda s: _UUID.sub("<id>", s),
+    "hex_ids": lambda s: _HEX_ID.sub("<id>", s),
+    "numbers": lambda s: _NUMBER.sub("<n>", s),
+    "lowercase": str.lower,
+    "whitespace": lambda s: _WHITESPACE.sub(" ", s).strip(),
+}
+
+DEFAULT_RULES = ("timestamps", "uuids", "hex_ids", "whitespace")
+
+# Request fields that do not change what the model is asked to produce
+_UNSCOPED_FIELDS = {"messages", "stream", "stream_options", "user"}
+
+
+def parse_rules(raw: str) -> Dict[str, Tuple[str, ...]]:
+    """
+    Parses CIRCUIT_NEAR_DUP_RULES, e.g. {"default": ["whitespace"],
+    "3f2a9c1b7d4e": ["whitespace", "numbers"]}. Unknown rule names raise.
+    """
+    rules = {"default": DEFAULT_RULES}
+    if raw:
+        for tenant, names in json.loads(raw).items():
+            unknown = set(names) - NORMALIZATION_RULES.keys()
+            if unknown:
+                raise ValueError(f"Unknown normalization rules: {', '.join(sorted(unknown))}")
+            rules[tenant] = tuple(names)
+    return rules
+
+
+def normalize(text: str, rules: Sequence[str]) -> str:
+    for name, rule in NORMALIZATION_RULES.items():
+        if name in rules:
+            text = rule(text)
+    return text
+
+
+def _shingle_hashes(text: str) -> List[int]:
+    words = text.split()
+    if len(words) < _SHINGLE_WORDS:
+        return [hash(text) & _MASK32]
+
+    return list({
+        hash(" ".join(words[i:i + _SHINGLE_WORDS])) & _MASK32
+        for i in range(len(words) - _SHINGLE_WORDS + 1)
+    })
+
+
+@dataclass
+class Probe:
+    namespace: str
+    signature: Any  # numpy uint64 array, or tuple of ints without numpy
+
+
+@dataclass
+class _Entry:
+    namespace: str
+    signature: Any
+    body: bytes
+    expires_at: float
+    band_keys: List[Any]
+
+
+class NearDupCache:
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        max_entries: int = 10_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 3600,
+        rules: Optional[Dict[str, Sequence[str]]] = None,
+        num_perm: int = 64,
+        bands: int = 16,
+        seed: int = 1,
+    ) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.rules = dict(rules or {"default": DEFAULT_RULES})
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        rng = random.Random(seed)
+        a = [rng.randrange(1, 1 << 32) for _ in range(num_perm)]
+        b = [rng.randrange(0, 1 << 32) for _ in range(num_perm)]
+        if np is not None:
+            self._a = np.array(a, dtype=np.uint64)[:, None]
+            self._b = np.array(b, dtype=np.uint64)[:, None]
+        else:
+            self._a, self._b = a, b
+
+        # LRU order: oldest first
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Any, set] = {}
+        self._next_id = 0
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # Sketching
+
+    def signature(self, text: str):
+        hashes = _shingle_hashes(text)
+
+        if np is None:
+            return tuple(
+                min((a * x + b) % _PRIME for x in hashes)
+                for a, b in zip(self._a, self._b)
+            )
+
+        x = np.array(hashes, dtype=np.uint64)
+        sig = np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        for start in range(0, len(x), _CHUNK):
+            # a, b, x < 2**32, so a * x + b cannot overflow uint64
+            block = (self._a * x[start:start + _CHUNK] + self._b) % _PRIME
+            np.minimum(sig, block.min(axis=1), out=sig)
+        return sig
+
+    def _band_keys(self, namespace: str, signature) -> List[Any]:
+        r = self.rows
+        if np is None:
+            return [(namespace, i, signature[i * r:(i + 1) * r]) for i in range(self.bands)]
+        return [(namespace, i, signature[i * r:(i + 1) * r].tobytes()) for i in range(self.bands)]
+
+    def probe(self, client_key_hash: str, payload: Dict[str, Any]) -> Probe:
+        rules = self.rules.get(client_key_hash, self.rules["default"])
+        messages = payload.get("messages") or []
+
+        # The question being asked must match exactly (after normalization)
+        last_user = next((m for m in reversed(messages) if m.get("role") == "user"), {})
+        question = normalize(str(last_user.get("content") or ""), rules)
+
+        scope = {k: v for k, v in payload.items() if k not in _UNSCOPED_FIELDS}
+        namespace = hashlib.blake2b(
+            client_key_hash.encode() + b"\0" + dumps(scope) + b"\0" + question.encode(), digest_size=12
+        ).hexdigest()
+
+        text = "\n".join(f"{m.get('role', '')}: {m.get('content') or ''}" for m in messages)
+        return Probe(namespace=namespace, signature=self.signature(normalize(text, rules)))
+
+    # Lookup / store
+
+    def get(self, probe: Probe) -> Optional[Tuple[bytes, float]]:
+        """Returns (body, estimated similarity) of the closest entry above threshold."""
+        now = time.monotonic()
+
+        candidates = set()
+        for key in self._band_keys(probe.namespace, probe.signature):
+            candidates |= self._buckets.get(key, set())
+
+        live = []
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if entry.expires_at <= now:
+                self._remove(entry_id)
+            else:
+                live.append(entry_id)
+
+        best_id, best = None, 0.0
+        if live:
+            if np is not None:
+                matrix = np.stack([self._entries[i].signature for i in live])
+                scores = (matrix == probe.signature).mean(axis=1)
+                pos = int(scores.argmax())
+                best_id, best = live[pos], float(scores[pos])
+            else:
+                for entry_id in live:
+                    sig = self._entries[entry_id].signature
+                    score = sum(x == y for x, y in zip(sig, probe.signature)) / self.num_perm
+                    if score > best:
+                        best_id, best = entry_id, score
+
+        if best_id is None or best < self.threshold:
+            return None
+
+        self._entries.move_to_end(best_id)
+        return self._entries[best_id].body, best
+
+    def put(self, probe: Probe, body: bytes) -> None:
+        band_keys = self._band_keys(probe.namespace, probe.signature)
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = _Entry(
+            namespace=probe.namespace,
+            signature=probe.signature,
+            body=body,
+            expires_at=time.monotonic() + self.ttl_seconds,
+            band_keys=band_keys,
+        )
+        for key in band_keys:
+            self._buckets.setdefault(key, set()).add(entry_id)
+        self._bytes += len(body)
+
+        # Oldest-used first, until both the entry and byte bounds hold
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            metrics.inc("near_dup_evictions")
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        self._bytes -= len(entry.body)
+        for key in entry.band_keys:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
@@ -0,0 +1,102 @@
+"""
+Top-K tracking for high-cardinality metric labels.
+
+Keys outside the top K are counted in a count-min sketch (conservative
+update), which overestimates but never underestimates. Once a key's
+estimate passes the lightest tracked key, it takes that key's place and
+the caller folds the evicted key's series into a shared bucket. Tracked
+keys count exactly from the moment they are promoted, so a stream of
+one-off keys never churns the table: each one needs more traffic than the
+current K-th heaviest key to get in.
+"""
+
+from __future__ import annotations
+
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+_MASK64 = (1 << 64) - 1
+
+
+class CountMinSketch:
+    def __init__(self, width: int = 4096, depth: int = 4) -> None:
+        # Row indexes are 16-bit slices of one 64-bit hash
+        if not 0 < width <= 1 << 16 or not 0 < depth <= 4:
+            raise ValueError("width must be 1..65536 and depth 1..4")
+        self.width = width
+        self.depth = depth
+        # All rows in one flat list: row r starts at r * width
+        self.cells: List[float] = [0.0] * (width * depth)
+
+    def _indexes(self, key: str) -> List[int]:
+        h = hash(key) & _MASK64
+        width = self.width
+        return [row * width + ((h >> (16 * row)) & 0xFFFF) % width for row in range(self.depth)]
+
+    def add(self, key: str, weight: float = 1.0) -> float:
+        """Adds `weight` and returns the new estimate."""
+        cells = self.cells
+        indexes = self._indexes(key)
+        estimate = min([cells[i] for i in indexes]) + weight
+        for i in indexes:
+            if cells[i] < estimate:
+                cells[i] = estimate
+        return estimate
+
+    def estimate(self, key: str) -> float:
+        cells = self.cells
+        return min([cells[i] for i in self._indexes(key)])
+
+
+class HeavyHitters:
+    def __init__(self, capacity: int, width: int = 4096, depth: int = 4) -> None:
+        self.capacity = capacity
+        self.weights: Dict[str, float] = {}
+        self.sketch = CountMinSketch(width, depth)
+
+        # Min-heap of (weight, key) over tracked keys. Entries go stale as
+        # weights grow and are refreshed lazily when they reach the top.
+        self._heap: List[Tuple[float, str]] = []
+
+    def _lightest(self) -> Tuple[float, str]:
+        heap = self._heap
+        while True:
+            weight, key = heap[0]
+            current = self.weights.get(key)
+            if current == weight:
+                return weight, key
+            if current is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (current, key))
+
+    def add(self, key: str, weight: float = 1.0) -> Tuple[bool, Optional[str]]:
+        """Returns (whether `key` is tracked, the key it evicted if any)."""
+        weights = self.weights
+        if key in weights:
+            weights[key] += weight
+            return True, None
+
+        if not self.capacity:
+            weights[key] = weight
+            return True, None
+
+        estimate = self.sketch.add(key, weight)
+
+        if len(weights) < self.capacity:
+            weights[key] = estimate
+            heapq.heappush(self._heap, (estimate, key))
+            return True, None
+
+        # The heap top is a lower bound even when stale
+        if estimate <= self._heap[0][0]:
+            return False, None
+
+        lightest_weight, lightest = self._lightest()
+        if estimate <= lightest_weight:
+            return False, None
+
+        del weights[lightest]
+        weights[key] = estimate
+        heapq.heapreplace(self._heap, (estimate, key))
+        return True, lightest
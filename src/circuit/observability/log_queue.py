@@ -0,0 +1,51 @@
+"""
+Moves log record formatting and writing off the event loop.
+
+The root logger's handlers are put behind a QueueHandler; a QueueListener
+thread drains the queue into the original handlers. Logging from a request
+handler then costs a queue put instead of a blocking write to stderr.
+"""
+
+from __future__ import annotations
+
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+_listener: Optional[QueueListener] = None
+
+
+def install_queue_logging() -> None:
+    global _listener
+    if _listener is not None:
+        return
+
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    if not handlers:
+        return
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_queue_logging() -> None:
+    """Flushes queued records and restores the original handlers."""
+    global _listener
+    if _listener is None:
+        return
+
+    _listener.stop()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+    for handler in _listener.handlers:
+        root.addHandler(handler)
+    _listener = None
@@ -0,0 +1,134 @@
+"""
+Event-loop health: lag monitoring, blocked-loop stack capture and an
+on-demand sampling profiler.
+
+The monitor task sleeps a fixed interval and records how late it woke up
+(the loop lag). A watchdog thread watches the monitor's heartbeat; when the
+loop has not come back for longer than the block threshold, something is
+running synchronously on it, and the watchdog logs the loop thread's
+current stack while it is still blocked.
+
+The profiler samples thread stacks from a background thread and returns
+them in collapsed format ("frame;frame;frame count"), which flamegraph.pl,
+speedscope and similar tools read directly.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional
+
+from circuit.observability.metrics import metrics
+
+logger = logging.getLogger("circuit.loop")
+
+
+class LoopMonitor:
+    def __init__(self, interval_ms: float = 100, block_threshold_ms: float = 250) -> None:
+        self.interval = interval_ms / 1000
+        self.block_threshold = block_threshold_ms / 1000
+
+        self.loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="circuit-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+
+            self._heartbeat = now
+            metrics.observe_loop_lag(max(0.0, (now - started - self.interval) * 1000))
+
+    def _watch(self) -> None:
+        captured_for = None
+
+        # Check a few times per threshold so a block is caught while ongoing
+        while not self._stop.wait(self.block_threshold / 4):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+
+            if blocked_for < self.block_threshold or captured_for == heartbeat:
+                continue
+
+            # One capture per blocking episode
+            captured_for = heartbeat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+
+            metrics.inc("event_loop_blocks")
+            logger.warning(
+                "event loop blocked for %.0fms+, loop thread stack:\n%s",
+                blocked_for * 1000,
+                "".join(traceback.format_stack(frame)),
+            )
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def sample_stacks(
+    seconds: float,
+    interval_ms: float = 5,
+    thread_id: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Samples every thread's stack (or only `thread_id`'s) for `seconds`.
+    Runs on the calling thread: call it from a worker thread, not the loop.
+    Returns collapsed stack -> sample count; the sampler's own thread is
+    skipped.
+    """
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    counts: Dict[str, int] = collections.Counter()
+
+    deadline = time.monotonic() + seconds
+    interval = interval_ms / 1000
+
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me or (thread_id is not None and ident != thread_id):
+                continue
+
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+
+            counts[";".join(reversed(stack))] += 1
+
+        time.sleep(interval)
+
+    return counts
+
+
+def collapsed(counts: Dict[str, int]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
@@ -1,17 +1,80 @@
 from __future__ import annotations
+import bisect
 from collections import defaultdict
-from typing import Dict
+from typing import Dict, List, Sequence, Set
+
+from circuit.config import settings
+from circuit.observability.heavy_hitters import HeavyHitters
+
+# Bucket upper bounds (ms) for stage and event-loop histograms
+DURATION_BOUNDS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+# Bucket upper bounds (bytes) for per-stream buffer peaks
+BYTES_BOUNDS = (0, 1024, 4096, 16384, 65536, 262144, 1048576, float("inf"))
+
+# Per-client series for clients outside the top K
+OTHER_CLIENT = "other"
+
+
+class Histogram:
+    def __init__(self, bounds: Sequence[float] = DURATION_BOUNDS_MS) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * len(self.bounds)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def prometheus_lines(self, name: str, labels: str = "") -> List[str]:
+        sep = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else bound
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {cumulative}")
+        return lines
 
 
 class Metrics:
-    def __init__(self) -> None:
+    def __init__(self, max_clients: int = 0) -> None:
         # Global counters
         self._global: Dict[str, float] = defaultdict(float)
 
-        # Per-client counters
+        # Per-client counters, for the `max_clients` busiest clients only
+        # (0 = all); the rest are folded into OTHER_CLIENT
         self._per_client: Dict[str, Dict[str, float]] = defaultdict(
             lambda: defaultdict(float)
         )
+        self._clients = HeavyHitters(max_clients)
+
+        # Rendered Prometheus lines per client, redone only when it changed
+        self._client_lines: Dict[str, str] = {}
+        self._dirty_clients: Set[str] = set()
+
+        # Per-upstream-replica counters (prefix-affinity routing)
+        self._per_replica: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+
+        # Per-stage duration histograms (ms), fed by request traces
+        self._stages: Dict[str, Histogram] = defaultdict(Histogram)
+
+        # Event-loop lag (ms), fed by the loop monitor
+        self._loop_lag = Histogram()
+
+        # Current values (not counters), e.g. bytes buffered for streams
+        self._gauges: Dict[str, float] = {}
+
+        # Per-provider health gauges, fed by the health prober
+        self._per_provider: Dict[str, Dict[str, float]] = defaultdict(dict)
+
+        # Peak bytes buffered per stream, observed when the stream ends
+        self._stream_buffer = Histogram(BYTES_BOUNDS)
 
         # Latency histogram buckets (ms)
         self._latency_buckets = {
@@ -23,11 +86,65 @@ class Metrics:
             float("inf"): 0,
         }
 
+    def _client(self, client: str) -> Dict[str, float]:
+        tracked, evicted = self._clients.add(client)
+        if evicted is not None:
+            self._fold(evicted)
+        if not tracked:
+            client = OTHER_CLIENT
+
+        self._dirty_clients.add(client)
+        return self._per_client[client]
+
+    def _fold(self, client: str) -> None:
+        """Moves an evicted client's counters into OTHER_CLIENT."""
+        other = self._per_client[OTHER_CLIENT]
+        for key, value in self._per_client.pop(client, {}).items():
+            if key.startswith("max_"):
+                other[key] = max(other[key], value)
+            else:
+                other[key] += value
+
+        self._dirty_clients.add(client)
+        self._dirty_clients.add(OTHER_CLIENT)
+        self._global["metrics_clients_evicted"] += 1
+
     # Counter increment
     def inc(self, key: str, value: float = 1.0, client: str | None = None):
         self._global[key] += value
         if client:
-            self._per_client[client][key] += value
+            self._client(client)[key] += value
+
+    def inc_replica(self, key: str, replica: str, value: float = 1.0):
+        self._per_replica[replica][key] += value
+
+    def observe_stage(self, stage: str, duration_ms: float):
+        self._stages[stage].observe(duration_ms)
+
+    def set_gauge(self, key: str, value: float):
+        self._gauges[key] = value
+
+    def set_provider(self, provider: str, key: str, value: float):
+        self._per_provider[provider][key] = value
+
+    def observe_stream_buffer(self, peak_bytes: int):
+        self._stream_buffer.observe(peak_bytes)
+
+    def record_compression(self, bytes_in: int, bytes_out: int, cpu_ms: float):
+        g = self._global
+        g["compression_bytes_in"] += bytes_in
+        g["compression_bytes_out"] += bytes_out
+        g["compression_cpu_ms"] += cpu_ms
+
+        # Flushed SSE events can come out larger than they went in, so the
+        # savings are a gauge rather than a counter
+        self._gauges["compression_bytes_saved"] = g["compression_bytes_in"] - g["compression_bytes_out"]
+        if g["compression_bytes_in"]:
+            self._gauges["compression_cpu_ms_per_mb"] = g["compression_cpu_ms"] / (g["compression_bytes_in"] / 1e6)
+
+    def observe_loop_lag(self, lag_ms: float):
+        self._loop_lag.observe(lag_ms)
+        self._global["event_loop_lag_max_ms"] = max(self._global["event_loop_lag_max_ms"], lag_ms)
 
     # Latency observation
     def observe_latency(self, latency_ms: float, client: str | None = None):
@@ -42,10 +159,9 @@ class Metrics:
             self._global["max_latency_ms"], latency_ms
         )
         if client:
-            self._per_client[client]["total_latency_ms"] += latency_ms
-            self._per_client[client]["max_latency_ms"] = max(
-                self._per_client[client]["max_latency_ms"], latency_ms
-            )
+            data = self._client(client)
+            data["total_latency_ms"] += latency_ms
+            data["max_latency_ms"] = max(data["max_latency_ms"], latency_ms)
             
     # Snapshot (JSON view)
     def snapshot(self, client: str | None = None):
@@ -58,6 +174,7 @@ class Metrics:
 
             return {
                 "client": client,
+                "tracked": client in self._per_client,
                 "metrics": {
                     **data,
                     "avg_latency_ms": avg_latency,
@@ -68,31 +185,89 @@ class Metrics:
         avg_latency = (
             self._global.get("total_latency_ms", 0) / total if total else 0
         )
+        self.set_gauge("metrics_clients_tracked", len(self._clients.weights))
 
-        return {
+        snapshot = {
             "global": {
                 **self._global,
+                **self._gauges,
                 "avg_latency_ms": avg_latency,
             },
             "per_client": self._per_client,
         }
 
+        if self._per_replica:
+            snapshot["per_replica"] = {
+                replica: {
+                    **data,
+                    "prefix_hit_rate": (
+                        data.get("prefix_hits", 0) / data["prefix_requests"]
+                        if data.get("prefix_requests") else 0
+                    ),
+                }
+                for replica, data in self._per_replica.items()
+            }
+
+        if self._per_provider:
+            snapshot["per_provider"] = self._per_provider
+
+        return snapshot
+
     # Prometheus format
     def prometheus(self) -> str:
         lines = []
+        self.set_gauge("metrics_clients_tracked", len(self._clients.weights))
 
         # Global counters
         for key, value in self._global.items():
             lines.append(f"# TYPE circuit_{key} counter")
             lines.append(f"circuit_{key} {value}")
 
+        for key, value in self._gauges.items():
+            lines.append(f"# TYPE circuit_{key} gauge")
+            lines.append(f"circuit_{key} {value}")
+
         # Per-client counters
-        for client, data in self._per_client.items():
+        for client in self._dirty_clients:
+            data = self._per_client.get(client)
+            if data is None:
+                self._client_lines.pop(client, None)
+                continue
+            self._client_lines[client] = "\n".join(
+                f'circuit_{key}{{client="{client}"}} {value}'
+                for key, value in data.items()
+            )
+        self._dirty_clients.clear()
+        lines.extend(block for block in self._client_lines.values() if block)
+
+        # Per-replica counters
+        for replica, data in self._per_replica.items():
+            for key, value in data.items():
+                lines.append(
+                    f'circuit_{key}{{replica="{replica}"}} {value}'
+                )
+
+        # Per-provider health gauges
+        for provider, data in self._per_provider.items():
             for key, value in data.items():
                 lines.append(
-                    f'circuit_{key}{{client="{client}"}} {value}'
+                    f'circuit_{key}{{provider="{provider}"}} {value}'
                 )
 
+        # Stage histograms
+        if self._stages:
+            lines.append("# TYPE circuit_stage_duration_ms histogram")
+        for stage, histogram in self._stages.items():
+            lines.extend(histogram.prometheus_lines("circuit_stage_duration_ms", f'stage="{stage}"'))
+
+        # Event-loop lag
+        lines.append("# TYPE circuit_event_loop_lag_ms histogram")
+        lines.extend(self._loop_lag.prometheus_lines("circuit_event_loop_lag_ms"))
+
+        # Per-stream buffer peaks
+        lines.append("# TYPE circuit_stream_buffer_peak_bytes histogram")
+        lines.extend(self._stream_buffer.prometheus_lines("circuit_stream_buffer_peak_bytes"))
+
         # Latency histogram
         lines.append("# TYPE circuit_request_latency_ms histogram")
         cumulative = 0
@@ -106,4 +281,4 @@ class Metrics:
         return "\n".join(lines) + "\n"
 
 
-metrics = Metrics()
\ No newline at end of file
+metrics = Metrics(max_clients=settings.CIRCUIT_METRICS_MAX_CLIENTS)
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+Per-request stage timings.
+
+A Trace lives in a contextvar for the duration of one request; `span()`
+records how long a stage took. Finished traces feed the per-stage
+histograms, the `Server-Timing` header, and a small in-memory buffer of
+sampled recent traces plus the slowest ones seen, served at /debug/traces.
+
+Recording a span is two perf_counter() calls and a list append, and
+nothing at all happens outside a traced request, so this stays on in
+production.
+"""
+
+from __future__ import annotations
+
+import functools
+import heapq
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from circuit.config import settings
+from circuit.observability.metrics import metrics
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("circuit_trace", default=None)
+
+
+class Trace:
+    __slots__ = (
+        "request_id", "method", "path", "started", "wall_started", "spans", "total_ms", "status_code",
+    )
+
+    def __init__(self, method: str, path: str) -> None:
+        self.request_id = "-"
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        # (stage, offset_ms, duration_ms)
+        self.spans: List[Tuple[str, float, float]] = []
+        self.total_ms = 0.0
+        self.status_code = 0
+
+    def add(self, stage: str, started: float, ended: float) -> None:
+        self.spans.append((stage, (started - self.started) * 1000, (ended - started) * 1000))
+
+    def stage_totals(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for stage, _, duration in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + duration
+        return totals
+
+    def server_timing(self) -> str:
+        parts = [f"{stage};dur={ms:.2f}" for stage, ms in self.stage_totals().items()]
+        parts.append(f"total;dur={self.total_ms:.2f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "started_at": self.wall_started,
+            "total_ms": round(self.total_ms, 3),
+            "spans": [
+                {"stage": stage, "offset_ms": round(offset, 3), "duration_ms": round(duration, 3)}
+                for stage, offset, duration in self.spans
+            ],
+        }
+
+
+def start_trace(method: str, path: str) -> Trace:
+    trace = Trace(method, path)
+    _current.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(stage, started, time.perf_counter())
+
+
+def traced(stage: str) -> Callable[[F], F]:
+    """Decorator form of span() for synchronous functions."""
+
+    def decorator(fn: F) -> F:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = _current.get()
+            if trace is None:
+                return fn(*args, **kwargs)
+
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                trace.add(stage, started, time.perf_counter())
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def httpx_extensions() -> Dict[str, Any]:
+    """
+    `extensions=` for an httpx request that records upstream_connect,
+    upstream_ttfb and upstream_body spans on the current trace from
+    httpcore's trace events. Empty outside a traced request.
+    """
+    trace = _current.get()
+    if trace is None:
+        return {}
+
+    marks: Dict[str, float] = {}
+
+    async def on_event(name: str, info: Dict[str, Any]) -> None:
+        now = time.perf_counter()
+        # "http11.x" / "http2.x" -> "x"; connection events keep their prefix
+        event = name.split(".", 1)[1] if name.startswith("http") else name
+        marks[event] = now
+
+        if event == "send_request_headers.started" and "connection.connect_tcp.started" in marks:
+            connected = (
+                marks.get("connection.start_tls.complete")
+                or marks.get("connection.connect_tcp.complete", now)
+            )
+            trace.add("upstream_connect", marks.pop("connection.connect_tcp.started"), connected)
+        elif event == "receive_response_headers.complete" and "send_request_headers.started" in marks:
+            trace.add("upstream_ttfb", marks["send_request_headers.started"], now)
+        elif event == "receive_response_body.complete" and "receive_response_body.started" in marks:
+            trace.add("upstream_body", marks["receive_response_body.started"], now)
+
+    return {"trace": on_event}
+
+
+class TraceBuffer:
+    """Sampled recent traces plus the slowest `slowest_size` seen."""
+
+    def __init__(self, size: int = 200, slowest_size: int = 20, sample_rate: float = 0.05) -> None:
+        self.sample_rate = sample_rate
+        self.recent: Deque[Trace] = deque(maxlen=size)
+        self.slowest_size = slowest_size
+        # Min-heap on total_ms; the counter breaks ties without comparing traces
+        self._slowest: List[Tuple[float, int, Trace]] = []
+        self._seq = 0
+
+    def offer(self, trace: Trace) -> None:
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            self.recent.append(trace)
+
+        self._seq += 1
+        item = (trace.total_ms, self._seq, trace)
+        if len(self._slowest) < self.slowest_size:
+            heapq.heappush(self._slowest, item)
+        elif trace.total_ms > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "sample_rate": self.sample_rate,
+            "recent": [trace.to_dict() for trace in reversed(self.recent)],
+            "slowest": [item[2].to_dict() for item in sorted(self._slowest, reverse=True)],
+        }
+
+
+def finish_trace(trace: Trace) -> None:
+    trace.total_ms = (time.perf_counter() - trace.started) * 1000
+
+    for stage, ms in trace.stage_totals().items():
+        metrics.observe_stage(stage, ms)
+    metrics.observe_stage("total", trace.total_ms)
+
+    trace_buffer.offer(trace)
+
+
+trace_buffer = TraceBuffer(
+    size=settings.CIRCUIT_TRACE_BUFFER_SIZE,
+    slowest_size=settings.CIRCUIT_TRACE_SLOWEST,
+    sample_rate=settings.CIRCUIT_TRACE_SAMPLE_RATE,
+)
@@ -0,0 +1,131 @@
+"""
+Passthrough mode for non-streaming completions.
+
+The upstream body is forwarded byte-for-byte; only the small `usage` object
+and the `model` string are pulled out of it for accounting. Gateway metadata
+travels in `x-circuit-*` response headers instead of a `circuit` block in the
+body, so the response never has to be decoded and re-encoded.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+from circuit.serialization import loads
+
+_USAGE_KEY = b'"usage"'
+_MODEL_KEY = b'"model"'
+_WHITESPACE = b" \t\r\n"
+
+
+def _skip_ws(body: bytes, i: int) -> int:
+    n = len(body)
+    while i < n and body[i] in _WHITESPACE:
+        i += 1
+    return i
+
+
+def _value_start(body: bytes, key_end: int) -> int:
+    """Index of the first byte of the value after `"key"`, or -1."""
+    i = _skip_ws(body, key_end)
+    if i >= len(body) or body[i] != 0x3A:  # ':'
+        return -1
+    return _skip_ws(body, i + 1)
+
+
+def _object_end(body: bytes, start: int) -> int:
+    """Index just past the `}` matching the `{` at `start`, or -1."""
+    depth = 0
+    in_string = False
+    i = start
+    n = len(body)
+
+    while i < n:
+        c = body[i]
+        if in_string:
+            if c == 0x5C:  # backslash
+                i += 1
+            elif c == 0x22:
+                in_string = False
+        elif c == 0x22:
+            in_string = True
+        elif c == 0x7B:
+            depth += 1
+        elif c == 0x7D:
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+
+    return -1
+
+
+def scan_usage(body: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Finds the top-level `usage` object without decoding the body.
+
+    OpenAI-style responses put usage last, so the search runs from the end.
+    A `"usage"` inside message content is always escaped (`\\"usage\\"`) and
+    cannot match. Returns None when usage is missing or not an object.
+    """
+    key = body.rfind(_USAGE_KEY)
+    if key < 0:
+        return None
+
+    start = _value_start(body, key + len(_USAGE_KEY))
+    if start < 0 or body[start] != 0x7B:
+        return None
+
+    end = _object_end(body, start)
+    if end < 0:
+        return None
+
+    try:
+        usage = loads(body[start:end])
+    except ValueError:
+        return None
+
+    if not isinstance(usage.get("prompt_tokens"), int) or not isinstance(usage.get("completion_tokens"), int):
+        return None
+    return usage
+
+
+def scan_model(body: bytes) -> Optional[str]:
+    """Finds the `model` string, which precedes `choices` in upstream responses."""
+    key = body.find(_MODEL_KEY)
+    if key < 0:
+        return None
+
+    start = _value_start(body, key + len(_MODEL_KEY))
+    if start < 0 or body[start] != 0x22:
+        return None
+
+    end = body.find(b'"', start + 1)
+    if end < 0:
+        return None
+
+    try:
+        return body[start + 1:end].decode()
+    except UnicodeDecodeError:
+        return None
+
+
+def circuit_headers(
+    *,
+    request_id: str,
+    client_key_hash: str,
+    provider: str,
+    model: str,
+    cost_usd: float,
+    breaker_state: str,
+    latency_ms: float,
+) -> Dict[str, str]:
+    return {
+        "x-circuit-request-id": request_id,
+        "x-circuit-client-key-hash": client_key_hash,
+        "x-circuit-provider": provider,
+        "x-circuit-model": model,
+        "x-circuit-cost-usd": f"{cost_usd:.8f}",
+        "x-circuit-breaker-state": breaker_state,
+        "x-circuit-upstream-latency-ms": str(latency_ms),
+    }
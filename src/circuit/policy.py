@@ -0,0 +1,184 @@
+"""
+Per-tenant limits: daily USD, requests and tokens per minute, allowed
+models, priority and max output tokens.
+
+Every field is type-checked and range-checked when a source is compiled,
+so a bad value rejects the whole reload rather than failing requests.
+`priority` decides who is shed last when streams run out of memory.
+
+Policies come from a JSON file (CIRCUIT_POLICY_FILE) or, without one, the
+`tenant_policies` table. Either source is compiled into an immutable
+PolicySnapshot keyed by client_key_hash. Reloading builds a new snapshot
+and swaps the reference in one assignment, so requests in flight keep the
+snapshot they started with and nothing is parsed per request.
+
+File format; tenants inherit every field they omit from "default":
+
+    {
+      "default": {"rpm": 300, "daily_usd_limit": 10.0},
+      "tenants": {
+        "3f2a9c1b7d4e": {"rpm": 60, "tpm": 40000, "allowed_models": ["gpt-4o-mini"],
+                         "priority": 1, "max_output_tokens": 1024}
+      }
+    }
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from circuit.config import settings
+from circuit.storage.sqlite import get_connection
+
+logger = logging.getLogger("circuit.policy")
+
+
+@dataclass(frozen=True)
+class TenantPolicy:
+    daily_usd_limit: float
+    rpm: int  # 0 disables the check
+    burst: int
+    tpm: int  # 0 disables the check
+    allowed_models: Optional[FrozenSet[str]]  # None allows every model
+    priority: int  # > 0 may use the stream memory reserve, < 0 is shed first
+    max_output_tokens: int
+
+    def allows_model(self, model: str) -> bool:
+        return self.allowed_models is None or model in self.allowed_models
+
+
+@dataclass(frozen=True)
+class PolicySnapshot:
+    default: TenantPolicy
+    tenants: Mapping[str, TenantPolicy]
+    source: str
+    fingerprint: Any
+
+    def get(self, client_key_hash: str) -> TenantPolicy:
+        return self.tenants.get(client_key_hash, self.default)
+
+
+class _PolicyFields(BaseModel):
+    """What a source may set for a tenant; unset fields are inherited."""
+
+    model_config = ConfigDict(extra="forbid")
+
+    daily_usd_limit: float = Field(default=None, ge=0)
+    rpm: int = Field(default=None, ge=0)
+    burst: int = Field(default=None, ge=0)
+    tpm: int = Field(default=None, ge=0)
+    allowed_models: Optional[List[str]] = None
+    priority: int = Field(default=None, ge=-10, le=10)
+    max_output_tokens: int = Field(default=None, ge=1)
+
+
+def default_policy() -> TenantPolicy:
+    return TenantPolicy(
+        daily_usd_limit=settings.CIRCUIT_DAILY_USD_LIMIT,
+        rpm=settings.CIRCUIT_REQUESTS_PER_MIN,
+        burst=settings.CIRCUIT_RATE_LIMIT_BURST,
+        tpm=0,
+        allowed_models=None,
+        priority=0,
+        max_output_tokens=settings.CIRCUIT_MAX_OUTPUT_TOKENS,
+    )
+
+
+def _compile(base: TenantPolicy, raw: Dict[str, Any], where: str) -> TenantPolicy:
+    try:
+        values = _PolicyFields.model_validate(raw).model_dump(exclude_unset=True)
+    except ValueError as e:
+        raise ValueError(f"{where}: invalid policy: {e}") from e
+
+    if values.get("allowed_models") is not None:
+        values["allowed_models"] = frozenset(values["allowed_models"])
+    return replace(base, **values)
+
+
+def compile_policies(raw: Dict[str, Any], source: str, fingerprint: Any) -> PolicySnapshot:
+    default = _compile(default_policy(), raw.get("default") or {}, "default")
+    tenants = {
+        key: _compile(default, policy, key)
+        for key, policy in (raw.get("tenants") or {}).items()
+    }
+    return PolicySnapshot(
+        default=default,
+        tenants=MappingProxyType(tenants),
+        source=source,
+        fingerprint=fingerprint,
+    )
+
+
+def _file_fingerprint(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _db_fingerprint() -> Tuple[Any, int]:
+    conn = get_connection()
+    row = conn.execute("SELECT MAX(updated_at), COUNT(*) FROM tenant_policies").fetchone()
+    conn.close()
+    return row[0], row[1]
+
+
+def _read_db() -> Dict[str, Any]:
+    conn = get_connection()
+    rows = conn.execute("SELECT client_key_hash, policy FROM tenant_policies").fetchall()
+    conn.close()
+
+    raw: Dict[str, Any] = {"tenants": {}}
+    for row in rows:
+        if row["client_key_hash"] == "default":
+            raw["default"] = json.loads(row["policy"])
+        else:
+            raw["tenants"][row["client_key_hash"]] = json.loads(row["policy"])
+    return raw
+
+
+class PolicyStore:
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.snapshot = compile_policies({}, "defaults", None)
+
+    def _fingerprint(self) -> Any:
+        return _file_fingerprint(self.path) if self.path else _db_fingerprint()
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Rebuilds the snapshot if the source changed. A broken source keeps
+        the previous snapshot. Returns True when a new snapshot was swapped in.
+        """
+        try:
+            fingerprint = self._fingerprint()
+            if not force and fingerprint == self.snapshot.fingerprint:
+                return False
+
+            if self.path:
+                with open(self.path, "rb") as f:
+                    raw = json.load(f)
+                source = self.path
+            else:
+                raw = _read_db()
+                source = "db"
+
+            snapshot = compile_policies(raw, source, fingerprint)
+        except Exception as e:
+            logger.error("policy reload failed, keeping previous policies: %r", e)
+            return False
+
+        self.snapshot = snapshot
+        logger.info("loaded %d tenant policies from %s", len(snapshot.tenants), source)
+        return True
+
+    def get(self, client_key_hash: str) -> TenantPolicy:
+        return self.snapshot.get(client_key_hash)
+
+
+policy_store = PolicyStore(settings.CIRCUIT_POLICY_FILE or None)
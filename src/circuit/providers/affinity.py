@@ -0,0 +1,176 @@
+"""
+Prefix-affinity routing over a set of replicas of the same backend.
+
+Requests that share a prompt prefix (system prompt plus the start of the
+conversation) are pinned to one replica with consistent hashing, so the
+replica's KV cache for that prefix gets reused. Bounded load keeps a hot
+prefix from overloading its home replica: once a replica holds more than
+`load_factor` times the average in-flight count, the request spills over to
+the next replica on the ring.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import math
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Union
+
+from circuit.observability.metrics import metrics
+from circuit.providers.base import ChatProvider, RawCompletion
+
+# Rough chars-per-token ratio; good enough to cut a stable prefix without
+# running the tokenizer on every request
+CHARS_PER_TOKEN = 4
+
+
+def _hash(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def prefix_key(messages: Sequence[Dict[str, Any]], prefix_tokens: int) -> int:
+    """
+    Hashes the first `prefix_tokens` (approximate) tokens of the prompt,
+    message boundaries included. A long shared system prompt uses up the
+    whole budget, so every request behind it gets the same key.
+    """
+    h = hashlib.blake2b(digest_size=8)
+    budget = prefix_tokens * CHARS_PER_TOKEN
+
+    for message in messages:
+        if budget <= 0:
+            break
+
+        content = str(message.get("content") or "")[:budget]
+        budget -= len(content)
+
+        h.update(str(message.get("role", "")).encode())
+        h.update(b"\0")
+        h.update(content.encode())
+        h.update(b"\0")
+
+    return int.from_bytes(h.digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes: Sequence[str], vnodes: int = 64) -> None:
+        self.nodes = list(nodes)
+        points = sorted(
+            (_hash(f"{node}#{i}".encode()), index)
+            for index, node in enumerate(self.nodes)
+            for i in range(vnodes)
+        )
+        self._hashes = [h for h, _ in points]
+        self._owners = [index for _, index in points]
+
+    def walk(self, key: int) -> Iterator[int]:
+        """Yields each node index once, in ring order starting at `key`."""
+        start = bisect.bisect(self._hashes, key)
+        seen = set()
+        count = len(self._owners)
+
+        for i in range(count):
+            index = self._owners[(start + i) % count]
+            if index not in seen:
+                seen.add(index)
+                yield index
+                if len(seen) == len(self.nodes):
+                    return
+
+
+class PrefixAffinityRouter(ChatProvider):
+    """Routes each request to one of `replicas` by prompt prefix."""
+
+    def __init__(
+        self,
+        replicas: Sequence[ChatProvider],
+        names: Sequence[str],
+        prefix_tokens: int = 256,
+        load_factor: float = 1.25,
+        recent_prefixes: int = 1024,
+    ) -> None:
+        self.replicas = list(replicas)
+        self.names = list(names)
+        self.ring = HashRing(self.names)
+        self.prefix_tokens = prefix_tokens
+        self.load_factor = load_factor
+        self.recent_prefixes = recent_prefixes
+
+        self.in_flight = [0] * len(self.replicas)
+        # Prefixes each replica served recently: a stand-in for its KV cache
+        self._recent: List[OrderedDict] = [OrderedDict() for _ in self.replicas]
+
+    def choose(self, payload: Dict[str, Any]) -> int:
+        key = prefix_key(payload.get("messages") or [], self.prefix_tokens)
+
+        total = sum(self.in_flight) + 1
+        capacity = max(1, math.ceil(self.load_factor * total / len(self.replicas)))
+
+        chosen = None
+        for rank, index in enumerate(self.ring.walk(key)):
+            if self.in_flight[index] < capacity:
+                chosen = index
+                break
+
+        if chosen is None:
+            # Every replica is at capacity (only possible with load_factor < 1)
+            chosen = min(range(len(self.replicas)), key=self.in_flight.__getitem__)
+            rank = -1
+
+        name = self.names[chosen]
+        recent = self._recent[chosen]
+
+        metrics.inc_replica("prefix_requests", name)
+        if rank != 0:
+            metrics.inc_replica("prefix_spills", name)
+
+        if key in recent:
+            recent.move_to_end(key)
+            metrics.inc_replica("prefix_hits", name)
+        else:
+            recent[key] = True
+            if len(recent) > self.recent_prefixes:
+                recent.popitem(last=False)
+
+        return chosen
+
+    @property
+    def model(self) -> Optional[str]:
+        # Replicas serve the same model
+        return self.replicas[0].model
+
+    @contextmanager
+    def _track(self, index: int) -> Iterator[None]:
+        self.in_flight[index] += 1
+        try:
+            yield
+        finally:
+            self.in_flight[index] -= 1
+
+    async def probe(self) -> None:
+        """Healthy while any replica is."""
+        results = await asyncio.gather(
+            *(replica.probe() for replica in self.replicas),
+            return_exceptions=True,
+        )
+        if all(isinstance(result, BaseException) for result in results):
+            raise results[0]
+
+    async def chat_completions(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        index = self.choose(payload)
+        with self._track(index):
+            return await self.replicas[index].chat_completions(payload)
+
+    async def chat_completions_raw(self, payload: Dict[str, Any]) -> Union[RawCompletion, Dict[str, Any]]:
+        index = self.choose(payload)
+        with self._track(index):
+            return await self.replicas[index].chat_completions_raw(payload)
+
+    async def chat_completions_stream(self, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        index = self.choose(payload)
+        with self._track(index):
+            async for chunk in self.replicas[index].chat_completions_stream(payload):
+                yield chunk
@@ -1,8 +1,37 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional, Union
+
+from circuit.serialization import dumps
+
+
+class ProviderStreamError(Exception):
+    """
+    Raised by chat_completions_stream when the upstream fails, either before
+    the first chunk or mid-stream.
+    """
+
+    def __init__(self, code: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.retry_after = retry_after
+
+
+@dataclass
+class RawCompletion:
+    """Upstream response body exactly as received, for passthrough mode."""
+
+    body: bytes
+    latency_ms: float
 
 
 class ChatProvider(ABC):
+    # Whether the upstream honours `n` itself; otherwise the gateway fans out
+    supports_n = False
+    # Set when the upstream always runs one model, whatever the request names
+    model: Optional[str] = None
+
     @abstractmethod
     async def chat_completions(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -10,6 +39,36 @@ class ChatProvider(ABC):
         Returns an OpenAI-compatible response dict.
         """
         raise NotImplementedError
-    
-    async def chat_completions_stream(self, payload):
-        raise NotImplementedError
\ No newline at end of file
+
+    async def chat_completions_stream(self, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streams a chat completion as OpenAI `chat.completion.chunk` dicts.
+        Raises ProviderStreamError on upstream failure.
+        """
+        raise NotImplementedError
+
+    async def chat_completions_raw(self, payload: Dict[str, Any]) -> Union[RawCompletion, Dict[str, Any]]:
+        """
+        Like chat_completions, but returns the undecoded response body.
+        Error results are still returned as {"error": ...} dicts.
+        Providers that already hold bytes should override this to skip decoding.
+        """
+        result = await self.chat_completions(payload)
+        if isinstance(result, dict) and "error" in result:
+            return result
+
+        latency_ms = result.pop("latency_ms", 0)
+        return RawCompletion(body=dumps(result), latency_ms=latency_ms)
+
+    async def probe(self) -> None:
+        """
+        Cheap liveness check for the background health prober; raises on
+        failure. The default asks for a one-token completion; providers with
+        a free endpoint (model list) should override it.
+        """
+        result = await self.chat_completions({
+            "messages": [{"role": "user", "content": "ping"}],
+            "max_tokens": 1,
+        })
+        if isinstance(result, dict) and "error" in result:
+            raise RuntimeError(str(result["error"].get("message")))
@@ -1,6 +1,8 @@
 from circuit.config import settings
+from circuit.providers.affinity import PrefixAffinityRouter
 from circuit.providers.base import ChatProvider
 from circuit.providers.mock_openai import MockOpenAIProvider
+from circuit.providers.ollama_provider import OllamaProvider
 from circuit.providers.openai import OpenAIProvider
 
 
@@ -10,4 +12,18 @@ def get_chat_provider() -> ChatProvider:
     if provider == "OPENAI":
         return OpenAIProvider()
 
-    return MockOpenAIProvider()
\ No newline at end of file
+    return MockOpenAIProvider()
+
+
+def get_fallback_provider() -> ChatProvider:
+    replicas = settings.ollama_replicas
+
+    if len(replicas) < 2:
+        return OllamaProvider(base_url=replicas[0] if replicas else None)
+
+    return PrefixAffinityRouter(
+        [OllamaProvider(base_url=url) for url in replicas],
+        names=replicas,
+        prefix_tokens=settings.CIRCUIT_PREFIX_AFFINITY_TOKENS,
+        load_factor=settings.CIRCUIT_PREFIX_AFFINITY_LOAD_FACTOR,
+    )
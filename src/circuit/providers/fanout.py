@@ -0,0 +1,101 @@
+"""
+`n > 1` for providers without native support.
+
+The request is sent `n` times with `n=1`, concurrently, and the answers are
+merged into one OpenAI-shaped response: choices re-indexed in completion
+order, usage summed (every call really does pay for the prompt), latency
+of the slowest call. Calls to one provider share a semaphore, so a burst
+of fan-out requests cannot open more than `concurrency` upstream calls.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List
+
+from circuit.providers.base import ChatProvider
+
+_USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+_limits: Dict[int, asyncio.Semaphore] = {}
+
+
+def _limit(provider: ChatProvider, concurrency: int) -> asyncio.Semaphore:
+    limit = _limits.get(id(provider))
+    if limit is None:
+        limit = _limits[id(provider)] = asyncio.Semaphore(concurrency)
+    return limit
+
+
+def merge_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    choices = []
+    for result in results:
+        for choice in result.get("choices") or []:
+            choices.append({**choice, "index": len(choices)})
+
+    usage = {
+        field: sum(int((result.get("usage") or {}).get(field) or 0) for result in results)
+        for field in _USAGE_FIELDS
+    }
+
+    return {
+        **results[0],
+        "choices": choices,
+        "usage": usage,
+        "latency_ms": max(result.get("latency_ms", 0) for result in results),
+    }
+
+
+async def fan_out(
+    provider: ChatProvider,
+    payload: Dict[str, Any],
+    n: int,
+    concurrency: int = 4,
+    allow_partial: bool = False,
+) -> Dict[str, Any]:
+    """
+    Returns the merged response, or an {"error": ...} dict when every call
+    failed (or any call failed, unless `allow_partial`). Without
+    `allow_partial` the first failure cancels the calls still running; the
+    calls that had already finished were paid for upstream, so their merged
+    response rides along under "completed" for the caller to bill.
+    """
+    limit = _limit(provider, concurrency)
+    single = {**payload, "n": 1}
+
+    async def call() -> Dict[str, Any]:
+        async with limit:
+            return await provider.chat_completions(single)
+
+    tasks = [asyncio.create_task(call()) for _ in range(n)]
+    results: List[Dict[str, Any]] = []
+    error = None
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                result = await next_done
+            except Exception as e:
+                result = {"error": {"code": "fanout_call_failed", "message": repr(e)}}
+
+            if isinstance(result, dict) and "error" in result:
+                error = error or result
+                if not allow_partial:
+                    # Finished too, but not yet handed out by as_completed
+                    for task in tasks:
+                        if task.done() and not task.cancelled() and task.exception() is None:
+                            done = task.result()
+                            if "error" not in done and all(done is not seen for seen in results):
+                                results.append(done)
+                    if results:
+                        return {**error, "completed": merge_results(results)}
+                    return error
+            else:
+                results.append(result)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if not results:
+        return error
+    return merge_results(results)
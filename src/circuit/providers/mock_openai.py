@@ -1,54 +1,37 @@
 import asyncio
 import time
-import uuid
-from typing import Dict, Any
+from typing import Any, AsyncIterator, Dict, Optional
 
+from circuit.config import settings
+from circuit.providers.base import ChatProvider, ProviderStreamError
+from circuit.providers.mock_profile import MockProfile, MockUpstream
 from circuit.reliability.timeouts import DEFAULT_TIMEOUT
 
 
-class MockOpenAIProvider:
+class MockOpenAIProvider(ChatProvider):
     name = "mock-openai"
 
-    async def chat_completions(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        start = time.perf_counter()
+    def __init__(self, profile: Optional[MockProfile] = None) -> None:
+        # default profile: slow upstream (2s) → triggers timeout
+        self.upstream = MockUpstream(profile or MockProfile.from_json(settings.CIRCUIT_MOCK_PROFILE))
 
-        async def _simulate():
-            # simulate slow upstream → triggers timeout
-            await asyncio.sleep(2)
+    async def probe(self) -> None:
+        # Same failure and latency model as a real call, without the output
+        failure = self.upstream.sample_failure()
+        if failure:
+            raise RuntimeError(failure["message"])
+        await asyncio.sleep(self.upstream.sample_latency_s())
 
-            messages = payload.get("messages", [])
-            user_content = ""
-
-            for m in reversed(messages):
-                if m.get("role") == "user":
-                    user_content = m.get("content", "")
-                    break
+    async def chat_completions(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
 
-            return {
-                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
-                "object": "chat.completion",
-                "created": int(time.time()),
-                "model": payload.get("model", "gpt-4o"),
-                "choices": [
-                    {
-                        "index": 0,
-                        "message": {
-                            "role": "assistant",
-                            "content": f"Mock response to: {user_content}",
-                        },
-                        "finish_reason": "stop",
-                    }
-                ],
-                "usage": {
-                    "prompt_tokens": 1,
-                    "completion_tokens": 1,
-                    "total_tokens": 2,
-                },
-            }
+        failure = self.upstream.sample_failure()
+        if failure:
+            return {"error": failure}
 
         try:
             result = await asyncio.wait_for(
-                _simulate(),
+                self.upstream.completion(payload),
                 timeout=DEFAULT_TIMEOUT.total_timeout,
             )
         except asyncio.TimeoutError:
@@ -62,4 +45,28 @@ class MockOpenAIProvider:
         latency_ms = (time.perf_counter() - start) * 1000
         result["latency_ms"] = latency_ms
 
-        return result
\ No newline at end of file
+        return result
+
+    async def chat_completions_stream(self, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        failure = self.upstream.sample_failure()
+        if failure:
+            raise ProviderStreamError(
+                failure["code"],
+                failure["message"],
+                retry_after=failure.get("retry_after"),
+            )
+
+        chunks = self.upstream.stream(payload).__aiter__()
+
+        # Only time to first token is bounded; long streams are fine
+        try:
+            first = await asyncio.wait_for(
+                chunks.__anext__(),
+                timeout=DEFAULT_TIMEOUT.total_timeout,
+            )
+        except asyncio.TimeoutError:
+            raise ProviderStreamError("timeout", "Provider request timed out")
+
+        yield first
+        async for chunk in chunks:
+            yield chunk
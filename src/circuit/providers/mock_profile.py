@@ -0,0 +1,210 @@
+"""
+Behaviour model for the mock upstream, shared by the in-process
+MockOpenAIProvider and the standalone mock HTTP server.
+
+Latency is the time to first token. Streaming then emits one token per
+1/tokens_per_sec seconds; a non-streaming call waits for the whole output.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass, fields
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from circuit.providers.base import ProviderStreamError
+
+_FILLER = (
+    "the gateway keeps requests flowing while upstream providers wobble and "
+    "every token is counted settled and billed exactly once"
+).split()
+
+
+@dataclass
+class MockProfile:
+    # fixed | lognormal | bimodal
+    latency: str = "fixed"
+    # fixed value, lognormal median, or bimodal fast mode
+    latency_ms: float = 2000.0
+    latency_sigma: float = 0.25
+    # bimodal slow mode; unset = 3x latency_ms
+    slow_latency_ms: Optional[float] = None
+    slow_fraction: float = 0.1
+    # occasional extra stall added on top of any distribution
+    spike_rate: float = 0.0
+    spike_ms: float = 5000.0
+
+    # 0 = emit the whole output at once
+    tokens_per_sec: float = 0.0
+    # 0 = just echo the prompt back
+    output_tokens: int = 0
+
+    # fraction of calls failing with a 5xx / 429, or dropping mid-stream
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after_s: float = 1.0
+    drop_rate: float = 0.0
+    # every outage_period_s, fail every call (503) for the first outage_s
+    outage_period_s: float = 0.0
+    outage_s: float = 0.0
+
+    seed: Optional[int] = None
+
+    def __post_init__(self) -> None:
+        if self.slow_latency_ms is None:
+            self.slow_latency_ms = self.latency_ms * 3
+
+    @classmethod
+    def from_json(cls, raw: str) -> "MockProfile":
+        if not raw:
+            return cls()
+
+        data = json.loads(raw)
+        known = {f.name for f in fields(cls)}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"unknown mock profile keys: {', '.join(sorted(unknown))}")
+
+        return cls(**data)
+
+
+class MockUpstream:
+    """Samples latencies, failures and output for one MockProfile."""
+
+    def __init__(self, profile: MockProfile):
+        self.profile = profile
+        self.rng = random.Random(profile.seed)
+        self.started = time.monotonic()
+
+    def sample_latency_s(self) -> float:
+        p = self.profile
+        rng = self.rng
+
+        if p.latency == "lognormal":
+            ms = rng.lognormvariate(math.log(p.latency_ms), p.latency_sigma)
+        elif p.latency == "bimodal":
+            mode = p.slow_latency_ms if rng.random() < p.slow_fraction else p.latency_ms
+            ms = rng.lognormvariate(math.log(mode), p.latency_sigma)
+        else:
+            ms = p.latency_ms
+
+        if p.spike_rate and rng.random() < p.spike_rate:
+            ms += p.spike_ms
+
+        return max(ms, 0.0) / 1000.0
+
+    def sample_failure(self) -> Optional[Dict[str, Any]]:
+        """Returns an OpenAI-style error body, or None if this call succeeds."""
+        p = self.profile
+        roll = self.rng.random()
+
+        if p.outage_period_s and (time.monotonic() - self.started) % p.outage_period_s < p.outage_s:
+            return {
+                "code": "unavailable",
+                "message": "Mock upstream outage",
+                "status_code": 503,
+            }
+
+        if roll < p.rate_limit_rate:
+            return {
+                "code": "rate_limit",
+                "message": "Mock upstream rate limit",
+                "status_code": 429,
+                "retry_after": p.retry_after_s,
+            }
+
+        if roll < p.rate_limit_rate + p.error_rate:
+            return {
+                "code": "server_error",
+                "message": "Mock upstream error",
+                "status_code": 500,
+            }
+
+        return None
+
+    def output_pieces(self, messages: List[Dict[str, Any]]) -> List[str]:
+        user_content = ""
+        for m in reversed(messages):
+            if m.get("role") == "user":
+                user_content = m.get("content", "")
+                break
+
+        pieces = ["Mock", " response", " to:", f" {user_content}"]
+        for i in range(self.profile.output_tokens):
+            pieces.append(f" {_FILLER[i % len(_FILLER)]}")
+        return pieces
+
+    @staticmethod
+    def usage(messages: List[Dict[str, Any]], completion_tokens: int) -> Dict[str, int]:
+        # ~4 chars per token plus per-message framing, close to tiktoken on English
+        prompt_tokens = 2 + sum(4 + len(str(m.get("content", ""))) // 4 for m in messages)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    async def completion(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        messages = payload.get("messages", [])
+        pieces = self.output_pieces(messages)
+
+        delay = self.sample_latency_s()
+        if self.profile.tokens_per_sec > 0:
+            delay += len(pieces) / self.profile.tokens_per_sec
+        await asyncio.sleep(delay)
+
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-4o"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": "".join(pieces),
+                    },
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": self.usage(messages, len(pieces)),
+        }
+
+    async def stream(self, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        messages = payload.get("messages", [])
+        pieces = self.output_pieces(messages)
+        model = payload.get("model", "gpt-4o")
+        include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+
+        drop_at = None
+        if self.profile.drop_rate and self.rng.random() < self.profile.drop_rate:
+            drop_at = self.rng.randrange(1, len(pieces))
+
+        base = {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+        }
+        interval = 1.0 / self.profile.tokens_per_sec if self.profile.tokens_per_sec > 0 else 0.0
+
+        await asyncio.sleep(self.sample_latency_s())
+        yield {**base, "choices": [{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}]}
+
+        for i, piece in enumerate(pieces):
+            if i == drop_at:
+                raise ProviderStreamError("stream_dropped", "Mock upstream dropped the stream")
+            if interval and i:
+                await asyncio.sleep(interval)
+            yield {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+
+        yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+
+        if include_usage:
+            yield {**base, "choices": [], "usage": self.usage(messages, len(pieces))}
@@ -0,0 +1,88 @@
+"""
+Standalone OpenAI-compatible mock upstream.
+
+    python -m circuit.providers.mock_server --port 9100 \
+        --profile '{"latency": "lognormal", "latency_ms": 300, "tokens_per_sec": 80}'
+
+Point the gateway at it with PROVIDER=OPENAI, OPENAI_BASE_URL=http://127.0.0.1:9100/v1
+and any OPENAI_API_KEY.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from circuit.providers.mock_profile import MockProfile, MockUpstream
+
+
+def create_app(profile: MockProfile) -> FastAPI:
+    app = FastAPI()
+    upstream = MockUpstream(profile)
+
+    def _error(failure: dict) -> JSONResponse:
+        headers = {}
+        if failure.get("retry_after") is not None:
+            headers["retry-after"] = str(failure["retry_after"])
+
+        return JSONResponse(
+            status_code=failure["status_code"],
+            content={"error": {"code": failure["code"], "message": failure["message"]}},
+            headers=headers,
+        )
+
+    @app.get("/v1/models")
+    async def models():
+        # Health probes hit this, so it follows the profile's failures and latency
+        failure = upstream.sample_failure()
+        if failure:
+            return _error(failure)
+        await asyncio.sleep(upstream.sample_latency_s())
+
+        return {
+            "object": "list",
+            "data": [{"id": "gpt-4o", "object": "model", "created": int(time.time())}],
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+
+        failure = upstream.sample_failure()
+        if failure:
+            return _error(failure)
+
+        if not payload.get("stream"):
+            return await upstream.completion(payload)
+
+        async def events():
+            # A ProviderStreamError (drop) escapes here and aborts the
+            # response without [DONE], like a dropped upstream connection
+            async for chunk in upstream.stream(payload):
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the mock OpenAI upstream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--profile", default="", help="MockProfile overrides as JSON")
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(MockProfile.from_json(args.profile)), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
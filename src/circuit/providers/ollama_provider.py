@@ -1,44 +1,89 @@
 import httpx
 import time
-from typing import Dict, Any
+from typing import Any, AsyncIterator, Dict
 
+from circuit.config import settings
+from circuit.observability.tracing import httpx_extensions
+from circuit.providers.base import ChatProvider, ProviderStreamError
+from circuit.providers.sse import aiter_ndjson
+from circuit.serialization import dumps, loads
 
-class OllamaProvider:
-    name = "ollama"
 
-    async def chat_completions(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        start = time.perf_counter()
+# OpenAI sampling parameters and their Ollama option names
+_OPTIONS = {
+    "max_tokens": "num_predict",
+    "temperature": "temperature",
+    "top_p": "top_p",
+    "stop": "stop",
+    "seed": "seed",
+    "presence_penalty": "presence_penalty",
+    "frequency_penalty": "frequency_penalty",
+}
 
-        messages = payload.get("messages", [])
-        user_content = ""
 
-        for m in reversed(messages):
-            if m.get("role") == "user":
-                user_content = m.get("content", "")
-                break
+def _ollama_request(payload: Dict[str, Any], model: str, stream: bool) -> Dict[str, Any]:
+    options = {
+        name: payload[key]
+        for key, name in _OPTIONS.items()
+        if payload.get(key) is not None
+    }
+    if isinstance(options.get("stop"), str):
+        options["stop"] = [options["stop"]]
 
-        try:
-            timeout = httpx.Timeout(
+    return {
+        "model": model,
+        "messages": [
+            {"role": m.get("role", "user"), "content": m.get("content", "")}
+            for m in payload.get("messages", [])
+        ],
+        "stream": stream,
+        "options": options,
+    }
+
+
+def _usage(data: Dict[str, Any]) -> Dict[str, int]:
+    prompt_tokens = int(data.get("prompt_eval_count") or 0)
+    completion_tokens = int(data.get("eval_count") or 0)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+class OllamaProvider(ChatProvider):
+    name = "ollama"
+
+    def __init__(self, base_url: str | None = None, model: str | None = None) -> None:
+        self.base_url = base_url or settings.CIRCUIT_OLLAMA_URL
+        self.model = model or settings.CIRCUIT_OLLAMA_MODEL
+
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"Content-Type": "application/json"},
+            timeout=httpx.Timeout(
                 15.0,
                 connect=2.0,
                 read=15.0,
                 write=5.0,
                 pool=5.0,
-            )
+            ),
+        )
 
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post(
-                    "http://127.0.0.1:11434/api/generate",
-                    json={
-                        "model": "llama3.2:1b",
-                        "prompt": user_content,
-                        "stream": False,
-                        "options": {
-                            "num_predict": 20,
-                            "temperature": 0.3,
-                        },
-                    },
-                )
+    async def probe(self) -> None:
+        response = await self.client.get("/api/tags")
+        if response.status_code != 200:
+            raise RuntimeError(f"Ollama HTTP {response.status_code}")
+
+    async def chat_completions(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.perf_counter()
+
+        try:
+            response = await self.client.post(
+                "/api/chat",
+                content=dumps(_ollama_request(payload, self.model, stream=False)),
+                extensions=httpx_extensions(),
+            )
 
             if response.status_code != 200:
                 return {
@@ -48,7 +93,7 @@ class OllamaProvider:
                     }
                 }
 
-            data = response.json()
+            data = loads(response.content)
 
         except Exception as e:
             return {
@@ -64,21 +109,61 @@ class OllamaProvider:
             "id": "ollama-fallback",
             "object": "chat.completion",
             "created": int(time.time()),
-            "model": "llama3.2:1b",
+            "model": self.model,
             "choices": [
                 {
                     "index": 0,
                     "message": {
                         "role": "assistant",
-                        "content": data.get("response", ""),
+                        "content": (data.get("message") or {}).get("content", ""),
                     },
-                    "finish_reason": "stop",
+                    "finish_reason": data.get("done_reason") or "stop",
                 }
             ],
-            "usage": {
-                "prompt_tokens": 1,
-                "completion_tokens": 1,
-                "total_tokens": 2,
-            },
+            "usage": _usage(data),
             "latency_ms": latency_ms,
-        }
\ No newline at end of file
+        }
+
+    async def chat_completions_stream(self, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        base = {
+            "id": "ollama-fallback",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": self.model,
+        }
+
+        try:
+            async with self.client.stream(
+                "POST",
+                "/api/chat",
+                content=dumps(_ollama_request(payload, self.model, stream=True)),
+                extensions=httpx_extensions(),
+            ) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    raise ProviderStreamError(
+                        "ollama_error",
+                        f"Ollama HTTP {response.status_code}: {body.decode(errors='replace')}",
+                    )
+
+                yield {**base, "choices": [{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}]}
+
+                async for data in aiter_ndjson(response.aiter_bytes()):
+                    if data.get("error"):
+                        raise ProviderStreamError("ollama_error", str(data["error"]))
+
+                    content = (data.get("message") or {}).get("content")
+                    if content:
+                        yield {**base, "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]}
+
+                    if data.get("done"):
+                        finish = data.get("done_reason") or "stop"
+                        yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": finish}]}
+                        yield {**base, "choices": [], "usage": _usage(data)}
+                        return
+
+        except httpx.HTTPError as e:
+            raise ProviderStreamError("ollama_connection_failed", str(e))
+
+        # Body ended without a done record
+        raise ProviderStreamError("stream_dropped", "Ollama stream ended early")
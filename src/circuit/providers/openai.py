@@ -1,21 +1,34 @@
 import os
 import time
-from typing import Dict, Any
+from typing import Any, AsyncIterator, Dict, Union
 
 import httpx
 
-from circuit.providers.base import ChatProvider
+from circuit.providers.base import ChatProvider, ProviderStreamError, RawCompletion
+from circuit.providers.sse import aiter_sse_json
+from circuit.serialization import dumps, loads
 from circuit.models.errors import ProviderError
+from circuit.observability.tracing import httpx_extensions
+
+
+def _retry_after_seconds(response: httpx.Response):
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        # missing, or an HTTP-date we don't bother parsing
+        return None
 
 
 class OpenAIProvider(ChatProvider):
+    supports_n = True
+
     def __init__(self) -> None:
         self.api_key = os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise RuntimeError("OPENAI_API_KEY not set")
 
         self.client = httpx.AsyncClient(
-            base_url="https://api.openai.com/v1",
+            base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
             timeout=30.0,
             headers={
                 "Authorization": f"Bearer {self.api_key}",
@@ -23,13 +36,12 @@ class OpenAIProvider(ChatProvider):
             },
         )
 
-    async def chat_completions(self, payload: Dict[str, Any]) -> Dict[str, Any]:
-        start = time.time()
-
+    async def _post(self, payload: Dict[str, Any]) -> Union[httpx.Response, Dict[str, Any]]:
         try:
             response = await self.client.post(
                 "/chat/completions",
-                json=payload,
+                content=dumps(payload),
+                extensions=httpx_extensions(),
             )
         except httpx.TimeoutException:
             return {
@@ -50,6 +62,65 @@ class OpenAIProvider(ChatProvider):
                 ).dict()
             }
 
-        data = response.json()
+        return response
+
+    async def probe(self) -> None:
+        # Listing models costs no tokens
+        response = await self.client.get("/models")
+        if response.status_code >= 400:
+            raise RuntimeError(f"OpenAI HTTP {response.status_code}")
+
+    async def chat_completions(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        start = time.time()
+
+        response = await self._post(payload)
+        if isinstance(response, dict):
+            return response
+
+        data = loads(response.content)
         data["latency_ms"] = round((time.time() - start) * 1000, 2)
-        return data
\ No newline at end of file
+        return data
+
+    async def chat_completions_raw(self, payload: Dict[str, Any]) -> Union[RawCompletion, Dict[str, Any]]:
+        start = time.time()
+
+        response = await self._post(payload)
+        if isinstance(response, dict):
+            return response
+
+        return RawCompletion(
+            body=response.content,
+            latency_ms=round((time.time() - start) * 1000, 2),
+        )
+
+    async def chat_completions_stream(self, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        # Always ask for the trailing usage chunk so settlement uses exact counts
+        payload = {
+            **payload,
+            "stream": True,
+            "stream_options": {**(payload.get("stream_options") or {}), "include_usage": True},
+        }
+
+        try:
+            async with self.client.stream(
+                "POST",
+                "/chat/completions",
+                content=dumps(payload),
+                extensions=httpx_extensions(),
+            ) as response:
+                if response.status_code >= 400:
+                    body = await response.aread()
+                    raise ProviderStreamError(
+                        "rate_limit" if response.status_code == 429 else "upstream_error",
+                        body.decode(errors="replace"),
+                        retry_after=_retry_after_seconds(response),
+                    )
+
+                # Leaving this block (client disconnect → aclose) closes the upstream response
+                async for chunk in aiter_sse_json(response.aiter_bytes()):
+                    yield chunk
+
+        except httpx.TimeoutException:
+            raise ProviderStreamError("timeout", "OpenAI request timed out")
+        except httpx.HTTPError as e:
+            raise ProviderStreamError("stream_dropped", f"OpenAI stream failed: {e!r}")
@@ -0,0 +1,87 @@
+"""
+Incremental parsers for upstream streaming bodies.
+
+Bytes are appended to one reusable bytearray and complete lines are sliced
+out of it as they arrive; a partial line simply stays in the buffer until
+the next network read. No per-line string concatenation happens.
+"""
+
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Dict, Iterator, List
+
+from circuit.serialization import loads
+
+
+class LineBuffer:
+    def __init__(self) -> None:
+        self._buf = bytearray()
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        """Yields every complete line (without the line terminator) in `data`."""
+        buf = self._buf
+        buf += data
+
+        start = 0
+        while True:
+            end = buf.find(b"\n", start)
+            if end < 0:
+                break
+
+            line_end = end - 1 if end > start and buf[end - 1] == 0x0D else end
+            yield bytes(buf[start:line_end])
+            start = end + 1
+
+        if start:
+            # Compact in place: keep only the trailing partial line
+            del buf[:start]
+
+    def flush(self) -> bytes:
+        rest = bytes(self._buf).rstrip(b"\r")
+        self._buf.clear()
+        return rest
+
+
+async def aiter_sse_json(byte_stream: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """Decodes `data:` events as JSON until `[DONE]` or end of stream."""
+    lines = LineBuffer()
+    data: List[bytes] = []
+
+    async for raw in byte_stream:
+        for line in lines.feed(raw):
+            if line:
+                if line.startswith(b"data:"):
+                    data.append(line[6:] if line[5:6] == b" " else line[5:])
+                # comments (":") and other fields (event, id, retry) are ignored
+                continue
+
+            if not data:
+                continue
+
+            payload = data[0] if len(data) == 1 else b"\n".join(data)
+            data.clear()
+
+            if payload == b"[DONE]":
+                return
+            yield loads(payload)
+
+    tail = lines.flush()
+    if tail.startswith(b"data:"):
+        data.append(tail[5:].lstrip(b" "))
+    if data:
+        payload = b"\n".join(data)
+        if payload != b"[DONE]":
+            yield loads(payload)
+
+
+async def aiter_ndjson(byte_stream: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    lines = LineBuffer()
+
+    async for raw in byte_stream:
+        for line in lines.feed(raw):
+            if line.strip():
+                yield loads(line)
+
+    tail = lines.flush()
+    if tail.strip():
+        yield loads(tail)
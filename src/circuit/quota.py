@@ -2,19 +2,32 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 
+from circuit import cluster
 from circuit.config import settings
-from circuit.storage.sqlite import get_daily_spend
+from circuit.storage.sqlite import add_spend, get_daily_spend
 
 
 def today_utc() -> str:
     return datetime.now(timezone.utc).strftime("%Y-%m-%d")
 
 
-def check_daily_quota(client_key_hash: str, additional_cost_usd: float) -> tuple[bool, float, float]:
+def check_daily_quota(
+    client_key_hash: str,
+    additional_cost_usd: float,
+    limit_usd: float | None = None,
+) -> tuple[bool, float, float]:
     date = today_utc()
     spent = float(get_daily_spend(client_key_hash, date))
-    limit = float(settings.CIRCUIT_DAILY_USD_LIMIT)
+    if cluster.node is not None:
+        spent += cluster.node.remote_spend(client_key_hash, date)
+    limit = float(settings.CIRCUIT_DAILY_USD_LIMIT if limit_usd is None else limit_usd)
 
     projected = spent + float(additional_cost_usd)
     allowed = projected <= limit
-    return allowed, spent, limit
\ No newline at end of file
+    return allowed, spent, limit
+
+
+def record_spend(client_key_hash: str, date: str, amount: float) -> None:
+    add_spend(client_key_hash, date, amount)
+    if cluster.node is not None:
+        cluster.node.spend_changed(client_key_hash, date)
@@ -1 +0,0 @@
-DEFAULT_DAILY_USD_LIMIT = 5.00
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""
+Memory bounds for streamed responses.
+
+Each stream relays through a StreamBuffer: upstream chunks are read ahead
+into it until it holds `max_bytes`, then upstream reads pause until the
+client drains it. Every buffer charges its bytes to one StreamBudget; once
+the bytes buffered across all streams exceed the budget, new streams are
+shed with a 503 until slow clients catch up or go away. Tenant priority
+moves that line: priority > 0 may also use a reserve above the budget,
+priority < 0 is shed once the budget is mostly used.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import Deque, Optional
+
+from circuit.observability.metrics import metrics
+
+
+# Fraction of the budget added for high-priority tenants, and taken away
+# for low-priority ones
+PRIORITY_RESERVE = 0.25
+
+
+class StreamBudget:
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.buffered = 0
+
+    def admit(self, priority: int = 0) -> bool:
+        if not self.max_bytes:
+            return True
+
+        limit = self.max_bytes
+        if priority > 0:
+            limit *= 1 + PRIORITY_RESERVE
+        elif priority < 0:
+            limit *= 1 - PRIORITY_RESERVE
+        return self.buffered < limit
+
+    def charge(self, size: int) -> None:
+        self.buffered += size
+        metrics.set_gauge("stream_buffered_bytes", self.buffered)
+
+
+class StreamBuffer:
+    """Bounded byte queue between the upstream reader and the client writer."""
+
+    def __init__(self, max_bytes: int, budget: StreamBudget) -> None:
+        self.max_bytes = max_bytes
+        self.budget = budget
+        self.size = 0
+        self.peak = 0
+
+        self._items: Deque[bytes] = deque()
+        self._closed = False
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+
+    async def put(self, data: bytes) -> None:
+        # An empty buffer takes any one chunk, however large
+        while self.size and self.size + len(data) > self.max_bytes:
+            self._writable.clear()
+            await self._writable.wait()
+
+        self._items.append(data)
+        self.size += len(data)
+        self.peak = max(self.peak, self.size)
+        self.budget.charge(len(data))
+        self._readable.set()
+
+    async def get(self) -> Optional[bytes]:
+        """Next chunk, or None once the writer has closed and all is drained."""
+        while not self._items:
+            if self._closed:
+                return None
+            self._readable.clear()
+            await self._readable.wait()
+
+        data = self._items.popleft()
+        self.size -= len(data)
+        self.budget.charge(-len(data))
+        self._writable.set()
+        return data
+
+    def close(self) -> None:
+        self._closed = True
+        self._readable.set()
+
+    def discard(self) -> None:
+        """Drops whatever is still buffered and returns it to the budget."""
+        self.budget.charge(-self.size)
+        self._items.clear()
+        self.size = 0
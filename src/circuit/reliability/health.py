@@ -0,0 +1,149 @@
+"""
+Active health probing of upstream providers.
+
+A background task probes every provider on a fixed interval with its
+cheapest request (ChatProvider.probe: a model list, or a one-token
+completion) and keeps, per provider:
+
+- ewma_latency_ms: smoothed probe latency (successful probes only)
+- success_rate: smoothed probe outcome, 1.0 = every probe succeeded
+- available: down after `down_after` consecutive failures, up again after
+  `up_after` consecutive successes, so one blip does not flip routing
+
+`order()` puts providers that look healthy ahead of the rest, keeping the
+configured order otherwise, so a degraded primary is skipped before user
+requests pay its timeout.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from circuit.observability.metrics import metrics
+from circuit.providers.base import ChatProvider
+
+logger = logging.getLogger("circuit.health")
+
+
+class ProviderHealth:
+    def __init__(self, name: str, provider: ChatProvider) -> None:
+        self.name = name
+        self.provider = provider
+
+        self.ewma_latency_ms: Optional[float] = None
+        self.success_rate = 1.0
+        self.available = True
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+        self.probes = 0
+        self.last_probe_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "provider": type(self.provider).__name__,
+            "available": self.available,
+            "success_rate": round(self.success_rate, 4),
+            "ewma_latency_ms": round(self.ewma_latency_ms, 2) if self.ewma_latency_ms is not None else None,
+            "probes": self.probes,
+            "last_probe_at": self.last_probe_at,
+            "last_error": self.last_error,
+        }
+
+
+class HealthProber:
+    def __init__(
+        self,
+        providers: Dict[str, ChatProvider],
+        interval_seconds: float = 10.0,
+        timeout_seconds: float = 1.5,
+        alpha: float = 0.3,
+        min_success_rate: float = 0.5,
+        max_latency_ms: float = 0.0,
+        down_after: int = 2,
+        up_after: int = 2,
+    ) -> None:
+        self.interval_seconds = interval_seconds
+        self.timeout_seconds = timeout_seconds
+        self.alpha = alpha
+        self.min_success_rate = min_success_rate
+        self.max_latency_ms = max_latency_ms
+        self.down_after = down_after
+        self.up_after = up_after
+
+        self.health = {name: ProviderHealth(name, provider) for name, provider in providers.items()}
+        self._by_provider = {id(h.provider): h for h in self.health.values()}
+
+    def healthy(self, provider: ChatProvider) -> bool:
+        h = self._by_provider.get(id(provider))
+        if h is None:
+            return True
+
+        if not h.available or h.success_rate < self.min_success_rate:
+            return False
+        if self.max_latency_ms and h.ewma_latency_ms is not None:
+            return h.ewma_latency_ms <= self.max_latency_ms
+        return True
+
+    def order(self, providers: Sequence[ChatProvider]) -> List[ChatProvider]:
+        """Healthy providers first, configured order otherwise (the sort is stable)."""
+        return sorted(providers, key=lambda p: not self.healthy(p))
+
+    def record(self, name: str, ok: bool, latency_ms: float, error: Optional[str] = None) -> None:
+        h = self.health[name]
+        a = self.alpha
+
+        h.probes += 1
+        h.last_probe_at = time.time()
+        h.success_rate = a * ok + (1 - a) * h.success_rate
+
+        if ok:
+            h.ewma_latency_ms = latency_ms if h.ewma_latency_ms is None else a * latency_ms + (1 - a) * h.ewma_latency_ms
+            h.consecutive_successes += 1
+            h.consecutive_failures = 0
+            h.last_error = None
+            if not h.available and h.consecutive_successes >= self.up_after:
+                h.available = True
+                logger.info("provider %s is available again", name)
+        else:
+            h.consecutive_failures += 1
+            h.consecutive_successes = 0
+            h.last_error = error
+            metrics.inc("health_probe_failures")
+            if h.available and h.consecutive_failures >= self.down_after:
+                h.available = False
+                logger.warning("provider %s marked unavailable: %s", name, error)
+
+        metrics.set_provider(name, "health_available", float(h.available))
+        metrics.set_provider(name, "health_success_rate", h.success_rate)
+        if h.ewma_latency_ms is not None:
+            metrics.set_provider(name, "health_ewma_latency_ms", h.ewma_latency_ms)
+
+    async def probe(self, name: str) -> None:
+        provider = self.health[name].provider
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(provider.probe(), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            self.record(name, False, 0.0, f"timed out after {self.timeout_seconds}s")
+        except Exception as e:
+            self.record(name, False, 0.0, repr(e))
+        else:
+            self.record(name, True, (time.perf_counter() - started) * 1000)
+
+    async def probe_all(self) -> None:
+        await asyncio.gather(*(self.probe(name) for name in self.health))
+
+    async def run(self) -> None:
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(self.interval_seconds)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            name: {**h.to_dict(), "healthy": self.healthy(h.provider)}
+            for name, h in self.health.items()
+        }
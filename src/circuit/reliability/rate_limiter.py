@@ -1,5 +1,5 @@
 import time
-from typing import Dict
+from typing import Dict, Optional, Set
 
 
 class TokenBucket:
@@ -9,7 +9,7 @@ class TokenBucket:
         self.tokens = capacity
         self.last_refill = time.time()
 
-    def allow(self) -> bool:
+    def _refill(self) -> None:
         now = time.time()
         elapsed = now - self.last_refill
 
@@ -19,12 +19,22 @@ class TokenBucket:
             self.tokens = min(self.capacity, self.tokens + refill_amount)
             self.last_refill = now
 
-        if self.tokens >= 1:
-            self.tokens -= 1
+    def allow(self, cost: float = 1.0) -> bool:
+        self._refill()
+
+        # A single request bigger than the bucket can still pass when full
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            self.tokens -= cost
             return True
 
         return False
 
+    def debit(self, amount: float) -> None:
+        """Takes tokens spent elsewhere; the balance may go negative, down to -capacity."""
+        self._refill()
+        self.tokens = max(self.tokens - amount, -self.capacity)
+
 
 class RateLimiter:
     def __init__(self, capacity: int = 20, refill_rate_per_sec: float = 5):
@@ -36,10 +46,56 @@ class RateLimiter:
         self.refill_rate = refill_rate_per_sec
         self.buckets: Dict[str, TokenBucket] = {}
 
-    def allow(self, client_key: str) -> bool:
-        if client_key not in self.buckets:
-            self.buckets[client_key] = TokenBucket(
-                self.capacity, self.refill_rate
-            )
+        # Cost admitted per client since start, and the clients admitted
+        # since the last drain_changed(); only kept once track_admitted()
+        # is called (cluster gossip)
+        self.admitted: Optional[Dict[str, float]] = None
+        self.changed: Set[str] = set()
+
+    def track_admitted(self) -> None:
+        if self.admitted is None:
+            self.admitted = {}
+
+    def allow(
+        self,
+        client_key: str,
+        cost: float = 1.0,
+        capacity: Optional[float] = None,
+        refill_rate_per_sec: Optional[float] = None,
+    ) -> bool:
+        """
+        capacity/refill_rate_per_sec override the limiter defaults for this
+        client, e.g. from its tenant policy; a changed policy is applied to
+        the existing bucket without resetting it.
+        """
+        capacity = self.capacity if capacity is None else capacity
+        refill_rate = self.refill_rate if refill_rate_per_sec is None else refill_rate_per_sec
+
+        bucket = self.buckets.get(client_key)
+        if bucket is None:
+            bucket = self.buckets[client_key] = TokenBucket(capacity, refill_rate)
+        elif bucket.capacity != capacity or bucket.refill_rate != refill_rate:
+            bucket.capacity = capacity
+            bucket.refill_rate = refill_rate
+            bucket.tokens = min(bucket.tokens, capacity)
+
+        if not bucket.allow(cost):
+            return False
+
+        if self.admitted is not None:
+            self.admitted[client_key] = self.admitted.get(client_key, 0.0) + min(cost, bucket.capacity)
+            self.changed.add(client_key)
+        return True
 
-        return self.buckets[client_key].allow()
\ No newline at end of file
+    def drain_changed(self) -> Set[str]:
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def debit(self, client_key: str, amount: float) -> None:
+        """
+        Charges cost admitted for this client by another node. A client
+        with no bucket here yet is skipped: its first request starts full.
+        """
+        bucket = self.buckets.get(client_key)
+        if bucket is not None:
+            bucket.debit(amount)
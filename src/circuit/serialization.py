@@ -0,0 +1,48 @@
+"""
+JSON encode/decode for request and response bodies.
+
+Uses orjson when installed (`pip install circuit-gateway[speed]`), which
+serializes straight to bytes several times faster than the stdlib. Falls
+back to a compact stdlib encoding otherwise.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+if orjson is not None:
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(data: bytes | str) -> Any:
+        return orjson.loads(data)
+
+else:
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+    def loads(data: bytes | str) -> Any:
+        return json.loads(data)
+
+
+class FastJSONResponse(Response):
+    """
+    Renders plain dicts/lists directly to bytes, skipping FastAPI's
+    jsonable_encoder pass over the whole body.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
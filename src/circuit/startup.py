@@ -0,0 +1,51 @@
+"""
+Startup phases and readiness.
+
+The startup hook does the slow one-off work (DB, provider clients,
+tokenizer encodings) before the process reports ready, so the first real
+requests after a deploy do not pay for it. Each phase is timed.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+logger = logging.getLogger("circuit.startup")
+
+
+class StartupState:
+    def __init__(self) -> None:
+        self.ready = False
+        self.phases_ms: Dict[str, float] = {}
+
+    def record(self, name: str, started: float) -> None:
+        self.phases_ms[name] = round((time.perf_counter() - started) * 1000, 2)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+
+    def mark_ready(self) -> None:
+        self.ready = True
+        logger.info(
+            "ready in %.2fms (%s)",
+            sum(self.phases_ms.values()),
+            ", ".join(f"{name} {ms:.2f}ms" for name, ms in self.phases_ms.items()),
+        )
+
+    def report(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "total_ms": round(sum(self.phases_ms.values()), 2),
+            "phases_ms": dict(self.phases_ms),
+        }
+
+
+startup_state = StartupState()
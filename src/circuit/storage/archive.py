@@ -0,0 +1,290 @@
+"""
+Compressed columnar archive for compacted request-log partitions.
+
+Layout:
+    MAGIC | u32 header length | header JSON | zlib column blocks
+
+Each column is stored as its own block, so a scan only decompresses the
+columns it asks for. Integer and float columns are packed with `array`
+(plus a null mask when needed); low-cardinality strings are dictionary
+encoded, everything else is a JSON list. read_columns decodes whole
+columns; iter_row_chunks inflates the blocks side by side, a chunk of rows
+at a time.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import struct
+import uuid
+import zlib
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+MAGIC = b"CCOL1\n"
+ARCHIVE_SUFFIX = ".ccol"
+
+_HEADER_LEN = struct.Struct("<I")
+
+# Streaming reads: compressed bytes read and inflated per step, rows per chunk
+_READ_BYTES = 64 * 1024
+CHUNK_ROWS = 1000
+
+
+def _encode_column(values: List[Any]) -> tuple[Dict[str, Any], bytes]:
+    kinds = {type(v) for v in values if v is not None}
+    nulls = bytes(1 if v is None else 0 for v in values)
+    has_nulls = any(nulls)
+
+    if kinds <= {int, bool}:
+        packed = array("q", (0 if v is None else int(v) for v in values)).tobytes()
+        meta: Dict[str, Any] = {"type": "int"}
+    elif kinds <= {int, bool, float}:
+        packed = array("d", (0.0 if v is None else float(v) for v in values)).tobytes()
+        meta = {"type": "float"}
+    else:
+        strings = [None if v is None else str(v) for v in values]
+        distinct = list(dict.fromkeys(strings))
+
+        if len(distinct) <= 0xFFFF and len(distinct) * 2 <= len(strings):
+            codes = {value: i for i, value in enumerate(distinct)}
+            meta = {"type": "dict", "values": distinct}
+            packed = array("H", (codes[v] for v in strings)).tobytes()
+        else:
+            meta = {"type": "str"}
+            packed = json.dumps(strings, separators=(",", ":")).encode()
+
+        # None survives both string encodings, no separate mask needed
+        has_nulls = False
+
+    payload = (nulls if has_nulls else b"") + packed
+    meta["nulls"] = has_nulls
+    return meta, zlib.compress(payload, 6)
+
+
+def _decode_column(meta: Dict[str, Any], block: bytes, rows: int) -> List[Any]:
+    payload = zlib.decompress(block)
+
+    nulls = None
+    if meta["nulls"]:
+        nulls, payload = payload[:rows], payload[rows:]
+
+    kind = meta["type"]
+    if kind == "int":
+        values: List[Any] = array("q", payload).tolist()
+    elif kind == "float":
+        values = array("d", payload).tolist()
+    elif kind == "dict":
+        lookup = meta["values"]
+        values = [lookup[code] for code in array("H", payload)]
+    else:
+        values = json.loads(payload)
+
+    if nulls:
+        values = [None if is_null else v for v, is_null in zip(values, nulls)]
+
+    return values
+
+
+def write_archive(path: Path, rows: int, columns: Iterable[tuple[str, List[Any]]]) -> None:
+    """
+    Writes columns (name, values) to `path` atomically.
+    Columns are consumed one at a time and each compressed block is spooled
+    to disk before the next is built, so only one column is held in memory.
+    The header goes first in the file, so the blocks are copied in after it.
+    """
+    metas = []
+    offset = 0
+
+    # Unique names: another worker may be writing the same archive
+    unique = uuid.uuid4().hex[:12]
+    spool = path.with_name(f"{path.name}.{unique}.blocks")
+    tmp = path.with_name(f"{path.name}.{unique}.tmp")
+    try:
+        with open(spool, "w+b") as blocks:
+            for name, values in columns:
+                meta, block = _encode_column(values)
+                meta.update(name=name, offset=offset, length=len(block))
+                metas.append(meta)
+                blocks.write(block)
+                offset += len(block)
+                # Let go of this column before the next one is built
+                del values, block
+
+            header = json.dumps({"rows": rows, "columns": metas}, separators=(",", ":")).encode()
+
+            blocks.seek(0)
+            with open(tmp, "wb") as f:
+                f.write(MAGIC)
+                f.write(_HEADER_LEN.pack(len(header)))
+                f.write(header)
+                shutil.copyfileobj(blocks, f)
+                f.flush()
+                os.fsync(f.fileno())
+    finally:
+        spool.unlink(missing_ok=True)
+
+    os.replace(tmp, path)
+
+
+def _read_header(f, path: Path) -> Tuple[Dict[str, Any], int]:
+    """(header, offset of the first block)"""
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{path} is not a circuit archive")
+
+    (header_len,) = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+    header = json.loads(f.read(header_len))
+    return header, f.tell()
+
+
+def read_columns(path: Path, columns: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+    with open(path, "rb") as f:
+        header, data_start = _read_header(f, path)
+
+        rows = header["rows"]
+        wanted = set(columns) if columns else None
+        result: Dict[str, List[Any]] = {}
+
+        for meta in header["columns"]:
+            if wanted is not None and meta["name"] not in wanted:
+                continue
+            f.seek(data_start + meta["offset"])
+            result[meta["name"]] = _decode_column(meta, f.read(meta["length"]), rows)
+
+    return result
+
+
+class _BlockStream:
+    """Inflates one compressed block a piece at a time; blocks share the file."""
+
+    def __init__(self, f, start: int, length: int) -> None:
+        self.f = f
+        self.pos = start
+        self.remaining = length
+        self.inflate = zlib.decompressobj()
+        self.buf = bytearray()
+
+    def _more(self) -> bool:
+        data = self.inflate.unconsumed_tail
+        if not data and self.remaining:
+            self.f.seek(self.pos)
+            data = self.f.read(min(_READ_BYTES, self.remaining))
+            self.pos += len(data)
+            self.remaining -= len(data)
+        if not data:
+            return False
+        self.buf += self.inflate.decompress(data, _READ_BYTES)
+        return True
+
+    def read(self, n: int) -> bytes:
+        while len(self.buf) < n and self._more():
+            pass
+        data = bytes(self.buf[:n])
+        del self.buf[:n]
+        return data
+
+    def skip(self, n: int) -> None:
+        while n > 0:
+            skipped = len(self.read(min(n, _READ_BYTES)))
+            if not skipped:
+                return
+            n -= skipped
+
+
+_FIXED_WIDTH = {"int": "q", "float": "d", "dict": "H"}
+_JSON = json.JSONDecoder()
+
+
+class _ColumnStream:
+    """Decodes one column `n` values at a time (see _decode_column)."""
+
+    def __init__(self, f, data_start: int, meta: Dict[str, Any], rows: int) -> None:
+        start = data_start + meta["offset"]
+        self.meta = meta
+
+        # The null mask leads the payload: read it and the values as two streams
+        self.nulls = None
+        self.values = _BlockStream(f, start, meta["length"])
+        if meta["nulls"]:
+            self.nulls = _BlockStream(f, start, meta["length"])
+            self.values.skip(rows)
+
+        # Undecoded JSON of a `str` column, and the read position in it
+        self.text = ""
+        self.text_pos = 0
+
+    def take(self, n: int) -> List[Any]:
+        kind = self.meta["type"]
+        if kind in _FIXED_WIDTH:
+            codes = array(_FIXED_WIDTH[kind])
+            codes.frombytes(self.values.read(n * codes.itemsize))
+            values = codes.tolist()
+            if kind == "dict":
+                lookup = self.meta["values"]
+                values = [lookup[code] for code in values]
+        else:
+            values = self._take_json(n)
+
+        if self.nulls is not None:
+            mask = self.nulls.read(n)
+            values = [None if is_null else v for v, is_null in zip(values, mask)]
+
+        return values
+
+    def _take_json(self, n: int) -> List[Any]:
+        # The block is one JSON list of strings and nulls (ASCII, compact)
+        values: List[Any] = []
+        while len(values) < n:
+            text, pos = self.text, self.text_pos
+            while pos < len(text) and text[pos] in "[,":
+                pos += 1
+            try:
+                value, self.text_pos = _JSON.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                more = self.values.read(_READ_BYTES)
+                if not more:
+                    raise ValueError(f"string column {self.meta['name']} ends early")
+                self.text = text[pos:] + more.decode()
+                self.text_pos = 0
+                continue
+            values.append(value)
+        return values
+
+
+def iter_row_chunks(
+    path: Path,
+    columns: Optional[List[str]] = None,
+    chunk_rows: int = CHUNK_ROWS,
+) -> Iterator[Dict[str, List[Any]]]:
+    """
+    The requested columns, `chunk_rows` rows at a time. Each column block is
+    inflated as it is read, so memory stays at one chunk whatever the size
+    of the day.
+    """
+    with open(path, "rb") as f:
+        header, data_start = _read_header(f, path)
+
+        rows = header["rows"]
+        wanted = set(columns) if columns else None
+        streams = {
+            meta["name"]: _ColumnStream(f, data_start, meta, rows)
+            for meta in header["columns"]
+            if wanted is None or meta["name"] in wanted
+        }
+
+        done = 0
+        while done < rows:
+            n = min(chunk_rows, rows - done)
+            yield {name: stream.take(n) for name, stream in streams.items()}
+            done += n
+
+
+def iter_rows(path: Path, columns: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Rows of the archive, decoded a chunk at a time (iter_row_chunks)."""
+    for chunk in iter_row_chunks(path, columns):
+        names = list(chunk)
+        for values in zip(*(chunk[name] for name in names)):
+            yield dict(zip(names, values))
@@ -0,0 +1,260 @@
+"""
+Batch job state.
+
+A job row carries the running totals; each input line is a batch_items row
+that moves from 'pending' to 'completed' or 'failed' in the same
+transaction that bumps the job's counters, so progress and cost survive a
+restart exactly. Results are also kept on the item row with their position
+in the output file (`done_seq`), which lets the runner rebuild any output
+lines lost in a crash between the commit and the file append.
+
+Every worker process runs a batch runner against this one file. A runner
+claims a job by taking its lease (`owner`, `lease_until`) in a single
+UPDATE and keeps renewing it; a job whose lease ran out, because its
+worker died, can be claimed by another.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from circuit.storage import sqlite as storage
+
+# Jobs the runner still has to work on, oldest first
+RUNNABLE_STATUSES = ("in_progress", "cancelling", "queued")
+
+
+def output_path(batch_id: str) -> Path:
+    return storage.DB_PATH.parent / "batches" / f"{batch_id}.jsonl"
+
+
+def create_batch(
+    batch_id: str,
+    client_key_hash: str,
+    created_at: str,
+    items: Sequence[Tuple[str, str]],
+) -> None:
+    """`items` are (custom_id, request body JSON) in input order."""
+    conn = storage.get_connection()
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO batch_jobs (id, client_key_hash, status, created_at, total)
+            VALUES (?, ?, 'queued', ?, ?)
+            """,
+            (batch_id, client_key_hash, created_at, len(items)),
+        )
+        conn.executemany(
+            "INSERT INTO batch_items (batch_id, line_no, custom_id, body) VALUES (?, ?, ?, ?)",
+            ((batch_id, line_no, custom_id, body) for line_no, (custom_id, body) in enumerate(items)),
+        )
+    conn.close()
+
+
+def get_batch(batch_id: str) -> Optional[Dict[str, Any]]:
+    conn = storage.get_connection()
+    row = conn.execute("SELECT * FROM batch_jobs WHERE id = ?", (batch_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def list_batches(client_key_hash: str, limit: int = 20) -> List[Dict[str, Any]]:
+    conn = storage.get_connection()
+    rows = conn.execute(
+        """
+        SELECT * FROM batch_jobs
+        WHERE client_key_hash = ?
+        ORDER BY created_at DESC
+        LIMIT ?
+        """,
+        (client_key_hash, limit),
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def claim_batch(owner: str, now: float, lease_seconds: float, started_at: str) -> Optional[Dict[str, Any]]:
+    """
+    Leases the next job nobody holds: one interrupted by a restart first,
+    then the oldest queued one (which becomes in_progress). The pick and the
+    claim are one statement, so two workers never take the same job.
+    """
+    conn = storage.get_connection()
+    with conn:
+        cursor = conn.execute(
+            f"""
+            UPDATE batch_jobs
+            SET owner = ?,
+                lease_until = ?,
+                status = CASE status WHEN 'queued' THEN 'in_progress' ELSE status END,
+                started_at = COALESCE(started_at, ?)
+            WHERE id = (
+                SELECT id FROM batch_jobs
+                WHERE status IN ({", ".join("?" * len(RUNNABLE_STATUSES))})
+                  AND (owner IS NULL OR lease_until < ?)
+                ORDER BY status = 'queued', created_at
+                LIMIT 1
+            )
+            AND (owner IS NULL OR lease_until < ?)
+            """,
+            (owner, now + lease_seconds, started_at, *RUNNABLE_STATUSES, now, now),
+        )
+        row = None
+        if cursor.rowcount == 1:
+            row = conn.execute(
+                "SELECT * FROM batch_jobs WHERE owner = ? AND lease_until = ?",
+                (owner, now + lease_seconds),
+            ).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def renew_lease(batch_id: str, owner: str, now: float, lease_seconds: float) -> Optional[str]:
+    """Extends the lease; returns the job's status, or None if `owner` lost it."""
+    conn = storage.get_connection()
+    with conn:
+        cursor = conn.execute(
+            "UPDATE batch_jobs SET lease_until = ? WHERE id = ? AND owner = ?",
+            (now + lease_seconds, batch_id, owner),
+        )
+        row = None
+        if cursor.rowcount == 1:
+            row = conn.execute("SELECT status FROM batch_jobs WHERE id = ?", (batch_id,)).fetchone()
+    conn.close()
+    return row["status"] if row else None
+
+
+def release_batch(batch_id: str, owner: str, status: Optional[str] = None, finished_at: Optional[str] = None) -> bool:
+    """
+    Gives the lease up, finishing the job as `status` if given; a job asked
+    to cancel meanwhile ends as cancelled rather than completed. False if
+    `owner` no longer held the lease.
+    """
+    conn = storage.get_connection()
+    with conn:
+        cursor = conn.execute(
+            """
+            UPDATE batch_jobs
+            SET status = CASE
+                    WHEN ? IS NULL THEN status
+                    WHEN status = 'cancelling' AND ? = 'completed' THEN 'cancelled'
+                    ELSE ?
+                END,
+                finished_at = COALESCE(?, finished_at),
+                owner = NULL,
+                lease_until = NULL
+            WHERE id = ? AND owner = ?
+            """,
+            (status, status, status, finished_at, batch_id, owner),
+        )
+    conn.close()
+    return cursor.rowcount == 1
+
+
+def request_cancel(batch_id: str, finished_at: str) -> None:
+    """Queued jobs are cancelled outright; running ones once the runner notices."""
+    conn = storage.get_connection()
+    with conn:
+        conn.execute(
+            """
+            UPDATE batch_jobs
+            SET status = CASE status WHEN 'queued' THEN 'cancelled' ELSE 'cancelling' END,
+                finished_at = CASE status WHEN 'queued' THEN ? ELSE finished_at END
+            WHERE id = ? AND status IN ('queued', 'in_progress')
+            """,
+            (finished_at, batch_id),
+        )
+    conn.close()
+
+
+def pending_items(batch_id: str, after_line: int, limit: int = 100) -> List[Dict[str, Any]]:
+    conn = storage.get_connection()
+    rows = conn.execute(
+        """
+        SELECT line_no, custom_id, body FROM batch_items
+        WHERE batch_id = ? AND line_no > ? AND status = 'pending'
+        ORDER BY line_no
+        LIMIT ?
+        """,
+        (batch_id, after_line, limit),
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def finish_item(
+    batch_id: str,
+    line_no: int,
+    ok: bool,
+    result: str,
+    tokens_input: int,
+    tokens_output: int,
+    cost_usd: float,
+) -> Optional[int]:
+    """
+    Stores the item's output line and updates the job totals. Returns its
+    done_seq, or None if the item was already finished (by a runner whose
+    lease had run out), in which case nothing changes.
+    """
+    conn = storage.get_connection()
+    seq = None
+    with conn:
+        # Takes the write lock before reading the sequence number
+        cursor = conn.execute(
+            """
+            UPDATE batch_items SET status = ?, result = ?
+            WHERE batch_id = ? AND line_no = ? AND status = 'pending'
+            """,
+            ("completed" if ok else "failed", result, batch_id, line_no),
+        )
+        if cursor.rowcount == 1:
+            seq = conn.execute(
+                "SELECT completed + failed FROM batch_jobs WHERE id = ?",
+                (batch_id,),
+            ).fetchone()[0]
+            conn.execute(
+                "UPDATE batch_items SET done_seq = ? WHERE batch_id = ? AND line_no = ?",
+                (seq, batch_id, line_no),
+            )
+            conn.execute(
+                f"""
+                UPDATE batch_jobs
+                SET {"completed" if ok else "failed"} = {"completed" if ok else "failed"} + 1,
+                    tokens_input = tokens_input + ?,
+                    tokens_output = tokens_output + ?,
+                    cost_usd = cost_usd + ?
+                WHERE id = ?
+                """,
+                (tokens_input, tokens_output, cost_usd, batch_id),
+            )
+    conn.close()
+    return seq
+
+
+def done_seq(batch_id: str, line_no: int) -> Optional[int]:
+    conn = storage.get_connection()
+    row = conn.execute(
+        "SELECT done_seq FROM batch_items WHERE batch_id = ? AND line_no = ?",
+        (batch_id, line_no),
+    ).fetchone()
+    conn.close()
+    return row["done_seq"] if row else None
+
+
+def results_from(batch_id: str, seq: int) -> Iterator[str]:
+    """Output lines with done_seq >= seq, in output order."""
+    conn = storage.get_connection()
+    try:
+        rows = conn.execute(
+            """
+            SELECT result FROM batch_items
+            WHERE batch_id = ? AND done_seq >= ?
+            ORDER BY done_seq
+            """,
+            (batch_id, seq),
+        )
+        for row in rows:
+            yield row["result"]
+    finally:
+        conn.close()
@@ -0,0 +1,245 @@
+"""
+Streaming export of the request log.
+
+Rows are read in short keyset-paginated pages (rowid > last LIMIT n), so each
+page is its own brief read transaction. Together with WAL mode this means an
+export never holds a lock that blocks record_request, and memory stays at one
+page regardless of export size. Archived days are read in row chunks the
+same way. A day compacted while the export runs is read from its archive.
+
+    python -m circuit.storage.export --format csv --start 2026-01-01 > requests.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from circuit.storage import sqlite as storage
+from circuit.storage.archive import iter_rows
+from circuit.storage.partitions import archive_path, list_archives, list_partitions
+
+EXPORT_COLUMNS = [
+    "request_id",
+    "timestamp",
+    "client_key_hash",
+    "provider",
+    "model",
+    "status_code",
+    "latency_ms",
+    "tokens_input",
+    "tokens_output",
+    "cost_usd",
+    "stream",
+]
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+PAGE_SIZE = 1000
+
+
+def _in_day_range(day: str, start: Optional[str], end: Optional[str]) -> bool:
+    if start and day < start[:10]:
+        return False
+    if end and day > end[:10]:
+        return False
+    return True
+
+
+def _matches(
+    row: Dict[str, Any],
+    start: Optional[str],
+    end: Optional[str],
+    client_key_hash: Optional[str],
+    model: Optional[str],
+    status_code: Optional[int],
+) -> bool:
+    ts = row.get("timestamp") or ""
+    if start and ts < start:
+        return False
+    if end and ts >= end:
+        return False
+    if client_key_hash and row.get("client_key_hash") != client_key_hash:
+        return False
+    if model and row.get("model") != model:
+        return False
+    if status_code is not None and row.get("status_code") != status_code:
+        return False
+    return True
+
+
+def _iter_sqlite(
+    path: Path,
+    start: Optional[str],
+    end: Optional[str],
+    client_key_hash: Optional[str],
+    model: Optional[str],
+    status_code: Optional[int],
+) -> Iterator[Dict[str, Any]]:
+    """Raises FileNotFoundError, before yielding anything, if `path` is gone."""
+    clauses = ["rowid > ?"]
+    params: List[Any] = []
+
+    if start:
+        clauses.append("timestamp >= ?")
+        params.append(start)
+    if end:
+        clauses.append("timestamp < ?")
+        params.append(end)
+    if client_key_hash:
+        clauses.append("client_key_hash = ?")
+        params.append(client_key_hash)
+    if model:
+        clauses.append("model = ?")
+        params.append(model)
+    if status_code is not None:
+        clauses.append("status_code = ?")
+        params.append(status_code)
+
+    # Starlette may resume a sync generator on a different worker thread
+    try:
+        conn = sqlite3.connect(
+            f"file:{path}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+        )
+    except sqlite3.OperationalError:
+        raise FileNotFoundError(path)
+    conn.row_factory = sqlite3.Row
+
+    try:
+        present = {row[1] for row in conn.execute("PRAGMA table_info(requests)")}
+        if not present:
+            return
+
+        selected = ", ".join(
+            f'"{name}"' if name in present else f'NULL AS "{name}"' for name in EXPORT_COLUMNS
+        )
+        query = (
+            f"SELECT rowid AS _rowid, {selected} FROM requests "
+            f"WHERE {' AND '.join(clauses)} ORDER BY rowid LIMIT {PAGE_SIZE}"
+        )
+
+        last_rowid = 0
+        while True:
+            page = conn.execute(query, [last_rowid, *params]).fetchall()
+            if not page:
+                return
+
+            last_rowid = page[-1]["_rowid"]
+            for row in page:
+                data = dict(row)
+                del data["_rowid"]
+                yield data
+    finally:
+        conn.close()
+
+
+def iter_request_rows(
+    *,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    client_key_hash: Optional[str] = None,
+    model: Optional[str] = None,
+    status_code: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yields request rows from the legacy table, compacted archives and live
+    day partitions, oldest day first. start/end are ISO timestamps; end is exclusive.
+    """
+    filters = (start, end, client_key_hash, model, status_code)
+
+    if storage.DB_PATH.exists():
+        yield from _iter_sqlite(storage.DB_PATH, *filters)
+
+    archived = set(list_archives())
+    live = set(list_partitions())
+
+    for day in sorted(archived | live):
+        if not _in_day_range(day, start, end):
+            continue
+
+        if day in archived:
+            yield from _iter_archive(archive_path(day), filters)
+
+        if day in live:
+            try:
+                yield from _iter_sqlite(storage.partition_path(day), *filters)
+            except FileNotFoundError:
+                # Compacted since the listing: its rows are in the archive now
+                if archive_path(day).exists():
+                    yield from _iter_archive(archive_path(day), filters)
+
+
+def _iter_archive(path: Path, filters: tuple) -> Iterator[Dict[str, Any]]:
+    # A chunk of rows at a time, never the whole day
+    for row in iter_rows(path, EXPORT_COLUMNS):
+        if _matches(row, *filters):
+            yield {name: row.get(name) for name in EXPORT_COLUMNS}
+
+
+def encode_rows(rows: Iterator[Dict[str, Any]], fmt: str) -> Iterator[str]:
+    """Encodes rows as NDJSON or CSV, one chunk per page of rows."""
+    buffer = io.StringIO()
+    writer = None
+
+    if fmt == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+
+    count = 0
+    for row in rows:
+        if writer is not None:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row, separators=(",", ":")))
+            buffer.write("\n")
+
+        count += 1
+        if count % PAGE_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    tail = buffer.getvalue()
+    if tail:
+        yield tail
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export the circuit request log")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--start", help="ISO timestamp, inclusive")
+    parser.add_argument("--end", help="ISO timestamp, exclusive")
+    parser.add_argument("--client", help="client_key_hash")
+    parser.add_argument("--model")
+    parser.add_argument("--status", type=int)
+    parser.add_argument("--db", help="path to circuit.db (default: data/circuit.db)")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        storage.DB_PATH = Path(args.db)
+
+    rows = iter_request_rows(
+        start=args.start,
+        end=args.end,
+        client_key_hash=args.client,
+        model=args.model,
+        status_code=args.status,
+    )
+
+    for chunk in encode_rows(rows, args.format):
+        sys.stdout.write(chunk)
+
+
+if __name__ == "__main__":
+    main()
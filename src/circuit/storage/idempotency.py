@@ -0,0 +1,84 @@
+"""
+Idempotency-Key rows, shared by every worker on the host.
+
+A key is claimed by inserting a row with no response and a short lease;
+the claim and the clean-up of an expired row run in one transaction, so
+exactly one request wins. The winner later stores its response (and the
+long TTL) or deletes the row if there is nothing worth replaying.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+from circuit.storage import sqlite as storage
+
+
+def claim_key(
+    client_key_hash: str,
+    key: str,
+    fingerprint: str,
+    now: float,
+    lease_seconds: float,
+) -> Optional[Dict[str, Any]]:
+    """None if the caller now owns the key, else the existing row."""
+    conn = storage.get_connection()
+    with conn:
+        conn.execute(
+            "DELETE FROM idempotency_keys WHERE client_key_hash = ? AND key = ? AND expires_at < ?",
+            (client_key_hash, key, now),
+        )
+        cursor = conn.execute(
+            """
+            INSERT OR IGNORE INTO idempotency_keys (client_key_hash, key, fingerprint, expires_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (client_key_hash, key, fingerprint, now + lease_seconds),
+        )
+        row = None
+        if cursor.rowcount != 1:
+            row = conn.execute(
+                "SELECT * FROM idempotency_keys WHERE client_key_hash = ? AND key = ?",
+                (client_key_hash, key),
+            ).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def store_response(
+    client_key_hash: str,
+    key: str,
+    status_code: int,
+    headers: str,
+    body: bytes,
+    expires_at: float,
+) -> None:
+    conn = storage.get_connection()
+    with conn:
+        conn.execute(
+            """
+            UPDATE idempotency_keys
+            SET status_code = ?, headers = ?, body = ?, expires_at = ?
+            WHERE client_key_hash = ? AND key = ?
+            """,
+            (status_code, headers, body, expires_at, client_key_hash, key),
+        )
+    conn.close()
+
+
+def release_key(client_key_hash: str, key: str) -> None:
+    conn = storage.get_connection()
+    with conn:
+        conn.execute(
+            "DELETE FROM idempotency_keys WHERE client_key_hash = ? AND key = ? AND status_code IS NULL",
+            (client_key_hash, key),
+        )
+    conn.close()
+
+
+def purge_expired(now: float) -> int:
+    conn = storage.get_connection()
+    with conn:
+        deleted = conn.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (now,)).rowcount
+    conn.close()
+    return deleted
@@ -0,0 +1,184 @@
+"""
+Day partitions of the request log: retention and compaction.
+
+Every worker runs maintenance, so each day is changed under an exclusive
+lock file (`<day>.lock`, flock'd, released by the OS if the holder dies)
+and its state is re-checked once the lock is held; a day another worker is
+busy with is skipped until the next pass.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import logging
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from circuit.storage.archive import ARCHIVE_SUFFIX, write_archive
+from circuit.storage.sqlite import (
+    forget_partition,
+    partition_path,
+    partition_root,
+    prune_rollups,
+)
+
+logger = logging.getLogger("circuit.storage")
+
+
+def archive_path(day: str) -> Path:
+    return partition_root() / f"{day}{ARCHIVE_SUFFIX}"
+
+
+def _days_with_suffix(suffix: str) -> List[str]:
+    root = partition_root()
+    if not root.exists():
+        return []
+
+    days = []
+    for path in root.glob(f"*{suffix}"):
+        try:
+            date.fromisoformat(path.stem)
+        except ValueError:
+            continue
+        days.append(path.stem)
+
+    return sorted(days)
+
+
+def list_partitions() -> List[str]:
+    """Days that still have a live SQLite partition."""
+    return _days_with_suffix(".db")
+
+
+def list_archives() -> List[str]:
+    """Days that have been compacted into a columnar archive."""
+    return _days_with_suffix(ARCHIVE_SUFFIX)
+
+
+def _unlink_partition(day: str) -> None:
+    forget_partition(day)
+    db = partition_path(day)
+    for path in (db, db.with_name(db.name + "-wal"), db.with_name(db.name + "-shm")):
+        path.unlink(missing_ok=True)
+
+
+def _lock_path(day: str) -> Path:
+    return partition_root() / f"{day}.lock"
+
+
+@contextmanager
+def _day_lock(day: str) -> Iterator[bool]:
+    """Yields whether this worker got the day; never waits for another."""
+    partition_root().mkdir(parents=True, exist_ok=True)
+    with open(_lock_path(day), "ab") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def drop_day(day: str) -> bool:
+    """False if another worker holds the day; it is dropped on a later pass."""
+    with _day_lock(day) as locked:
+        if not locked:
+            return False
+        _unlink_partition(day)
+        archive_path(day).unlink(missing_ok=True)
+        _lock_path(day).unlink(missing_ok=True)
+    return True
+
+
+def compact_partition(day: str) -> Optional[int]:
+    """
+    Rewrites a day partition as a columnar archive and removes the SQLite file.
+    Returns the number of rows archived, or None if another worker holds the
+    day or has already compacted or dropped it.
+    """
+    with _day_lock(day) as locked:
+        if not locked:
+            return None
+        return _compact_locked(day)
+
+
+def _compact_locked(day: str) -> Optional[int]:
+    # mode=rw: a partition that is gone must not be recreated empty
+    try:
+        conn = sqlite3.connect(f"{partition_path(day).resolve().as_uri()}?mode=rw", uri=True)
+    except sqlite3.OperationalError:
+        return None
+
+    try:
+        names = [row[1] for row in conn.execute("PRAGMA table_info(requests)")]
+
+        # A file left without a schema holds no rows and gets no archive
+        rows = 0
+        if names:
+            rows = conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0]
+
+            # One column per query keeps peak memory at a single column
+            def columns():
+                for name in names:
+                    values = [
+                        row[0]
+                        for row in conn.execute(
+                            f'SELECT "{name}" FROM requests ORDER BY timestamp, request_id'
+                        )
+                    ]
+                    yield name, values
+
+            write_archive(archive_path(day), rows, columns())
+    finally:
+        conn.close()
+
+    _unlink_partition(day)
+    return rows
+
+
+def run_maintenance(
+    retention_days: int,
+    compact_after_days: int,
+    today: Optional[date] = None,
+) -> Dict[str, List[str]]:
+    """
+    Drops partitions older than the retention window and compacts partitions
+    older than `compact_after_days`. A value of 0 disables that step.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    dropped: List[str] = []
+    compacted: List[str] = []
+
+    if retention_days > 0:
+        cutoff = (today - timedelta(days=retention_days)).isoformat()
+
+        # Lock files too: a day compacted to nothing leaves only its lock
+        days = set(list_partitions()) | set(list_archives()) | set(_days_with_suffix(".lock"))
+        for day in sorted(days):
+            if day < cutoff and drop_day(day):
+                dropped.append(day)
+
+        # Minute rollups are only useful for recent dashboards
+        prune_rollups("minute", cutoff)
+
+    if compact_after_days > 0:
+        cutoff = (today - timedelta(days=compact_after_days)).isoformat()
+
+        for day in list_partitions():
+            if day < cutoff:
+                rows = compact_partition(day)
+                if rows is None:
+                    continue
+                compacted.append(day)
+                logger.info("compacted partition %s (%d rows)", day, rows)
+
+    if dropped:
+        logger.info("dropped expired partitions: %s", ", ".join(dropped))
+
+    return {"dropped": dropped, "compacted": compacted}
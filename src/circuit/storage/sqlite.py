@@ -1,9 +1,34 @@
 import sqlite3
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterable, Optional, Tuple
+
+from circuit.observability.tracing import traced
 
 DB_PATH = Path("data/circuit.db")
 
+# Bumped whenever init_db needs to migrate an existing database
+SCHEMA_VERSION = 2
+
+# Rollup table -> length of the ISO timestamp prefix used as its bucket
+# ("2026-01-31T12:34" for minutes, "2026-01-31T12" for hours)
+ROLLUP_TABLES = {
+    "minute": ("usage_minute", 16),
+    "hour": ("usage_hour", 13),
+}
+
+# Raw request rows are written to one SQLite file per UTC day under this
+# directory, so retention is a file unlink rather than DELETE + VACUUM.
+# The `requests` table in the main DB only holds pre-partitioning history.
+PARTITION_DIR_NAME = "requests"
+
+# record_request's connection, kept for the life of the process with one
+# day's partition attached as `part`; it is re-attached only when the day
+# rolls over, not on every insert
+_writer: Optional[sqlite3.Connection] = None
+_writer_key: Tuple[Optional[Path], Optional[str]] = (None, None)
+_writer_lock = threading.Lock()
+
 
 def get_connection() -> sqlite3.Connection:
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
@@ -12,8 +37,99 @@ def get_connection() -> sqlite3.Connection:
     return conn
 
 
+def partition_root() -> Path:
+    return DB_PATH.parent / PARTITION_DIR_NAME
+
+
+def partition_path(day: str) -> Path:
+    return partition_root() / f"{day}.db"
+
+
+def attach_partition(conn: sqlite3.Connection, day: str, alias: str = "part") -> None:
+    partition_root().mkdir(parents=True, exist_ok=True)
+    conn.execute(f"ATTACH DATABASE ? AS {alias}", (str(partition_path(day)),))
+
+    # The schema is checked on every attach: another worker may have
+    # dropped the day since this process last wrote to it
+    # WAL lets exports and dashboards read while record_request writes
+    conn.execute(f"PRAGMA {alias}.journal_mode=WAL")
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {alias}.requests (
+            request_id TEXT PRIMARY KEY,
+            timestamp TEXT,
+            provider TEXT,
+            model TEXT,
+            status_code INTEGER,
+            latency_ms INTEGER,
+            tokens_input INTEGER,
+            tokens_output INTEGER,
+            cost_usd REAL,
+            client_key_hash TEXT,
+            stream INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS {alias}.idx_requests_client_ts
+        ON requests (client_key_hash, timestamp)
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS {alias}.idx_requests_model_ts
+        ON requests (model, timestamp)
+        """
+    )
+
+
+def prepare_partition(day: str) -> None:
+    """Creates the day's partition file ahead of its first write."""
+    conn = get_connection()
+    attach_partition(conn, day)
+    conn.commit()
+    conn.close()
+
+
+def _partition_writer(day: str) -> sqlite3.Connection:
+    """The writer connection with `day` attached. Call with _writer_lock held."""
+    global _writer, _writer_key
+
+    if _writer is not None and _writer_key[0] != DB_PATH:
+        _writer.close()
+        _writer = None
+
+    if _writer is None:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        # Shared by the event loop and worker threads, under _writer_lock
+        _writer = sqlite3.connect(DB_PATH, check_same_thread=False)
+        _writer_key = (DB_PATH, None)
+
+    if _writer_key[1] != day:
+        if _writer_key[1] is not None:
+            _writer.execute("DETACH DATABASE part")
+            _writer_key = (DB_PATH, None)
+        attach_partition(_writer, day)
+        _writer.commit()
+        _writer_key = (DB_PATH, day)
+
+    return _writer
+
+
+def forget_partition(day: str) -> None:
+    """Lets go of the day's file before it is removed."""
+    global _writer_key
+
+    with _writer_lock:
+        if _writer is not None and _writer_key[1] == day:
+            _writer.execute("DETACH DATABASE part")
+            _writer_key = (_writer_key[0], None)
+
+
 def init_db() -> None:
     conn = get_connection()
+    conn.execute("PRAGMA journal_mode=WAL")
     cursor = conn.cursor()
 
     cursor.execute(
@@ -43,10 +159,170 @@ def init_db() -> None:
         """
     )
 
+    # Cluster gossip reads a whole day's spend
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_quota_usage_date
+        ON quota_usage (date)
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tenant_policies (
+            client_key_hash TEXT PRIMARY KEY,
+            policy TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS batch_jobs (
+            id TEXT PRIMARY KEY,
+            client_key_hash TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            total INTEGER NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            tokens_input INTEGER NOT NULL DEFAULT 0,
+            tokens_output INTEGER NOT NULL DEFAULT 0,
+            cost_usd REAL NOT NULL DEFAULT 0,
+            owner TEXT,
+            lease_until REAL
+        )
+        """
+    )
+
+    # One row per input line; `result` is the output line, `done_seq` its
+    # position in the output file
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS batch_items (
+            batch_id TEXT NOT NULL,
+            line_no INTEGER NOT NULL,
+            custom_id TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            result TEXT,
+            done_seq INTEGER,
+            PRIMARY KEY (batch_id, line_no)
+        )
+        """
+    )
+
+    # Idempotency-Key claims and stored responses. status_code is NULL
+    # while the first request is still running; expires_at is then its lease
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            client_key_hash TEXT NOT NULL,
+            key TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            status_code INTEGER,
+            headers TEXT,
+            body BLOB,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (client_key_hash, key)
+        )
+        """
+    )
+
+    for table, _ in ROLLUP_TABLES.values():
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket TEXT,
+                client_key_hash TEXT,
+                model TEXT,
+                provider TEXT,
+                requests INTEGER NOT NULL DEFAULT 0,
+                errors INTEGER NOT NULL DEFAULT 0,
+                tokens_input INTEGER NOT NULL DEFAULT 0,
+                tokens_output INTEGER NOT NULL DEFAULT 0,
+                cost_usd REAL NOT NULL DEFAULT 0,
+                latency_ms_total INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, client_key_hash, model, provider)
+            )
+            """
+        )
+        cursor.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS idx_{table}_client_bucket
+            ON {table} (client_key_hash, bucket)
+            """
+        )
+
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    if version < SCHEMA_VERSION:
+        _migrate(cursor, version)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
     conn.commit()
     conn.close()
 
 
+def _migrate(cursor: sqlite3.Cursor, version: int) -> None:
+    if version < 1:
+        # v1: tenant + stream dimensions, secondary indexes, rollup backfill
+        columns = {row["name"] for row in cursor.execute("PRAGMA table_info(requests)")}
+        if "client_key_hash" not in columns:
+            cursor.execute("ALTER TABLE requests ADD COLUMN client_key_hash TEXT")
+        if "stream" not in columns:
+            cursor.execute("ALTER TABLE requests ADD COLUMN stream INTEGER NOT NULL DEFAULT 0")
+
+        cursor.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_requests_client_ts
+            ON requests (client_key_hash, timestamp)
+            """
+        )
+        cursor.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_requests_model_ts
+            ON requests (model, timestamp)
+            """
+        )
+
+        for table, width in ROLLUP_TABLES.values():
+            cursor.execute(
+                f"""
+                INSERT OR REPLACE INTO {table} (
+                    bucket, client_key_hash, model, provider,
+                    requests, errors, tokens_input, tokens_output,
+                    cost_usd, latency_ms_total
+                )
+                SELECT
+                    substr(timestamp, 1, {width}),
+                    COALESCE(client_key_hash, 'unknown'),
+                    COALESCE(model, 'unknown'),
+                    COALESCE(provider, 'unknown'),
+                    COUNT(*),
+                    SUM(CASE WHEN status_code >= 400 THEN 1 ELSE 0 END),
+                    COALESCE(SUM(tokens_input), 0),
+                    COALESCE(SUM(tokens_output), 0),
+                    COALESCE(SUM(cost_usd), 0),
+                    COALESCE(SUM(latency_ms), 0)
+                FROM requests
+                WHERE timestamp IS NOT NULL
+                GROUP BY 1, 2, 3, 4
+                """
+            )
+
+    if version < 2:
+        # v2: batch job leases, so one worker runs each job
+        columns = {row["name"] for row in cursor.execute("PRAGMA table_info(batch_jobs)")}
+        if "owner" not in columns:
+            cursor.execute("ALTER TABLE batch_jobs ADD COLUMN owner TEXT")
+        if "lease_until" not in columns:
+            cursor.execute("ALTER TABLE batch_jobs ADD COLUMN lease_until REAL")
+
+
+@traced("db_write")
 def record_request(
     *,
     request_id: str,
@@ -58,42 +334,202 @@ def record_request(
     tokens_input: Optional[int],
     tokens_output: Optional[int],
     cost_usd: Optional[float],
-) -> None:
+    client_key_hash: Optional[str] = None,
+    stream: bool = False,
+) -> str:
+    """
+    Returns the request_id the row was stored under. Ids are unique per
+    request, but a re-run (a batch item retried after a crash) can meet its
+    earlier row; it is then stored as `<request_id>~<n>` rather than lost.
+    """
+    with _writer_lock:
+        conn = _partition_writer(timestamp[:10])
+        try:
+            row_id = _insert_request(
+                conn.cursor(),
+                request_id,
+                timestamp,
+                provider,
+                model,
+                status_code,
+                latency_ms,
+                tokens_input,
+                tokens_output,
+                cost_usd,
+                client_key_hash,
+                stream,
+            )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return row_id
+
+
+def _insert_request(
+    cursor: sqlite3.Cursor,
+    request_id: str,
+    timestamp: str,
+    provider: str,
+    model: str,
+    status_code: int,
+    latency_ms: int,
+    tokens_input: Optional[int],
+    tokens_output: Optional[int],
+    cost_usd: Optional[float],
+    client_key_hash: Optional[str],
+    stream: bool,
+) -> str:
+    row_id = request_id
+    attempt = 0
+    while True:
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO part.requests (
+                request_id,
+                timestamp,
+                provider,
+                model,
+                status_code,
+                latency_ms,
+                tokens_input,
+                tokens_output,
+                cost_usd,
+                client_key_hash,
+                stream
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                row_id,
+                timestamp,
+                provider,
+                model,
+                status_code,
+                latency_ms,
+                tokens_input,
+                tokens_output,
+                cost_usd,
+                client_key_hash,
+                int(stream),
+            ),
+        )
+        if cursor.rowcount == 1:
+            break
+        attempt += 1
+        row_id = f"{request_id}~{attempt}"
+
+    # Rollups are maintained in the same transaction as the raw row
+    for table, width in ROLLUP_TABLES.values():
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (
+                bucket, client_key_hash, model, provider,
+                requests, errors, tokens_input, tokens_output,
+                cost_usd, latency_ms_total
+            )
+            VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?)
+            ON CONFLICT(bucket, client_key_hash, model, provider)
+            DO UPDATE SET
+                requests = requests + 1,
+                errors = errors + excluded.errors,
+                tokens_input = tokens_input + excluded.tokens_input,
+                tokens_output = tokens_output + excluded.tokens_output,
+                cost_usd = cost_usd + excluded.cost_usd,
+                latency_ms_total = latency_ms_total + excluded.latency_ms_total
+            """,
+            (
+                timestamp[:width],
+                client_key_hash or "unknown",
+                model,
+                provider,
+                1 if status_code >= 400 else 0,
+                tokens_input or 0,
+                tokens_output or 0,
+                cost_usd or 0.0,
+                int(latency_ms or 0),
+            ),
+        )
+
+    return row_id
+
+
+def get_usage(
+    *,
+    granularity: str = "hour",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    client_key_hash: Optional[str] = None,
+    model: Optional[str] = None,
+) -> list[dict]:
+    """
+    Reads pre-aggregated usage from the rollup tables.
+    start/end are ISO timestamps, truncated to the bucket width; end is exclusive.
+    """
+    table, width = ROLLUP_TABLES[granularity]
+
+    clauses = []
+    params: list = []
+
+    if start:
+        clauses.append("bucket >= ?")
+        params.append(start[:width])
+    if end:
+        clauses.append("bucket < ?")
+        params.append(end[:width])
+    if client_key_hash:
+        clauses.append("client_key_hash = ?")
+        params.append(client_key_hash)
+    if model:
+        clauses.append("model = ?")
+        params.append(model)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
     conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute(
-        """
-        INSERT INTO requests (
-            request_id,
-            timestamp,
-            provider,
+        f"""
+        SELECT
+            bucket,
+            client_key_hash,
             model,
-            status_code,
-            latency_ms,
-            tokens_input,
-            tokens_output,
-            cost_usd
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            SUM(requests) AS requests,
+            SUM(errors) AS errors,
+            SUM(tokens_input) AS tokens_input,
+            SUM(tokens_output) AS tokens_output,
+            SUM(cost_usd) AS cost_usd,
+            SUM(latency_ms_total) AS latency_ms_total
+        FROM {table}
+        {where}
+        GROUP BY bucket, client_key_hash, model
+        ORDER BY bucket, client_key_hash, model
         """,
-        (
-            request_id,
-            timestamp,
-            provider,
-            model,
-            status_code,
-            latency_ms,
-            tokens_input,
-            tokens_output,
-            cost_usd,
-        ),
+        params,
     )
 
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+
+    return rows
+
+
+def prune_rollups(granularity: str, before: str) -> int:
+    table, width = ROLLUP_TABLES[granularity]
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"DELETE FROM {table} WHERE bucket < ?", (before[:width],))
+    deleted = cursor.rowcount
+
     conn.commit()
     conn.close()
 
+    return deleted
 
+
+@traced("db_read")
 def get_daily_spend(client_key_hash: str, date: str) -> float:
     conn = get_connection()
     cursor = conn.cursor()
@@ -112,6 +548,34 @@ def get_daily_spend(client_key_hash: str, date: str) -> float:
     return row["usd_spent"] if row else 0.0
 
 
+def get_spend_for_date(date: str, clients: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """Spend per client on `date`, for every client or only `clients`."""
+    conn = get_connection()
+
+    if clients is None:
+        rows = conn.execute(
+            "SELECT client_key_hash, usd_spent FROM quota_usage WHERE date = ?",
+            (date,),
+        ).fetchall()
+    else:
+        clients = list(clients)
+        rows = []
+        # Stays under SQLite's bound-parameter limit
+        for i in range(0, len(clients), 500):
+            chunk = clients[i : i + 500]
+            rows += conn.execute(
+                f"""
+                SELECT client_key_hash, usd_spent FROM quota_usage
+                WHERE date = ? AND client_key_hash IN ({",".join("?" * len(chunk))})
+                """,
+                (date, *chunk),
+            ).fetchall()
+    conn.close()
+
+    return {row["client_key_hash"]: row["usd_spent"] for row in rows}
+
+
+@traced("db_write")
 def add_spend(client_key_hash: str, date: str, amount: float) -> None:
     conn = get_connection()
     cursor = conn.cursor()
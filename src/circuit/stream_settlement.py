@@ -1,15 +1,19 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import List, Dict
+from typing import Dict, List, Optional
 
 from circuit.tokenizer import (
     count_tokens_from_messages,
     count_tokens_from_text,
 )
 from circuit.cost import estimate_cost_usd
-from circuit.storage.sqlite import record_request, add_spend
-from circuit.quota import check_daily_quota, today_utc
+from circuit.storage.sqlite import record_request
+from circuit.quota import check_daily_quota, record_spend, today_utc
+
+# Output text held before it is tokenized and dropped; the count can be off
+# by a token where a batch boundary splits one
+COUNT_BATCH_CHARS = 16384
 
 
 class StreamSession:
@@ -20,15 +24,31 @@ class StreamSession:
         provider_name: str,
         model: str,
         breaker,
+        daily_usd_limit: Optional[float] = None,
+        keep_output: bool = False,
     ):
         self.request_id = request_id
         self.client_key_hash = client_key_hash
         self.provider_name = provider_name
         self.model = model
         self.breaker = breaker
+        self.daily_usd_limit = daily_usd_limit
 
         self.messages: List[Dict] = []
+        # Output of the current provider segment not yet tokenized, and
+        # tokens counted from earlier batches
         self.output_chunks: List[str] = []
+        self.output_chars = 0
+        self.counted_tokens = 0
+        # The whole output across segments, only kept when resuming may need it
+        self.keep_output = keep_output
+        self.emitted_chunks: List[str] = []
+        self.segment = 0
+
+        # Exact usage reported by the upstream's final chunk, if any
+        self.usage: Optional[Dict] = None
+        # Set by the first finalize_*; later calls settle nothing
+        self.settled = False
 
         self.start_time = datetime.now(timezone.utc)
 
@@ -36,18 +56,31 @@ class StreamSession:
         self.messages = messages or []
 
     def record_chunk(self, text: str):
-        if text:
-            self.output_chunks.append(text)
+        if not text:
+            return
 
-    def finalize_success(self):
-        end_time = datetime.now(timezone.utc)
-        latency_ms = (end_time - self.start_time).total_seconds() * 1000
+        self.output_chunks.append(text)
+        self.output_chars += len(text)
+        if self.keep_output:
+            self.emitted_chunks.append(text)
 
-        full_output = "".join(self.output_chunks)
+        if self.output_chars >= COUNT_BATCH_CHARS:
+            self.counted_tokens += count_tokens_from_text(self.model, "".join(self.output_chunks))
+            self.output_chunks = []
+            self.output_chars = 0
 
-        # REAL TOKEN COUNTING (no more char hacks)
-        prompt_tokens = count_tokens_from_messages(self.model, self.messages)
-        completion_tokens = count_tokens_from_text(self.model, full_output)
+    def _completion_tokens(self) -> int:
+        return self.counted_tokens + count_tokens_from_text(self.model, "".join(self.output_chunks))
+
+    def record_usage(self, usage: Dict):
+        self.usage = usage
+
+    def partial_output(self) -> str:
+        """Everything sent to the client so far, across all segments (needs keep_output)."""
+        return "".join(self.emitted_chunks)
+
+    def _settle(self, request_id: str, status_code: int, prompt_tokens: int, completion_tokens: int) -> float:
+        latency_ms = (datetime.now(timezone.utc) - self.start_time).total_seconds() * 1000
 
         cost_usd = estimate_cost_usd(
             self.model,
@@ -59,43 +92,113 @@ class StreamSession:
         ok, spent, limit = check_daily_quota(
             self.client_key_hash,
             cost_usd,
+            self.daily_usd_limit,
         )
 
         if ok and cost_usd > 0:
-            add_spend(
+            record_spend(
                 self.client_key_hash,
                 today_utc(),
                 cost_usd,
             )
 
         record_request(
-            request_id=self.request_id,
+            request_id=request_id,
             timestamp=self.start_time.isoformat(),
             provider=self.provider_name,
             model=self.model,
-            status_code=200,
+            status_code=status_code,
             latency_ms=int(latency_ms),
             tokens_input=prompt_tokens,
             tokens_output=completion_tokens,
             cost_usd=cost_usd,
+            client_key_hash=self.client_key_hash,
+            stream=True,
         )
 
+        return cost_usd
+
+    def start_segment(self, provider_name: str, messages: List[Dict], model: Optional[str] = None):
+        """
+        Settles the failed segment as a 502 under `<request_id>-s<n>` and
+        continues the request on another provider, counted and priced as
+        `model` from here on. The final segment keeps the plain request_id.
+        """
+        prompt_tokens = count_tokens_from_messages(self.model, self.messages)
+        completion_tokens = self._completion_tokens()
+
+        cost_usd = self._settle(f"{self.request_id}-s{self.segment}", 502, prompt_tokens, completion_tokens)
+        self.breaker.record_failure()
+
+        self.segment += 1
+        self.provider_name = provider_name
+        self.model = model or self.model
+        self.messages = messages
+        self.output_chunks = []
+        self.output_chars = 0
+        self.counted_tokens = 0
+        self.usage = None
+        self.start_time = datetime.now(timezone.utc)
+
+        return prompt_tokens, completion_tokens, cost_usd
+
+    def _tokens(self):
+        if self.usage:
+            return int(self.usage.get("prompt_tokens") or 0), int(self.usage.get("completion_tokens") or 0)
+
+        # REAL TOKEN COUNTING (no more char hacks)
+        return count_tokens_from_messages(self.model, self.messages), self._completion_tokens()
+
+    def finalize_success(self):
+        if self.settled:
+            return 0, 0, 0.0
+        self.settled = True
+
+        prompt_tokens, completion_tokens = self._tokens()
+        cost_usd = self._settle(self.request_id, 200, prompt_tokens, completion_tokens)
+
         self.breaker.record_success()
 
-    def finalize_failure(self):
-        end_time = datetime.now(timezone.utc)
-        latency_ms = (end_time - self.start_time).total_seconds() * 1000
+        return prompt_tokens, completion_tokens, cost_usd
+
+    def finalize_failure(self, status_code: int = 502):
+        """
+        Settles a stream that ended early (502, or 499 when the client hung
+        up): the prompt and whatever output was produced are billed like a
+        failed resume segment.
+        """
+        if self.settled:
+            return 0, 0, 0.0
+        self.settled = True
+
+        prompt_tokens, completion_tokens = self._tokens()
+        cost_usd = self._settle(self.request_id, status_code, prompt_tokens, completion_tokens)
+
+        # A client hanging up says nothing about upstream health
+        if status_code != 499:
+            self.breaker.record_failure()
+
+        return prompt_tokens, completion_tokens, cost_usd
+
+    def finalize_unavailable(self, status_code: int = 503):
+        """No provider opened a stream: nothing was produced, so nothing is billed."""
+        if self.settled:
+            return
+        self.settled = True
+
+        latency_ms = (datetime.now(timezone.utc) - self.start_time).total_seconds() * 1000
 
         record_request(
             request_id=self.request_id,
             timestamp=self.start_time.isoformat(),
             provider=self.provider_name,
             model=self.model,
-            status_code=502,
+            status_code=status_code,
             latency_ms=int(latency_ms),
             tokens_input=None,
             tokens_output=None,
             cost_usd=None,
+            client_key_hash=self.client_key_hash,
+            stream=True,
         )
-
-        self.breaker.record_failure()
\ No newline at end of file
+        self.breaker.record_failure()
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import anyio
+from starlette.responses import StreamingResponse
+
+from circuit.observability.metrics import metrics
+from circuit.reliability.backpressure import StreamBudget, StreamBuffer
+from circuit.providers.base import ChatProvider, ProviderStreamError
+from circuit.serialization import dumps
+from circuit.stream_settlement import StreamSession
+
+
+logger = logging.getLogger("circuit.gateway")
+
+
+def sse_event(data: Dict[str, Any]) -> bytes:
+    return b"data: " + dumps(data) + b"\n\n"
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    SSE response that always closes its body iterator, so a stream the
+    client abandoned is settled right away rather than whenever the
+    generator gets garbage collected.
+    """
+
+    media_type = "text/event-stream"
+
+    async def stream_response(self, send) -> None:
+        try:
+            await super().stream_response(send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+
+
+async def open_stream(
+    providers: List[ChatProvider],
+    payload: Dict[str, Any],
+) -> Tuple[Optional[ChatProvider], Optional[AsyncIterator], Optional[Dict], Optional[ProviderStreamError]]:
+    """
+    Starts the stream on the first provider that produces a chunk.
+    Failing before the first chunk is cheap to retry elsewhere; nothing has
+    been sent to the client yet, so a proper HTTP error is still possible.
+    """
+    error = None
+
+    for provider in providers:
+        stream = provider.chat_completions_stream(payload)
+        try:
+            first = await stream.__anext__()
+            return provider, stream, first, None
+        except ProviderStreamError as e:
+            logger.warning("stream open failed on %s: %r", type(provider).__name__, e)
+            error = e
+        except StopAsyncIteration:
+            error = ProviderStreamError("empty_stream", "Upstream returned an empty stream")
+
+    return None, None, None, error
+
+
+CONTINUE_PROMPT = (
+    "Continue your previous reply exactly where it stopped. "
+    "Do not repeat any text that was already written."
+)
+
+
+def continuation_payload(payload: Dict[str, Any], partial: str) -> Dict[str, Any]:
+    """The original request plus the partial assistant output, asking for the rest."""
+    messages = list(payload.get("messages") or [])
+    if partial:
+        messages.append({"role": "assistant", "content": partial})
+        messages.append({"role": "user", "content": CONTINUE_PROMPT})
+    return {**payload, "messages": messages}
+
+
+def _segment_metrics(client_key_hash: str, prompt_tokens: int, completion_tokens: int, cost_usd: float):
+    metrics.inc("total_tokens_input", prompt_tokens, client=client_key_hash)
+    metrics.inc("total_tokens_output", completion_tokens, client=client_key_hash)
+    metrics.inc("total_cost_usd", cost_usd, client=client_key_hash)
+
+
+async def relay_stream(
+    stream: AsyncIterator[Dict[str, Any]],
+    first: Dict[str, Any],
+    session: StreamSession,
+    include_usage: bool,
+    resume_providers: Sequence[ChatProvider] = (),
+    payload: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Forwards upstream chunks as SSE while settling tokens/cost on the session.
+    The upstream usage chunk is only forwarded if the client asked for it.
+
+    If the upstream fails mid-stream and `resume_providers` is non-empty, the
+    request continues on the next provider from the partial output, on the
+    same client connection.
+    """
+    stream_id = first.get("id")
+    resumed = False
+
+    def process(chunk: Dict[str, Any]) -> Optional[bytes]:
+        usage = chunk.get("usage")
+        if usage:
+            session.record_usage(usage)
+
+        choices = chunk.get("choices") or []
+        for choice in choices:
+            session.record_chunk((choice.get("delta") or {}).get("content") or "")
+
+        if usage and not choices and not include_usage:
+            return None
+
+        if resumed:
+            # The client already has the role delta; keep one stream id
+            if choices and all(c.get("delta") == {"role": "assistant"} for c in choices):
+                return None
+            chunk["id"] = stream_id
+
+        return sse_event(chunk)
+
+    remaining = list(resume_providers)
+
+    try:
+        while True:
+            try:
+                event = process(first)
+                if event:
+                    yield event
+
+                async for chunk in stream:
+                    event = process(chunk)
+                    if event:
+                        yield event
+                break
+
+            except ProviderStreamError as e:
+                logger.warning("stream failed: %r", e)
+                await stream.aclose()
+
+                next_provider = next_stream = None
+                if remaining:
+                    cont = continuation_payload(payload or {}, session.partial_output())
+                    next_provider, next_stream, first, _ = await open_stream(remaining, cont)
+
+                if next_stream is None:
+                    _segment_metrics(session.client_key_hash, *session.finalize_failure())
+                    metrics.inc("total_502", client=session.client_key_hash)
+                    yield sse_event({"error": {"code": e.code, "message": e.message}})
+                    return
+
+                segment = session.start_segment(
+                    type(next_provider).__name__,
+                    cont["messages"],
+                    next_provider.model or cont.get("model"),
+                )
+                _segment_metrics(session.client_key_hash, *segment)
+                metrics.inc("stream_resumes", client=session.client_key_hash)
+
+                remaining = remaining[remaining.index(next_provider) + 1:]
+                stream = next_stream
+                resumed = True
+
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client went away: settle what we have and close the upstream.
+        # Hanging up on the error event of a failed stream is no new settlement
+        if not session.settled:
+            _segment_metrics(session.client_key_hash, *session.finalize_failure(status_code=499))
+            metrics.inc("client_disconnects", client=session.client_key_hash)
+        raise
+
+    finally:
+        await stream.aclose()
+
+    prompt_tokens, completion_tokens, cost_usd = session.finalize_success()
+
+    metrics.inc("total_success", client=session.client_key_hash)
+    _segment_metrics(session.client_key_hash, prompt_tokens, completion_tokens, cost_usd)
+
+    yield b"data: [DONE]\n\n"
+
+
+async def buffered(
+    events: AsyncIterator[bytes],
+    max_bytes: int,
+    budget: StreamBudget,
+) -> AsyncIterator[bytes]:
+    """
+    Reads `events` ahead in a background task into a bounded StreamBuffer.
+    The upstream keeps streaming while the client catches up, but once
+    `max_bytes` are waiting the reader stops pulling until the client drains.
+    Closing this generator closes `events` (settling the stream as 499).
+    """
+    buffer = StreamBuffer(max_bytes, budget)
+
+    async def pump():
+        try:
+            async for event in events:
+                await buffer.put(event)
+        finally:
+            buffer.close()
+            # Cancelled while waiting for room: `events` is still suspended
+            await events.aclose()
+
+    task = asyncio.create_task(pump())
+    try:
+        while (data := await buffer.get()) is not None:
+            yield data
+        # Surfaces anything the reader raised
+        await task
+
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.wait([task])
+        buffer.discard()
+        metrics.observe_stream_buffer(buffer.peak)
@@ -1,34 +1,37 @@
 from __future__ import annotations
 
-import tiktoken
-from functools import lru_cache
+from typing import Iterable
 
+from circuit.observability.tracing import traced
+from circuit.tokenizer_registry import tokenizer_for_model
 
-@lru_cache(maxsize=8)
-def _get_encoding(model: str):
-   
-    try:
-        return tiktoken.encoding_for_model(model)
-    except KeyError:
-        return tiktoken.get_encoding("cl100k_base")
 
+# tiktoken is imported on first use rather than with this module: the
+# startup hook loads the configured tokenizers before the app reports ready,
+# and nothing else at import time needs it
 
+
+def warm_encodings(models: Iterable[str]) -> None:
+    for model in models:
+        tokenizer_for_model(model).count("warmup")
+
+
+@traced("tokenize")
 def count_tokens_from_messages(model: str, messages: list[dict]) -> int:
-    encoding = _get_encoding(model)
+    tokenizer = tokenizer_for_model(model)
 
     tokens = 0
 
     for message in messages:
         tokens += 4  # role + formatting overhead
         for key, value in message.items():
-            tokens += len(encoding.encode(str(value)))
+            tokens += tokenizer.count(str(value))
 
     tokens += 2  # assistant priming
 
     return tokens
 
 
+@traced("tokenize")
 def count_tokens_from_text(model: str, text: str) -> int:
-    encoding = _get_encoding(model)
-    return len(encoding.encode(text))
-
+    return tokenizer_for_model(model).count(text)
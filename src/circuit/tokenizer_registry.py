@@ -0,0 +1,269 @@
+"""
+Model family -> tokenizer, loaded from a local directory.
+
+Vocabularies live in CIRCUIT_TOKENIZER_DIR:
+
+    cl100k_base.tiktoken, o200k_base.tiktoken   OpenAI encodings
+    llama3.tiktoken                             Llama 3.x (Meta's tokenizer.model is this format)
+    <family>/tokenizer.json                     Hugging Face tokenizers (mistral, qwen2, ...)
+
+Fill it once on a machine with network access:
+
+    python -m circuit.tokenizer_registry bundle --dir data/tokenizers
+
+which fetches the OpenAI encodings; the other families are copied in from
+their model repositories. Vocabularies are per process: every worker
+parses the files it needs and holds its own rank tables, so memory grows
+with the number of workers times the families in use.
+
+A model with no matching family, or whose family's file is missing, is
+counted with cl100k_base and logged once as approximate. If that is
+missing too, tokens are estimated at 4 bytes each. With
+CIRCUIT_TOKENIZER_OFFLINE nothing is ever downloaded; otherwise a missing
+OpenAI encoding falls back to tiktoken's own download and cache.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import logging
+import re
+import sys
+import urllib.request
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from circuit.config import settings
+from circuit.observability.metrics import metrics
+
+logger = logging.getLogger("circuit.tokenizer")
+
+FALLBACK_ENCODING = "cl100k_base"
+
+_CL100K_PAT = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s"""
+
+_O200K_PAT = "|".join(
+    [
+        r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+        r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+        r"""\p{N}{1,3}""",
+        r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+        r"""\s*[\r\n]+""",
+        r"""\s+(?!\S)""",
+        r"""\s+""",
+    ]
+)
+
+_LLAMA3_PAT = r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+"""
+
+
+@dataclass(frozen=True)
+class TokenizerSpec:
+    name: str
+    # "tiktoken": <name>.tiktoken BPE ranks; "hf": <name>/tokenizer.json
+    kind: str = "tiktoken"
+    pat_str: str = ""
+    special_tokens: Dict[str, int] = field(default_factory=dict)
+    # Where `bundle` fetches it from, with its sha256
+    url: str = ""
+    sha256: str = ""
+
+
+TOKENIZERS: Dict[str, TokenizerSpec] = {
+    "cl100k_base": TokenizerSpec(
+        "cl100k_base",
+        pat_str=_CL100K_PAT,
+        special_tokens={
+            "<|endoftext|>": 100257,
+            "<|fim_prefix|>": 100258,
+            "<|fim_middle|>": 100259,
+            "<|fim_suffix|>": 100260,
+            "<|endofprompt|>": 100276,
+        },
+        url="https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+        sha256="223921b76ee99bde995b7ff738513eef100fb51d18c93597a113bcffe865b2a7",
+    ),
+    "o200k_base": TokenizerSpec(
+        "o200k_base",
+        pat_str=_O200K_PAT,
+        special_tokens={"<|endoftext|>": 199999, "<|endofprompt|>": 200018},
+        url="https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken",
+        sha256="446a9538cb6c348e3516120d7c08b09f57c36495e2acfffe59a5bf8b0cfb1a2d",
+    ),
+    "llama3": TokenizerSpec(
+        "llama3",
+        pat_str=_LLAMA3_PAT,
+        special_tokens={"<|begin_of_text|>": 128000, "<|end_of_text|>": 128001},
+    ),
+    "llama2": TokenizerSpec("llama2", kind="hf"),
+    "mistral": TokenizerSpec("mistral", kind="hf"),
+    "qwen2": TokenizerSpec("qwen2", kind="hf"),
+    "gemma": TokenizerSpec("gemma", kind="hf"),
+    "phi3": TokenizerSpec("phi3", kind="hf"),
+    "deepseek": TokenizerSpec("deepseek", kind="hf"),
+}
+
+# First match wins; model names are lowercased and an Ollama tag
+# (":8b") is ignored. OpenAI models are resolved by tiktoken's own table.
+FAMILIES: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"^(meta-llama/)?(llama-?3|llama3)"), "llama3"),
+    (re.compile(r"^(meta-llama/)?(llama-?2|llama2|codellama)"), "llama2"),
+    (re.compile(r"^(mistralai/)?(mistral|mixtral|codestral)"), "mistral"),
+    (re.compile(r"^(qwen/)?(qwen|qwq)"), "qwen2"),
+    (re.compile(r"^(google/)?gemma"), "gemma"),
+    (re.compile(r"^(microsoft/)?phi"), "phi3"),
+    (re.compile(r"^(deepseek-ai/)?deepseek"), "deepseek"),
+]
+
+
+class Tokenizer:
+    """What the gateway needs from an encoding: a token count."""
+
+    def __init__(self, name: str, encode, approximate: bool = False) -> None:
+        self.name = name
+        self.approximate = approximate
+        self._encode = encode
+
+    def count(self, text: str) -> int:
+        return len(self._encode(text))
+
+
+def _approximate(text: str) -> List[int]:
+    return [0] * ((len(text.encode()) + 3) // 4)
+
+
+def tokenizer_name_for_model(model: str) -> Optional[str]:
+    from tiktoken.model import encoding_name_for_model
+
+    try:
+        return encoding_name_for_model(model)
+    except KeyError:
+        pass
+
+    base = model.lower().split(":", 1)[0]
+    for pattern, name in FAMILIES:
+        if pattern.match(base):
+            return name
+    return None
+
+
+def _read_ranks(path: Path) -> Dict[bytes, int]:
+    ranks = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                token, rank = line.split()
+                ranks[base64.b64decode(token)] = int(rank)
+    return ranks
+
+
+def _load_tiktoken(spec: TokenizerSpec, directory: Path, offline: bool) -> Tokenizer:
+    import tiktoken
+
+    path = directory / f"{spec.name}.tiktoken"
+    if path.exists():
+        encoding = tiktoken.Encoding(
+            name=spec.name,
+            pat_str=spec.pat_str,
+            mergeable_ranks=_read_ranks(path),
+            special_tokens=spec.special_tokens,
+        )
+    elif not offline and spec.url:
+        encoding = tiktoken.get_encoding(spec.name)
+    else:
+        raise FileNotFoundError(f"{path} not found")
+
+    return Tokenizer(spec.name, encoding.encode_ordinary)
+
+
+def _load_hf(spec: TokenizerSpec, directory: Path) -> Tokenizer:
+    path = directory / spec.name / "tokenizer.json"
+    if not path.exists():
+        raise FileNotFoundError(f"{path} not found")
+
+    # Only needed for Hugging Face families
+    from tokenizers import Tokenizer as HFTokenizer
+
+    tokenizer = HFTokenizer.from_file(str(path))
+    return Tokenizer(spec.name, lambda text: tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer(name: str) -> Tokenizer:
+    spec = TOKENIZERS[name]
+    directory = Path(settings.CIRCUIT_TOKENIZER_DIR)
+
+    if spec.kind == "hf":
+        return _load_hf(spec, directory)
+    return _load_tiktoken(spec, directory, settings.CIRCUIT_TOKENIZER_OFFLINE)
+
+
+@lru_cache(maxsize=1024)
+def tokenizer_for_model(model: str) -> Tokenizer:
+    # Many model names share a handful of tokenizers; load_tokenizer caches
+    # per tokenizer so a new model name never reloads a vocabulary
+    name = tokenizer_name_for_model(model)
+
+    if name is not None:
+        try:
+            return load_tokenizer(name)
+        except Exception as e:
+            logger.warning("tokenizer %s for %s unavailable (%r), counting approximately", name, model, e)
+    else:
+        logger.warning("no tokenizer known for %s, counting with %s", model, FALLBACK_ENCODING)
+
+    metrics.inc("tokenizer_fallbacks")
+    try:
+        fallback = load_tokenizer(FALLBACK_ENCODING)
+        return Tokenizer(fallback.name, fallback._encode, approximate=True)
+    except Exception as e:
+        logger.warning("%s unavailable (%r), estimating 4 bytes per token", FALLBACK_ENCODING, e)
+        return Tokenizer("bytes/4", _approximate, approximate=True)
+
+
+def bundle(directory: Path, names: List[str]) -> None:
+    """Downloads the OpenAI encodings into `directory` for offline use."""
+    directory.mkdir(parents=True, exist_ok=True)
+
+    for name in names:
+        spec = TOKENIZERS[name]
+        if not spec.url:
+            print(f"{name}: no download, copy it into {directory} by hand", file=sys.stderr)
+            continue
+
+        with urllib.request.urlopen(spec.url, timeout=60) as response:
+            data = response.read()
+        if hashlib.sha256(data).hexdigest() != spec.sha256:
+            raise ValueError(f"{name}: sha256 mismatch for {spec.url}")
+
+        (directory / f"{name}.tiktoken").write_bytes(data)
+        print(f"{name}: {len(data)} bytes")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m circuit.tokenizer_registry")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    bundle_cmd = sub.add_parser("bundle", help="fetch vocabularies for offline use")
+    bundle_cmd.add_argument("--dir", default=settings.CIRCUIT_TOKENIZER_DIR)
+    bundle_cmd.add_argument("names", nargs="*", default=["cl100k_base", "o200k_base"])
+
+    sub.add_parser("list", help="show which tokenizers are available locally")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "bundle":
+        bundle(Path(args.dir), args.names)
+    else:
+        directory = Path(settings.CIRCUIT_TOKENIZER_DIR)
+        for name, spec in TOKENIZERS.items():
+            path = directory / (f"{name}/tokenizer.json" if spec.kind == "hf" else f"{name}.tiktoken")
+            print(f"{name:12} {spec.kind:9} {'ok' if path.exists() else 'missing'}  {path}")
+
+
+if __name__ == "__main__":
+    main()